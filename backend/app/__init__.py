@@ -4,10 +4,15 @@ import os
 import uvicorn
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response
 from contextlib import asynccontextmanager
-from app.database import create_db_and_tables
+from app.database import async_engine, create_db_and_tables, engine
 from app.routers import location, user, entry, ai, mood, health
 from app.config import settings
+from app.services.location_resolver import warm_location_resolver
+from app.services.password_service import password_hasher
+from app.services.mood_queue import mood_analysis_queue
+from app.services.metrics import CONTENT_TYPE, MetricsMiddleware, instrument_engine, render_metrics
 
 # 定义生命周期管理器
 @asynccontextmanager
@@ -15,8 +20,14 @@ async def lifespan(app: FastAPI):
     # 启动时执行：创建数据库表
     print("Application startup: creating database and tables if they don't exist...")
     create_db_and_tables()
+    # 载入位置网格索引，之后新建的位置会增量加入
+    warm_location_resolver(engine)
+    # 启动心情分析队列，并恢复上次未完成的分析
+    await mood_analysis_queue.start()
     yield
     # 关闭时执行（如果需要清理资源写在这里）
+    await mood_analysis_queue.stop()
+    password_hasher.shutdown()
     print("Application shutdown.")
 
 # 在初始化时传入 lifespan
@@ -38,6 +49,12 @@ app.add_middleware(
     expose_headers=["*"]
 )
 
+# 请求指标：最后添加的中间件在最外层，耗时包含 CORS 等其他中间件
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+    instrument_engine(engine, "sync")
+    instrument_engine(async_engine.sync_engine, "async")
+
 # 注册路由
 app.include_router(entry.router, prefix="/api", tags=["entries"])
 app.include_router(user.router, prefix="/api", tags=["users"])
@@ -50,6 +67,14 @@ app.include_router(health.router, prefix="/api", tags=["health"])
 def read_root():
     return {"message": f"Hello, Travel Tracker Backend! Environment: {settings.ENVIRONMENT}"}
 
+def metrics():
+    """Prometheus 文本格式的指标：每个路由的延迟与响应大小、连接池、缓存命中率"""
+    return Response(render_metrics(), media_type=CONTENT_TYPE)
+
+if settings.METRICS_ENABLED:
+    app.add_api_route("/metrics", metrics, methods=["GET"], include_in_schema=False)
+    app.include_router(health.monitoring_router, prefix="/api")
+
 # --- 本地开发启动入口 ---
 # 这个代码块仅用于本地开发时的便捷启动，例如在 VS Code 中直接按 F5 运行。
 # 在生产环境中，这个块不会被执行。Render/Gunicorn 会直接通过 uvicorn worker 导入上面的 `app` 对象。
@@ -1,5 +1,5 @@
 from pathlib import Path
-from typing import List
+from typing import List, Optional
 from pydantic_settings import BaseSettings
 from pydantic import Field
 
@@ -30,8 +30,68 @@ class Settings(BaseSettings):
       if origin.strip()
     ]
 
+  # --- 缓存配置 ---
+  # memory: 进程内 LRU；redis: 兼容 Redis 协议的服务（多进程部署时共享缓存）；sqlite: 本地文件（重启后仍然有效）
+  CACHE_BACKEND: str = "memory"
+  CACHE_REDIS_URL: str = ""
+  # sqlite 后端的数据库文件
+  CACHE_SQLITE_PATH: str = str(Path(__file__).parent.parent / ".cache" / "cache.sqlite3")
+  STATS_CACHE_MAX_ENTRIES: int = 10000
+  # 已验证令牌缓存：命中时跳过 JWT 校验和用户查询
+  TOKEN_CACHE_TTL_SECONDS: int = 300
+  TOKEN_CACHE_MAX_ENTRIES: int = 10000
+  # AI 生成结果缓存：相同的系统指令 + 模型 + 提示词直接返回缓存结果
+  AI_CACHE_BACKEND: str = "sqlite"
+  AI_CACHE_TTL_HOURS: int = 24 * 7
+  AI_CACHE_MAX_ENTRIES: int = 5000
+
+  # --- AI 服务提供方 ---
+  # gemini: Google Gemini；local: 本地模拟（不访问网络，用于压测和基准测试）
+  AI_PROVIDER: str = "gemini"
+  AI_LOCAL_LATENCY_MS: float = 800.0  # 模拟延迟的中位数
+  AI_LOCAL_LATENCY_SIGMA: float = 0.5  # 延迟服从对数正态分布，sigma 越大长尾越明显，0 表示固定延迟
+  AI_LOCAL_ERROR_RATE: float = 0.0  # 注入普通错误的概率
+  AI_LOCAL_QUOTA_ERROR_RATE: float = 0.0  # 注入配额耗尽错误的概率
+  AI_LOCAL_EXHAUSTED_MODELS: str = ""  # 逗号分隔，这些模型总是返回配额耗尽
+  AI_LOCAL_SEED: Optional[int] = None  # 设置后延迟和错误注入的序列可复现
+
+  # --- AI 模型熔断 ---
+  AI_BREAKER_FAILURE_THRESHOLD: int = 3  # 连续失败多少次后熔断
+  AI_BREAKER_COOLDOWN_SECONDS: float = 30.0
+  AI_QUOTA_COOLDOWN_SECONDS: float = 60.0  # 配额耗尽时立即熔断的冷却时间
+  AI_BREAKER_MAX_COOLDOWN_SECONDS: float = 900.0
+  # 每个模型的并发上限（<= 0 表示不限制）、排队上限和最长排队时间
+  AI_MAX_CONCURRENCY_PER_MODEL: int = 4
+  AI_MAX_WAITING_PER_MODEL: int = 16
+  AI_QUEUE_TIMEOUT_SECONDS: float = 10.0
+
+  # --- AI 对话上下文 ---
+  CHAT_CONTEXT_TOKEN_BUDGET: int = 2000  # 每次请求携带的历史消息（不含摘要和新消息）的估算 token 上限
+  CHAT_MESSAGE_MAX_TOKENS: int = 600  # 单条历史消息超过该长度时截断
+  CHAT_SUMMARY_MAX_TOKENS: int = 400  # 滚动摘要的长度上限
+  CONVERSATION_TTL_HOURS: int = 24
+  CONVERSATION_MAX_ENTRIES: int = 10000
+
+  # --- 密码哈希 ---
+  # bcrypt 在独立的有界工作池中执行；pool 为 thread 或 process
+  BCRYPT_ROUNDS: int = 12
+  PASSWORD_HASH_POOL: str = "thread"
+  PASSWORD_HASH_WORKERS: int = 2
+  PASSWORD_HASH_MAX_QUEUE: int = 64
+
+  # --- 心情分析后台队列 ---
+  MOOD_ANALYSIS_WORKERS: int = 2
+  MOOD_ANALYSIS_MAX_ATTEMPTS: int = 3
+  MOOD_ANALYSIS_RETRY_BASE_SECONDS: float = 2.0
+  # processing 状态超过该时长视为处理进程已退出，启动时重新入队
+  MOOD_ANALYSIS_CLAIM_TIMEOUT_SECONDS: float = 300.0
+
+  # --- 监控 ---
+  # GET /metrics 以 Prometheus 文本格式输出请求、连接池和缓存指标
+  METRICS_ENABLED: bool = True
+
   # --- 第三方服务 ---
-  GOOGLE_API_KEY: str
+  GOOGLE_API_KEY: str = ""  # AI_PROVIDER=gemini 时需要
 
   class Config:
     env_file = Path(__file__).parent.parent / ".env"
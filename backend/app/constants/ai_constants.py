@@ -96,6 +96,14 @@ MOOD_ANALYSIS_SYSTEM_INSTRUCTION = """
 }
 """
 
+CONVERSATION_SUMMARY_SYSTEM_INSTRUCTION = """
+You maintain a running summary of a conversation between a traveller and the travel assistant "Bee".
+You receive the previous summary (possibly empty) and the next turns that are being moved out of the context window.
+Return ONLY the updated summary as plain text, in the same language the traveller uses.
+Keep every fact that matters for future answers: destinations, dates, budget, companions, preferences, decisions and open questions.
+Drop greetings and small talk. Stay under {max_words} words.
+"""
+
 # 从单个默认模型改为模型降级列表
 AI_MODEL_FALLBACK_LIST = [
   "gemini-3-flash-preview", # 优先使用最新的 Flash 模型
@@ -1,7 +1,10 @@
 # backend/app/database.py
 import logging
 from sqlmodel import create_engine, Session, SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
 from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
 import time
 from .config import settings
 
@@ -24,6 +27,40 @@ engine = create_engine(
   echo_pool=True,  # 打印连接池日志
 )
 
+
+def to_async_url(url: str) -> str:
+  """
+  把同步驱动的连接串转换为对应的异步驱动
+
+  - postgres:// / postgresql:// / postgresql+psycopg2:// -> postgresql+asyncpg://
+    （asyncpg 不认识 sslmode 参数，转换为等价的 ssl 参数）
+  - sqlite:// -> sqlite+aiosqlite://
+  """
+  if url.startswith("postgres://"):
+    url = "postgresql://" + url[len("postgres://"):]
+  parsed = make_url(url)
+  backend = parsed.get_backend_name()
+  if backend == "postgresql":
+    query = dict(parsed.query)
+    if "sslmode" in query:
+      query["ssl"] = query.pop("sslmode")
+    return parsed.set(drivername="postgresql+asyncpg", query=query).render_as_string(hide_password=False)
+  if backend == "sqlite":
+    return parsed.set(drivername="sqlite+aiosqlite").render_as_string(hide_password=False)
+  return url
+
+
+# 异步引擎：路由中的数据库 I/O 通过它执行，不阻塞事件循环
+async_engine = create_async_engine(
+  to_async_url(DATABASE_URL),
+  echo=True,
+  pool_size=5,
+  max_overflow=10,
+  pool_timeout=30,
+  pool_recycle=3600,
+  pool_pre_ping=True,
+)
+
 def create_indexes():
   """
   创建性能优化的索引
@@ -108,6 +145,27 @@ def create_indexes():
       except Exception as e:
         logger.warning(f"创建 idx_entries_created_time 索引失败: {str(e)}")
 
+      # 三元组 GIN 索引：让关键词搜索的 ILIKE '%kw%' 可以走索引（见 services/search_service.py）
+      # 使用 SAVEPOINT，避免没有扩展权限时整个事务被中止
+      try:
+        with conn.begin_nested():
+          conn.exec_driver_sql("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+          conn.exec_driver_sql(
+            """
+            CREATE INDEX IF NOT EXISTS idx_entries_title_trgm
+            ON entry USING GIN (title gin_trgm_ops)
+            """
+          )
+          conn.exec_driver_sql(
+            """
+            CREATE INDEX IF NOT EXISTS idx_entries_content_trgm
+            ON entry USING GIN (content gin_trgm_ops)
+            """
+          )
+        logger.debug("创建索引: idx_entries_title_trgm, idx_entries_content_trgm")
+      except Exception as e:
+        logger.warning(f"创建全文搜索三元组索引失败: {str(e)}")
+
       # ===== 2. Location 表索引 =====
 
       # 检查 location 表是否存在
@@ -319,6 +377,22 @@ def create_db_and_tables():
     # 创建索引
     create_indexes()
 
+    # SQLite 全文索引（PostgreSQL 的三元组索引已在 create_indexes 中创建）
+    from app.services.search_service import ensure_search_index
+    ensure_search_index(engine)
+
+    # location 表的 lat / lng 索引列（旧库补列并回填）
+    from app.services.location_service import ensure_location_columns
+    ensure_location_columns(engine)
+
+    # photo 表的 position 列（旧库补列）
+    from app.services.photo_service import ensure_photo_columns
+    ensure_photo_columns(engine)
+
+    # mood 表的后台分析状态列（旧库补列）
+    from app.services.mood_queue import ensure_mood_columns
+    ensure_mood_columns(engine)
+
     # 检查索引状态
     check_existing_indexes()
 
@@ -340,6 +414,18 @@ def get_session():
     yield session
 
 
+async def get_async_session():
+  """
+  依赖注入函数：每次 API 调用时创建一个新的 AsyncSession
+
+  - expire_on_commit=False：提交后仍可直接读取对象属性用于序列化响应，不会触发隐式的同步加载
+  - 仍是同步实现的服务函数（统计、搜索、位置等）通过 `await session.run_sync(func, ...)` 调用，
+    其中的数据库 I/O 同样经由异步驱动完成
+  """
+  async with AsyncSession(async_engine, expire_on_commit=False) as session:
+    yield session
+
+
 def test_database_connection():
   """
   测试数据库连接
@@ -358,6 +444,22 @@ def test_database_connection():
     return False
 
 
+async def test_async_database_connection():
+  """
+  通过异步引擎测试数据库连接（供 async 路由使用，不阻塞事件循环）
+
+  Returns:
+      bool: 连接是否成功
+  """
+  try:
+    async with async_engine.connect() as conn:
+      await conn.execute(text("SELECT 1"))
+      return True
+  except Exception as e:
+    logger.error(f"数据库连接测试失败: {str(e)}")
+    return False
+
+
 def get_database_stats():
   """
   获取数据库统计信息（用于监控）
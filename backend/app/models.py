@@ -3,7 +3,7 @@ from sqlmodel import Field, SQLModel, Relationship
 from typing import Optional, List, Dict, Any
 from datetime import date, datetime
 from pydantic import BaseModel, field_validator, ConfigDict
-from sqlalchemy import Column, DateTime, JSON, Text
+from sqlalchemy import Column, DateTime, Index, JSON, Text
 from sqlalchemy.sql import func
 
 # ==================== 用户相关模型 ====================
@@ -40,7 +40,13 @@ class LocationBase(SQLModel):
     region: Optional[str] = None
 
 class Location(LocationBase, table=True):
+    # (lat, lng) 复合索引，用于按坐标范围查找附近的已有位置（见 services/location_service.py）
+    __table_args__ = (Index("idx_location_lat_lng", "lat", "lng"),)
+
     id: Optional[int] = Field(default=None, primary_key=True)
+    # 从 coordinates 同步出来的数值列，写入时自动维护
+    lat: Optional[float] = None
+    lng: Optional[float] = None
     entries: List["Entry"] = Relationship(back_populates="location")
 
 class LocationCreate(LocationBase):
@@ -71,6 +77,8 @@ class PhotoBase(SQLModel):
 class Photo(PhotoBase, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     entry_id: int = Field(foreign_key="entry.id")
+    # 照片在日记中的顺序（从 0 开始）
+    position: int = Field(default=0)
     entry: "Entry" = Relationship(back_populates="photos")
 
 class PhotoCreate(SQLModel):
@@ -137,7 +145,8 @@ class Entry(EntryBase, table=True):
         back_populates="entry",
         sa_relationship_kwargs={
             "cascade": "all, delete-orphan",
-            "lazy": "selectin"
+            "lazy": "selectin",
+            "order_by": "[Photo.position, Photo.id]"
         }
     )
     location: Optional["Location"] = Relationship(back_populates="entries")
@@ -158,6 +167,13 @@ class EntryUpdate(BaseModel):
     location_id: Optional[int] = None
     photos: Optional[List[PhotoCreate]] = None
 
+class PhotoSyncSummary(SQLModel):
+    """更新日记时照片同步的结果"""
+    added: int
+    updated: int
+    removed: int
+    unchanged: int
+
 class EntryDetailResponse(SQLModel):
     id: int
     title: str
@@ -172,6 +188,8 @@ class EntryDetailResponse(SQLModel):
     user_id: int
     location_id: Optional[int]
     photos: List[PhotoDetail]
+    # 仅在更新日记且提供了 photos 时返回
+    photo_sync: Optional[PhotoSyncSummary] = None
     model_config = {"from_attributes": True}
 
 class DiaryListItem(SQLModel):
@@ -190,15 +208,59 @@ class DiaryListItem(SQLModel):
 
 class DiaryListResponse(SQLModel):
     items: List[DiaryListItem]
-    total: int
+    # 游标分页且 include_total=false 时不返回总数，此时 total / total_pages 为 None
+    total: Optional[int]
     page: int
     page_size: int
-    total_pages: int
+    total_pages: Optional[int]
     diary_total: int
     guide_total: int
     place_total: int
     keyword: Optional[str] = None
     entry_type: Optional[str] = None
+    # 游标分页：下一页的不透明游标，没有更多数据时为 None
+    next_cursor: Optional[str] = None
+    has_more: Optional[bool] = None
+
+class BulkImportError(SQLModel):
+    index: int
+    error: str
+
+class BulkImportResponse(SQLModel):
+    created: int
+    failed: int
+    # 成功导入的日记ID，按输入顺序排列
+    ids: List[int]
+    errors: List[BulkImportError]
+
+# ==================== 用户统计计数器 ====================
+class UserStats(SQLModel, table=True):
+    """按用户增量维护的统计计数器，在日记增删改的同一事务中更新"""
+    __tablename__ = "user_stats"
+    user_id: int = Field(foreign_key="user.id", primary_key=True)
+    diary_total: int = Field(default=0)
+    guide_total: int = Field(default=0)
+    place_total: int = Field(default=0)
+    total_entries: int = Field(default=0)
+    # 数据版本号：该用户的日记每次变更都会递增，用于生成 ETag
+    data_version: int = Field(default=0)
+    updated_at: datetime = Field(default_factory=datetime.now)
+
+class UserPlaceCount(SQLModel, table=True):
+    """visited 日记按地点名的引用计数，用于维护 place_total（不重复地点数）"""
+    __tablename__ = "user_place_count"
+    user_id: int = Field(foreign_key="user.id", primary_key=True)
+    location_name: str = Field(primary_key=True)
+    ref_count: int = Field(default=0)
+
+# ==================== 已撤销的令牌 ====================
+class RevokedToken(SQLModel, table=True):
+    """登出时撤销的令牌，保存到令牌过期为止；所有 worker 共用，不会因容量被淘汰"""
+    __tablename__ = "revoked_token"
+    # 令牌的 SHA-256 摘要，不保存令牌原文
+    token_hash: str = Field(primary_key=True, max_length=64)
+    expires_at: datetime = Field(index=True)
+    revoked_at: datetime = Field(default_factory=datetime.now)
 
 class Token(BaseModel):
     access_token: str
@@ -223,6 +285,11 @@ class Mood(MoodBase, table=True):
     # AI 分析结果
     mood_vector: float = Field(default=0.5, description="0.0(消极) - 1.0(积极)")
     mood_reason: Optional[str] = None
+    # 后台分析状态: pending（排队中）/ processing（已被 worker 认领）/ done / failed
+    analysis_status: str = Field(default="pending", index=True)
+    analysis_attempts: int = Field(default=0)
+    # 被 worker 认领的时间，认领超时的 processing 记录在启动时重新入队
+    analysis_claimed_at: Optional[datetime] = None
 
     user: "User" = Relationship(
         back_populates="moods",
@@ -238,5 +305,6 @@ class MoodResponse(MoodBase):
     created_at: datetime
     mood_vector: float
     mood_reason: Optional[str]
+    analysis_status: str
 
     model_config = {"from_attributes": True}
@@ -1,55 +1,224 @@
 # backend/app/routers/ai.py
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from sqlmodel.ext.asyncio.session import AsyncSession
+from typing import List, Optional, Tuple
+import json
 import logging
-from app.services.ai_service import get_travel_advice, generate_diary_draft
+import secrets
+from app.config import settings
+from app.database import get_async_session
+from app.routers.user import get_current_user
+from app.services.ai_limits import AIOverloaded
+from app.services.ai_service import (
+  ai_provider, ai_single_flight, get_travel_advice, generate_diary_draft, model_registry, stream_travel_advice,
+  travel_advice_apology
+)
+from app.services.conversation_service import ConversationNotFound, conversation_manager
 
 # 获取 logger
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/ai", tags=["AI Assistant"])
 
+# 未登录用户的匿名会话标识，AI 对话ID绑定到它
+AI_SESSION_COOKIE = "ai_session"
+
 class Message(BaseModel):
   role: str
   content: str
 
 class ChatRequest(BaseModel):
-  messages: List[Message]
+  # 传入 conversation_id（必须是服务端之前返回的）时服务端使用保存的会话历史，只需发送最新一条消息；
+  # 新会话（或会话已过期）时，messages 中较早的消息用于初始化会话
+  messages: List[Message] = Field(min_length=1)
+  conversation_id: Optional[str] = Field(default=None, max_length=64)
+
+
+async def resolve_conversation_owner(request: Request, session: AsyncSession) -> Tuple[str, Optional[str]]:
+  """
+  确定会话的所有者：已登录时为用户，否则为匿名会话（ai_session cookie）
+
+  Returns:
+      (所有者标识, 需要写入 cookie 的新匿名会话ID；已有时为 None)
+  """
+  if request.cookies.get("access_token"):
+    try:
+      user = await get_current_user(request, session)
+      return f"user:{user['user_id']}", None
+    except HTTPException:
+      pass  # 令牌无效或已撤销时按匿名访问处理
+  anonymous_id = request.cookies.get(AI_SESSION_COOKIE)
+  if anonymous_id:
+    return f"anon:{anonymous_id}", None
+  anonymous_id = secrets.token_urlsafe(24)
+  return f"anon:{anonymous_id}", anonymous_id
+
+
+def set_ai_session_cookie(response: Response, anonymous_id: Optional[str]):
+  if anonymous_id:
+    response.set_cookie(
+      key=AI_SESSION_COOKIE,
+      value=anonymous_id,
+      httponly=True,
+      secure=settings.ENVIRONMENT == "production",
+      samesite="lax",
+      max_age=settings.CONVERSATION_TTL_HOURS * 60 * 60,
+      path="/",
+    )
+
+
+def prepare_conversation(chat_request: ChatRequest, owner: str):
+  """
+  返回 (会话ID, 会话状态, 最新的用户消息, 发送给模型的消息列表)
+
+  会话ID不是服务端为该所有者签发的时返回 404。
+  """
+  conversation_id = chat_request.conversation_id or conversation_manager.new_id(owner)
+  messages = [m.model_dump() for m in chat_request.messages]
+  try:
+    state = conversation_manager.load(conversation_id, owner, seed=messages[:-1])
+  except ConversationNotFound:
+    logger.warning("AI 聊天请求携带了未签发给当前用户的会话ID")
+    raise HTTPException(status_code=404, detail="Conversation not found")
+  new_message = messages[-1]
+  context = conversation_manager.build_messages(state, new_message)
+  logger.info(f"会话 {conversation_id}: 发送 {len(context)} 条消息（会话中保存 {len(state['messages'])} 条）")
+  return conversation_id, state, new_message, context
+
+
+def ai_busy_exception():
+  # AI 模型并发和排队都已满：快速失败，提示客户端稍后重试
+  return HTTPException(status_code=503, detail="AI service is busy, please retry shortly", headers={"Retry-After": "2"})
 
 @router.post("/chat")
-async def chat_with_ai(request: ChatRequest):
+async def chat_with_ai(
+    request: ChatRequest,
+    http_request: Request,
+    response: Response,
+    session: AsyncSession = Depends(get_async_session)
+):
   logger.info(f"收到 AI 聊天请求，消息条数: {len(request.messages)}")
+  owner, anonymous_id = await resolve_conversation_owner(http_request, session)
+  # 后面只等待模型生成，不再访问数据库：提前归还连接，不在生成期间占用连接池
+  await session.close()
+  # 上下文由会话管理器按 token 预算裁剪，较早的轮次以摘要形式发送
+  conversation_id, state, new_message, context = prepare_conversation(request, owner)
+  set_ai_session_cookie(response, anonymous_id)
 
   try:
-    # 限制上下文长度
-    if len(request.messages) > 20:
-      request.messages = request.messages[-20:]
-
     # 调用 Service
-    response_text = await get_travel_advice([m.model_dump() for m in request.messages])
+    try:
+      response_text = await get_travel_advice(context, fallback=False)
+    except AIOverloaded:
+      raise
+    except Exception as e:
+      # 失败的回复不写入会话
+      return {"role": "assistant", "content": travel_advice_apology(e), "conversation_id": conversation_id}
 
+    conversation_manager.record_turn(conversation_id, state, new_message, response_text)
     logger.info("AI 响应生成完毕")
-    return {"role": "assistant", "content": response_text}
+    return {"role": "assistant", "content": response_text, "conversation_id": conversation_id}
 
+  except AIOverloaded:
+    raise ai_busy_exception()
   except Exception as e:
     logger.error(f"路由层处理 AI 请求失败: {str(e)}", exc_info=True)
     raise HTTPException(status_code=500, detail="AI Service Error")
 
 
+def sse_event(data: dict, event: str = None) -> str:
+  """格式化一条 Server-Sent Event"""
+  prefix = f"event: {event}\n" if event else ""
+  return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def iter_chat_events(request: Request, conversation: tuple):
+  """
+  把模型输出转换为 SSE 事件流：
+
+  - 第一条 `event: meta`，包含 conversation_id
+  - 每段文本一条 `data: {"delta": "..."}`
+  - 正常结束时 `event: done`，完整的回复写入会话
+  - 出错时 `event: error`（已经输出的内容保留在客户端）
+
+  客户端断开时停止读取并关闭上游的模型流，不完整的回复不写入会话。
+  """
+  conversation_id, state, new_message, context = conversation
+  yield sse_event({"conversation_id": conversation_id}, event="meta")
+  stream = stream_travel_advice(context)
+  parts = []
+  try:
+    async for delta in stream:
+      if await request.is_disconnected():
+        logger.info("客户端已断开，停止 AI 流式输出")
+        return
+      parts.append(delta)
+      yield sse_event({"delta": delta})
+    conversation_manager.record_turn(conversation_id, state, new_message, "".join(parts))
+    yield sse_event({"finished": True, "conversation_id": conversation_id}, event="done")
+  except AIOverloaded:
+    yield sse_event({"detail": "AI service is busy, please retry shortly"}, event="error")
+  except Exception as e:
+    logger.error(f"AI 流式输出失败: {str(e)}", exc_info=True)
+    yield sse_event({"detail": "AI Service Error"}, event="error")
+  finally:
+    await stream.aclose()
+
+
+@router.post("/chat/stream")
+async def chat_with_ai_stream(
+    request: Request,
+    chat_request: ChatRequest,
+    session: AsyncSession = Depends(get_async_session)
+):
+  """
+  /chat 的流式版本（text/event-stream），模型生成的文本逐段推送，降级逻辑与 /chat 相同
+  """
+  logger.info(f"收到 AI 流式聊天请求，消息条数: {len(chat_request.messages)}")
+  owner, anonymous_id = await resolve_conversation_owner(request, session)
+  # yield 依赖在响应发送完毕（整个 SSE 流结束）后才清理：先关闭会话归还连接，不在流式生成期间占用连接池
+  await session.close()
+  # 在开始推送之前校验会话ID，无效时返回普通的 404 响应
+  conversation = prepare_conversation(chat_request, owner)
+  response = StreamingResponse(
+    iter_chat_events(request, conversation),
+    media_type="text/event-stream",
+    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+  )
+  set_ai_session_cookie(response, anonymous_id)
+  return response
+
+
 class GenerateDiaryRequest(BaseModel):
   prompt: str
+  # 为 True 时跳过 AI 结果缓存，强制重新生成（“重新生成”按钮）
+  no_cache: bool = False
 @router.post("/generate-diary")
 async def generate_diary(request: GenerateDiaryRequest):
   logger.info(f"收到生成日记请求: {request.prompt[:50]}...")
 
   try:
-    data = await generate_diary_draft(request.prompt)
+    data = await generate_diary_draft(request.prompt, bypass_cache=request.no_cache)
 
     if data is None:
       raise HTTPException(status_code=500, detail="Failed to generate valid JSON from AI")
 
     return data
+  except AIOverloaded:
+    raise ai_busy_exception()
   except Exception as e:
     logger.error(f"生成日记路由错误: {str(e)}", exc_info=True)
-    raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+    raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/models/status")
+def get_model_status():
+  """当前提供方，各模型的熔断状态、并发与排队、失败计数和平均延迟（用于监控）"""
+  return {
+    "provider": ai_provider.info(),
+    **model_registry.info(),
+    "single_flight": ai_single_flight.info(),
+    "conversations": conversation_manager.info()
+  }
@@ -1,144 +1,37 @@
 # backend/app/routers/entry.py
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlmodel import Session, select, func, or_, desc, col
-from datetime import date, datetime, timedelta
-from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlmodel import Session, select, or_, and_
+from sqlmodel.ext.asyncio.session import AsyncSession
+from datetime import date, datetime
+from typing import List, Optional, Tuple, Any, Union
+import base64
+import json
+import struct
 import logging
 from app.models import (
   Entry, EntryCreate, EntryUpdate, Photo, PhotoCreate, Location,
-  DiaryListResponse, DiaryListItem, EntryDetailResponse
+  DiaryListResponse, DiaryListItem, EntryDetailResponse, BulkImportResponse, PhotoSyncSummary
 )
-from app.database import get_session
+from app.database import get_async_session
 from app.routers.user import get_current_user
+from app.services.cache import get_cache_info
+from app.services.export_service import export_entries, EXPORT_FORMATS
 from app.services.geocoder import Geocoder
+from app.services.http_cache import request_etag, etag_matches, etag_headers, not_modified_response
+from app.services.import_service import import_entries, BULK_IMPORT_MAX_ITEMS
+from app.services.location_resolver import LocationRef, location_resolver, resolve_location
+from app.services.photo_service import sync_entry_photos
+from app.services.search_service import keyword_condition, relevance_order
+from app.services.stats_service import (
+  get_user_stats, get_list_stats, invalidate_user_stats_cache, record_entry_change,
+  stats_cache, STATS_CACHE_TTL_MINUTES
+)
 from pydantic import BaseModel
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/entries", tags=["Entries"])
 
-# ==================== 缓存配置 ====================
-# 地理编码缓存 - 内存缓存，重启服务会丢失
-location_cache = {}
-
-# 统计信息缓存（可考虑使用 Redis 在生产环境）
-# 结构: {"user_stats_{user_id}": (stats_data, cache_time)}
-stats_cache = {}
-STATS_CACHE_TTL_MINUTES = 5  # 统计信息缓存5分钟
-
-
-def clear_expired_cache():
-  """清理过期的缓存项"""
-  current_time = datetime.now()
-  expired_keys = []
-
-  for key, (_, cache_time) in stats_cache.items():
-    if current_time - cache_time > timedelta(minutes=STATS_CACHE_TTL_MINUTES):
-      expired_keys.append(key)
-
-  for key in expired_keys:
-    del stats_cache[key]
-    logger.debug(f"清理过期缓存: {key}")
-
-
-def get_user_stats(user_id: int, session: Session, force_refresh: bool = False):
-  """
-  获取用户统计信息（带缓存）
-
-  Args:
-      user_id: 用户ID
-      session: 数据库会话
-      force_refresh: 是否强制刷新缓存
-
-  Returns:
-      dict: 包含统计信息的字典
-  """
-  cache_key = f"user_stats_{user_id}"
-  current_time = datetime.now()
-
-  # 定期清理过期缓存
-  if len(stats_cache) > 1000:  # 防止缓存过大
-    clear_expired_cache()
-
-  # 检查缓存（除非强制刷新）
-  if not force_refresh and cache_key in stats_cache:
-    cached_data, cached_time = stats_cache[cache_key]
-    if current_time - cached_time < timedelta(minutes=STATS_CACHE_TTL_MINUTES):
-      logger.debug(f"使用缓存的统计信息: user_id={user_id}")
-      return cached_data
-    else:
-      logger.debug(f"缓存已过期: user_id={user_id}")
-      del stats_cache[cache_key]
-
-  # 重新计算统计信息
-  logger.debug(f"计算用户统计信息: user_id={user_id}")
-  start_time = datetime.now()
-
-  try:
-    # 1. 计算 diary_total (visited 日记总数)
-    diary_total = session.exec(
-      select(func.count(Entry.id))
-      .where(Entry.user_id == user_id)
-      .where(Entry.entry_type == "visited")
-    ).one() or 0
-
-    # 2. 计算 guide_total (wishlist 日记总数)
-    guide_total = session.exec(
-      select(func.count(Entry.id))
-      .where(Entry.user_id == user_id)
-      .where(Entry.entry_type == "wishlist")
-    ).one() or 0
-
-    # 3. 计算 place_total (不重复的 visited 地点总数)
-    place_total = session.exec(
-      select(func.count(func.distinct(Entry.location_name)))
-      .where(Entry.user_id == user_id)
-      .where(Entry.entry_type == "visited")
-    ).one() or 0
-
-    # 4. 计算总日记数（包括所有类型）
-    total_entries = session.exec(
-      select(func.count(Entry.id))
-      .where(Entry.user_id == user_id)
-    ).one() or 0
-
-    stats = {
-      "diary_total": diary_total,
-      "guide_total": guide_total,
-      "place_total": place_total,
-      "total_entries": total_entries
-    }
-
-    # 更新缓存
-    stats_cache[cache_key] = (stats, current_time)
-
-    elapsed = (datetime.now() - start_time).total_seconds()
-    logger.info(f"用户统计计算完成: user_id={user_id}, "
-                f"耗时: {elapsed:.3f}秒, "
-                f"结果: diary_total={diary_total}, "
-                f"guide_total={guide_total}, "
-                f"place_total={place_total}")
-
-    return stats
-
-  except Exception as e:
-    logger.error(f"计算用户统计信息失败: user_id={user_id}, 错误: {str(e)}", exc_info=True)
-    # 返回默认值
-    return {
-      "diary_total": 0,
-      "guide_total": 0,
-      "place_total": 0,
-      "total_entries": 0
-    }
-
-
-def invalidate_user_stats_cache(user_id: int):
-  """使指定用户的统计缓存失效"""
-  cache_key = f"user_stats_{user_id}"
-  if cache_key in stats_cache:
-    del stats_cache[cache_key]
-    logger.debug(f"已使缓存失效: {cache_key}")
-
-
 # ==================== 统计响应模型 ====================
 class UserStatsResponse(BaseModel):
   """用户统计信息响应模型"""
@@ -153,13 +46,80 @@ class UserStatsResponse(BaseModel):
 class CacheInfoResponse(BaseModel):
   """缓存信息响应模型"""
   stats_cache_size: int
-  location_cache_size: int
   stats_cache_ttl_minutes: int
   user_stats: dict
+  # 各缓存的容量、命中/未命中/淘汰计数
+  caches: dict
+  # 位置网格索引的条目数、内存占用和命中率
+  location_resolver: dict
+
+
+# ==================== 游标分页 ====================
+# 游标内容: {"k": 排序字段, "d": 排序方向, "v": 上一页最后一条的排序值, "i": 上一页最后一条的 id}
+# 以 (排序字段, id) 作为 keyset，可以直接利用 idx_entries_user_created_time / idx_entries_user_date_start 索引定位，
+# 无论翻到第几页都只读取 page_size + 1 行，而不是像 OFFSET 那样扫描并丢弃前面所有行。
+
+def encode_cursor(sort_by: str, sort_order: str, value: Any, entry_id: int) -> str:
+  """将 keyset 位置编码为不透明的 URL 安全字符串"""
+  if isinstance(value, (date, datetime)):
+    value = value.isoformat()
+  payload = json.dumps({"k": sort_by, "d": sort_order, "v": value, "i": entry_id}, separators=(",", ":"))
+  return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, sort_by: str, sort_order: str) -> Tuple[Any, int]:
+  """
+  解析游标，返回 (排序值, id)
+
+  Raises:
+      HTTPException: 游标格式错误，或与当前请求的排序方式不一致
+  """
+  try:
+    padded = cursor + "=" * (-len(cursor) % 4)
+    payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    if payload["k"] != sort_by or payload["d"] != sort_order:
+      raise ValueError("游标的排序方式与当前请求不一致")
+    raw_value = payload["v"]
+    entry_id = int(payload["i"])
+    if raw_value is None:
+      value = None
+    elif sort_by == "date_start":
+      value = date.fromisoformat(raw_value)
+    else:
+      value = datetime.fromisoformat(raw_value)
+  except Exception as e:
+    logger.warning(f"无效的分页游标: {cursor}, 错误: {str(e)}")
+    raise HTTPException(
+      status_code=status.HTTP_400_BAD_REQUEST,
+      detail="无效的分页游标"
+    )
+  return value, entry_id
+
+
+def build_keyset_condition(sort_column, descending: bool, last_value: Any, last_id: int):
+  """
+  构建 "位于游标之后" 的查询条件
+
+  排序统一使用 NULLS LAST（date_start 可能为空），因此：
+  - 游标值为 None：已经进入末尾的 NULL 区间，只需按 id 继续
+  - 游标值非 None：排序值更靠后，或排序值相同且 id 更靠后，或排序值为 NULL
+  """
+  after_id = Entry.id < last_id if descending else Entry.id > last_id
+  if last_value is None:
+    return and_(sort_column.is_(None), after_id)
+
+  after_value = sort_column < last_value if descending else sort_column > last_value
+  return or_(
+    after_value,
+    and_(sort_column == last_value, after_id),
+    sort_column.is_(None)
+  )
 
 
 # ==================== 位置管理函数 ====================
-async def get_or_create_location(coords: dict, location_name: str, session: Session) -> Optional[Location]:
+async def get_or_create_location(
+    coords: dict, location_name: str, session: AsyncSession
+) -> Optional[Union[Location, LocationRef]]:
   """
   获取或创建位置信息 - 优化版本
   Args:
@@ -167,7 +127,7 @@ async def get_or_create_location(coords: dict, location_name: str, session: Sess
       location_name: 位置名称
       session: 数据库会话
   Returns:
-      Location 对象或 None
+      带有 id 的位置（内存索引命中时为 LocationRef，否则为 Location 对象）或 None
   """
   try:
     # 确保坐标有正确的键
@@ -175,51 +135,29 @@ async def get_or_create_location(coords: dict, location_name: str, session: Sess
       logger.warning(f"无效的坐标: {coords}")
       return None
 
-    # 生成缓存键（保留6位小数）
     lat = float(coords["lat"])
     lng = float(coords["lng"])
-    cache_key = f"{lat:.6f}_{lng:.6f}"
-
-    # 检查缓存
-    if cache_key in location_cache:
-      logger.debug(f"使用缓存的位置ID: {cache_key}")
-      cached_location_id = location_cache[cache_key]
-      cached_location = session.get(Location, cached_location_id)
-      if cached_location:
-        return cached_location
-
-    # 临时方案：查询所有位置（建议修改模型添加独立字段）
-    all_locations = session.exec(select(Location)).all()
-
-    for location in all_locations:
-      location_coords = location.coordinates
-      if isinstance(location_coords, dict) and "lat" in location_coords and "lng" in location_coords:
-        db_lat = float(location_coords["lat"])
-        db_lng = float(location_coords["lng"])
-
-        # 使用容差值（约11米精度）
-        if (abs(db_lat - lat) < 0.0001 and
-            abs(db_lng - lng) < 0.0001):
-          logger.debug(f"在数据库中找到现有位置: {location.name}")
-          location_cache[cache_key] = location.id
-          return location
+
+    # 查找容差范围内（约11米）的已有位置：先查内存网格索引，未命中再查库
+    location = await session.run_sync(resolve_location, lat, lng)
+    if location:
+      logger.debug(f"找到现有位置: ID {location.id}")
+      return location
 
     # 创建新位置
     location = await Geocoder.reverse_geocode(coords, location_name)
     if location:
       # 检查是否有同名位置
-      existing_by_name = session.exec(
+      existing_by_name = (await session.exec(
         select(Location).where(Location.name == location_name)
-      ).first()
+      )).first()
 
       if existing_by_name:
-        location_cache[cache_key] = existing_by_name.id
         return existing_by_name
 
       session.add(location)
-      session.commit()
-      session.refresh(location)
-      location_cache[cache_key] = location.id
+      await session.commit()
+      await session.refresh(location)
       logger.info(f"创建新位置: {location.name}, ID: {location.id}")
       return location
 
@@ -233,7 +171,7 @@ async def get_or_create_location(coords: dict, location_name: str, session: Sess
 @router.post("", response_model=EntryDetailResponse, status_code=status.HTTP_201_CREATED) #  使用新的响应模型，并返回 201 Created
 async def create_entry(
     entry_data: EntryCreate,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
     current_user: dict = Depends(get_current_user)
 ):
   """
@@ -256,21 +194,25 @@ async def create_entry(
     })
     db_entry = Entry.model_validate(entry_dict) # 使用 model_validate 更安全
     session.add(db_entry)
-    session.flush()  # flush() 以便获取 db_entry.id
+    await session.flush()  # flush() 以便获取 db_entry.id
     # 处理照片
     if entry_data.photos:
+      position = 0
       for photo_data in entry_data.photos:
         # model_dump() 会自动处理 size -> bytes 的映射
         photo_dict = photo_data.model_dump(exclude_unset=True)
         # 确保关键字段存在
         if 'public_id' in photo_dict and 'url' in photo_dict:
-          db_photo = Photo(**photo_dict, entry_id=db_entry.id)
+          db_photo = Photo(**photo_dict, entry_id=db_entry.id, position=position)
           session.add(db_photo)
+          position += 1
           logger.debug(f"照片 {photo_dict['public_id']} 已关联到日记 {db_entry.id}")
         else:
           logger.warning(f"跳过一张无效的照片数据: {photo_dict}")
-    session.commit()
-    session.refresh(db_entry)
+    # 在同一事务中更新统计计数器
+    await session.run_sync(record_entry_change, user_id, None, (db_entry.entry_type, db_entry.location_name))
+    await session.commit()
+    await session.refresh(db_entry)
     invalidate_user_stats_cache(user_id)
     logger.info(f"日记创建成功, ID: {db_entry.id}, 标题: '{db_entry.title}'")
 
@@ -278,15 +220,84 @@ async def create_entry(
     return db_entry
   except Exception as e:
     logger.error(f"创建日记时发生意外错误: {str(e)}", exc_info=True)
-    session.rollback()
+    await session.rollback()
     raise HTTPException(
       status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
       detail="创建日记失败，服务器内部错误"
     )
   
+@router.post("/bulk", response_model=BulkImportResponse)
+async def bulk_create_entries(
+    payloads: List[Any],
+    session: AsyncSession = Depends(get_async_session),
+    current_user: dict = Depends(get_current_user)
+):
+  """
+  批量导入日记（请求体为 `EntryCreate` 数组）
+
+  - 逐条校验，无效条目在 `errors` 中按下标报告，不影响其他条目
+  - 所有坐标一次解析，日记和照片批量写入同一个事务，统计缓存只失效一次
+  """
+  user_id = current_user["user_id"]
+  if len(payloads) > BULK_IMPORT_MAX_ITEMS:
+    raise HTTPException(
+      status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+      detail=f"单次最多导入 {BULK_IMPORT_MAX_ITEMS} 条日记"
+    )
+  logger.info(f"用户 {user_id} 正在批量导入日记, 条数: {len(payloads)}")
+  try:
+    return await session.run_sync(import_entries, user_id, payloads)
+  except Exception as e:
+    logger.error(f"批量导入日记时发生意外错误: {str(e)}", exc_info=True)
+    await session.rollback()
+    raise HTTPException(
+      status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+      detail="批量导入日记失败，服务器内部错误"
+    )
+
+
+# ==================== 流式列表 ====================
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+STREAM_BATCH_SIZE = 500  # 服务端游标每批读取的行数
+
+# 列表只需要这些列，不加载 Entry 对象（以及 selectin 关联的照片）
+DIARY_LIST_COLUMNS = [getattr(Entry, field) for field in DiaryListItem.model_fields]
+
+
+async def iter_diary_list_ndjson(session: AsyncSession, query, stats: dict, keyword: Optional[str], entry_type: Optional[str]):
+  """
+  以 NDJSON 逐行输出日记列表，每行一个 JSON 对象：
+
+  - 第一行 {"type": "stats", ...}: diary_total / guide_total / place_total 等统计信息
+  - 中间每行 {"type": "item", "data": {...}}: 一条 DiaryListItem
+  - 最后一行 {"type": "totals", "total": n}: 实际输出的条数
+
+  通过服务端游标（yield_per）分批读取，每批读完即序列化输出，内存占用不随日记总数增长。
+  """
+  yield json.dumps({
+    "type": "stats",
+    "diary_total": stats["diary_total"],
+    "guide_total": stats["guide_total"],
+    "place_total": stats["place_total"],
+    "total_entries": stats["total_entries"],
+    "keyword": keyword,
+    "entry_type": entry_type
+  }, ensure_ascii=False) + "\n"
+
+  count = 0
+  result = await session.stream(query.execution_options(yield_per=STREAM_BATCH_SIZE))
+  async for row in result:
+    item = DiaryListItem.model_validate(dict(row._mapping))
+    yield '{"type":"item","data":' + item.model_dump_json() + "}\n"
+    count += 1
+
+  yield json.dumps({"type": "totals", "total": count}) + "\n"
+  logger.info(f"流式日记列表输出完成, 条数: {count}")
+
+
 # 需求 2: 获取日记列表接口
 @router.get("", response_model=DiaryListResponse)
-def get_diaries(
+async def get_diaries(
     page: int = Query(1, ge=1),
     page_size: int = Query(10, ge=1, le=100),
     get_all: bool = Query(False),
@@ -296,48 +307,45 @@ def get_diaries(
     # 筛选参数
     keyword: Optional[str] = Query(None, description="搜索关键词(标题或内容)"),
     entry_type: Optional[str] = Query(None, enum=["visited", "wishlist"], description="日记类型筛选"),
-    session: Session = Depends(get_session),
+    # 游标分页参数
+    pagination: str = Query("offset", enum=["offset", "cursor"], description="分页模式"),
+    cursor: Optional[str] = Query(None, description="游标分页：上一页返回的 next_cursor"),
+    include_total: bool = Query(True, description="游标分页：是否返回筛选后的总条数"),
+    stream: bool = Query(False, description="get_all=true 时以 NDJSON 流式返回"),
+    *,
+    request: Request,
+    response: Response,
+    session: AsyncSession = Depends(get_async_session),
     current_user: dict = Depends(get_current_user)
 ):
   """
   获取当前用户的日记列表。
   支持分页、排序、类型筛选和关键词搜索。
+
+  - `pagination=offset`（默认）：按 page / page_size 分页。
+  - `pagination=cursor`：按 (排序字段, id) 做 keyset 分页，用响应中的 `next_cursor` 获取下一页。
+    游标模式下始终按 sort_by / sort_order 排序（关键词只作为筛选条件，不做相关度排序）；
+    `include_total=false` 时 total / total_pages 为 None，其余计数器的含义不变。
+  - `get_all=true&stream=true`：以 NDJSON 流式返回全部数据，详见 `iter_diary_list_ndjson`。
+  - 支持 `If-None-Match` 条件请求，数据未变化时返回 304。
   """
   user_id = current_user["user_id"]
-  logger.info(f"用户 {user_id} 请求日记列表: page={page}, keyword={keyword}, type={entry_type}")
-  # 1. 获取基础统计信息 (默认使用全局缓存)
-  # 这里包含了全局的 place_total，根据需求，这个值即使在搜索时也不变
-  stats = get_user_stats(user_id, session, force_refresh=force_refresh_stats)
-  # [新增逻辑] 如果有 keyword，重新计算 diary_total 和 guide_total
-  if keyword:
-    logger.debug(f"检测到搜索关键词 '{keyword}'，正在重新计算筛选后的统计信息...")
-    search_term = f"%{keyword}%"
-    search_condition = or_(
-      col(Entry.title).ilike(search_term),
-      col(Entry.content).ilike(search_term)
+  use_cursor = pagination == "cursor" and not get_all
+  logger.info(f"用户 {user_id} 请求日记列表: page={page}, keyword={keyword}, type={entry_type}, pagination={pagination}")
+  # 0. 条件请求：数据版本未变化时直接返回 304，不查询日记表
+  etag = await session.run_sync(request_etag, user_id, request)
+  if etag_matches(request, etag):
+    return not_modified_response(etag)
+  response.headers.update(etag_headers(etag))
+  # 1. 获取统计信息：单次聚合查询同时得到全局统计、关键词统计和筛选后的列表总条数
+  # place_total 始终是全局值，根据需求，这个值即使在搜索时也不变
+  stats = await session.run_sync(
+    lambda sync_session: get_list_stats(
+      user_id, sync_session, keyword=keyword, entry_type=entry_type, force_refresh=force_refresh_stats
     )
-    # 1.1 计算与 keyword 相关的 visited 总数 (diary_total)
-    filtered_diary_total = session.exec(
-      select(func.count(Entry.id))
-      .where(Entry.user_id == user_id)
-      .where(Entry.entry_type == "visited")
-      .where(search_condition)
-    ).one() or 0
-    # 1.2 计算与 keyword 相关的 wishlist 总数 (guide_total)
-    filtered_guide_total = session.exec(
-      select(func.count(Entry.id))
-      .where(Entry.user_id == user_id)
-      .where(Entry.entry_type == "wishlist")
-      .where(search_condition)
-    ).one() or 0
-    # 覆盖 stats 字典中的值
-    # 注意：place_total 保持原样 (stats["place_total"])
-    stats = {
-      "diary_total": filtered_diary_total,
-      "guide_total": filtered_guide_total,
-      "place_total": stats["place_total"], # 保持不变
-      "total_entries": stats["total_entries"]
-    }
+  )
+  # include_total=false 只省略列表总数，diary_total / guide_total 仍随关键词筛选
+  total_entries = stats["list_total"] if include_total or not use_cursor else None
   # 2. 构建基础查询 (用于获取列表数据)
   base_query = select(Entry).where(Entry.user_id == user_id)
   # 3. 应用类型筛选
@@ -345,40 +353,66 @@ def get_diaries(
     base_query = base_query.where(Entry.entry_type == entry_type)
   # 4. 应用关键词搜索
   if keyword:
-    search_term = f"%{keyword}%"
-    base_query = base_query.where(
-      or_(
-        col(Entry.title).ilike(search_term),
-        col(Entry.content).ilike(search_term)
-      )
+    base_query = base_query.where(keyword_condition(session.sync_session, keyword))
+  # 5. 游标分页：keyset 查询后直接返回
+  if use_cursor:
+    sort_column = Entry.date_start if sort_by == "date_start" else Entry.created_time
+    descending = sort_order.lower() != "asc"
+    if cursor:
+      last_value, last_id = decode_cursor(cursor, sort_by, sort_order)
+      base_query = base_query.where(build_keyset_condition(sort_column, descending, last_value, last_id))
+    if descending:
+      base_query = base_query.order_by(sort_column.desc().nulls_last(), Entry.id.desc())
+    else:
+      base_query = base_query.order_by(sort_column.asc().nulls_last(), Entry.id.asc())
+    # 多取一条用于判断是否还有下一页
+    entries = (await session.exec(base_query.limit(page_size + 1))).all()
+    has_more = len(entries) > page_size
+    entries = entries[:page_size]
+    next_cursor = None
+    if has_more:
+      last_entry = entries[-1]
+      next_cursor = encode_cursor(sort_by, sort_order, getattr(last_entry, sort_by), last_entry.id)
+    total_pages = (total_entries + page_size - 1) // page_size if total_entries is not None else None
+    return DiaryListResponse(
+      items=[DiaryListItem.model_validate(entry) for entry in entries],
+      total=total_entries,
+      page=page,
+      page_size=page_size,
+      total_pages=total_pages,
+      diary_total=stats["diary_total"],
+      guide_total=stats["guide_total"],
+      place_total=stats["place_total"],
+      keyword=keyword,
+      entry_type=entry_type,
+      next_cursor=next_cursor,
+      has_more=has_more
     )
-  # 5. 计算筛选后的列表总条数 (用于分页)
-  if keyword or entry_type:
-    count_query = select(func.count()).select_from(base_query.subquery())
-    total_entries = session.exec(count_query).one()
-  else:
-    total_entries = stats["total_entries"]
   # 6. 应用排序
   if keyword:
-    # 相关度排序：标题匹配优先
-    search_term = f"%{keyword}%"
-    base_query = base_query.order_by(
-      desc(col(Entry.title).ilike(search_term)),
-      Entry.created_time.desc()
-    )
+    # 相关度排序：标题匹配优先，其次按全文索引的相关度
+    order_clauses = relevance_order(session.sync_session, keyword)
   else:
     # 常规排序
     sort_column = Entry.date_start if sort_by == "date_start" else Entry.created_time
-    order_by = sort_column.asc() if sort_order.lower() == "asc" else sort_column.desc()
-    base_query = base_query.order_by(order_by)
-  # 7. 应用分页
+    order_clauses = [sort_column.asc() if sort_order.lower() == "asc" else sort_column.desc()]
+  # 7. 流式返回全部数据（NDJSON），只查询列表需要的列，内存占用与日记总数无关
+  if get_all and stream:
+    stream_query = select(*DIARY_LIST_COLUMNS).where(base_query.whereclause).order_by(*order_clauses)
+    return StreamingResponse(
+      iter_diary_list_ndjson(session, stream_query, stats, keyword, entry_type),
+      media_type=NDJSON_MEDIA_TYPE,
+      headers=etag_headers(etag)
+    )
+  base_query = base_query.order_by(*order_clauses)
+  # 8. 应用分页
   if get_all:
-    entries = session.exec(base_query).all()
+    entries = (await session.exec(base_query)).all()
     page_size = total_entries if total_entries > 0 else 1
     total_pages = 1
   else:
     offset = (page - 1) * page_size
-    entries = session.exec(base_query.offset(offset).limit(page_size)).all()
+    entries = (await session.exec(base_query.offset(offset).limit(page_size))).all()
     total_pages = (total_entries + page_size - 1) // page_size if page_size > 0 else 1
   items = [DiaryListItem.model_validate(entry) for entry in entries]
   # 返回响应
@@ -396,23 +430,149 @@ def get_diaries(
     entry_type=entry_type
   )
 
+# ==================== 地球光点接口 ====================
+# 二进制格式（小端序），各数组按 4 字节对齐，前端可以直接用 TypedArray 视图读取：
+#   header: magic "TGP1" (4 bytes) | count uint32 | reserved uint32
+#   ids Int32[count] | lat Float32[count] | lng Float32[count] | date_start Int32[count] | type Uint8[count]
+# date_start 为距 1970-01-01 的天数，没有日期时为 POINTS_NO_DATE
+POINTS_MAGIC = b"TGP1"
+POINTS_NO_DATE = -2 ** 31
+POINT_TYPE_CODES = {"visited": 0, "wishlist": 1}
+POINT_TYPE_UNKNOWN = 255
+EPOCH_DATE = date(1970, 1, 1)
+
+
+def load_globe_points(session: Session, user_id: int, entry_type: Optional[str] = None) -> dict:
+  """只读取绘制光点需要的列，组装为列式数组"""
+  query = select(Entry.id, Entry.coordinates, Entry.entry_type, Entry.date_start).where(Entry.user_id == user_id)
+  if entry_type:
+    query = query.where(Entry.entry_type == entry_type)
+
+  ids, lats, lngs, dates, types = [], [], [], [], []
+  for entry_id, coords, row_type, date_start in session.exec(query.order_by(Entry.id)):
+    try:
+      lat, lng = float(coords["lat"]), float(coords["lng"])
+    except (TypeError, KeyError, ValueError):
+      logger.warning(f"日记 {entry_id} 坐标无效，跳过光点: {coords}")
+      continue
+    ids.append(entry_id)
+    lats.append(lat)
+    lngs.append(lng)
+    dates.append((date_start - EPOCH_DATE).days if date_start else POINTS_NO_DATE)
+    types.append(POINT_TYPE_CODES.get(row_type, POINT_TYPE_UNKNOWN))
+
+  return {"ids": ids, "lat": lats, "lng": lngs, "date_start": dates, "types": types}
+
+
+def pack_globe_points(points: dict) -> bytes:
+  """将列式光点数据打包为二进制格式"""
+  count = len(points["ids"])
+  return b"".join([
+    POINTS_MAGIC,
+    struct.pack("<II", count, 0),
+    struct.pack(f"<{count}i", *points["ids"]),
+    struct.pack(f"<{count}f", *points["lat"]),
+    struct.pack(f"<{count}f", *points["lng"]),
+    struct.pack(f"<{count}i", *points["date_start"]),
+    bytes(points["types"]),
+  ])
+
+
+@router.get("/points")
+async def get_globe_points(
+    format: str = Query("binary", enum=["binary", "json"], description="返回格式"),
+    entry_type: Optional[str] = Query(None, enum=["visited", "wishlist"], description="日记类型筛选"),
+    *,
+    request: Request,
+    session: AsyncSession = Depends(get_async_session),
+    current_user: dict = Depends(get_current_user)
+):
+  """
+  获取地球光点数据（列式紧凑格式）。
+
+  只返回 id、坐标、类型和开始日期，供前端绘制光点使用：
+  - `format=binary`（默认）：`application/octet-stream`，布局见 POINTS_MAGIC 上方说明
+  - `format=json`：列式数组 `{"count", "ids", "lat", "lng", "date_start", "types", "type_codes"}`
+  """
+  user_id = current_user["user_id"]
+  etag = await session.run_sync(request_etag, user_id, request)
+  if etag_matches(request, etag):
+    return not_modified_response(etag)
+
+  points = await session.run_sync(load_globe_points, user_id, entry_type)
+  logger.info(f"用户 {user_id} 请求光点数据: format={format}, 数量={len(points['ids'])}")
+
+  if format == "json":
+    return JSONResponse(content={
+      "count": len(points["ids"]),
+      "type_codes": POINT_TYPE_CODES,
+      "no_date": POINTS_NO_DATE,
+      **points
+    }, headers=etag_headers(etag))
+  return Response(
+    content=pack_globe_points(points),
+    media_type="application/octet-stream",
+    headers=etag_headers(etag)
+  )
+
+
+@router.get("/export")
+async def export_diaries(
+    format: str = Query("geojson", enum=list(EXPORT_FORMATS), description="导出格式"),
+    compress: Optional[bool] = Query(None, description="是否 gzip 压缩，默认根据 Accept-Encoding 判断"),
+    *,
+    request: Request,
+    session: AsyncSession = Depends(get_async_session),
+    current_user: dict = Depends(get_current_user)
+):
+  """
+  流式导出当前用户的全部日记（含照片）
+
+  - `format=geojson`（默认）：GeoJSON FeatureCollection，坐标作为 Point 几何
+  - `format=jsonl`：每行一条日记
+  - `format=csv`：坐标拆为 lat / lng 列，照片以 JSON 数组放在 photos 列
+
+  分块读取、边序列化边输出（可选 gzip），内存占用不随数据量增长。
+  """
+  user_id = current_user["user_id"]
+  if compress is None:
+    compress = "gzip" in request.headers.get("accept-encoding", "")
+  media_type, extension = EXPORT_FORMATS[format]
+  headers = {"Content-Disposition": f'attachment; filename="travel-globe-export.{extension}"'}
+  if compress:
+    headers["Content-Encoding"] = "gzip"
+  logger.info(f"用户 {user_id} 开始导出日记: format={format}, gzip={compress}")
+
+  return StreamingResponse(
+    export_entries(session, user_id, format, compress=compress),
+    media_type=media_type,
+    headers=headers
+  )
+
+
 #  需求 3: 获取日记详情接口
 @router.get("/{entry_id}", response_model=EntryDetailResponse) #  使用新的响应模型
-def get_diary_detail(
+async def get_diary_detail(
     entry_id: int,
-    session: Session = Depends(get_session),
+    request: Request,
+    response: Response,
+    session: AsyncSession = Depends(get_async_session),
     current_user: dict = Depends(get_current_user)
 ):
   """
   获取单篇日记详情。
   - 返回的数据包含 `content` 和 `photos`。
   - 不会返回 `cost`, `description`, `mood`, `travel_partner` 等字段。
+  - 支持 `If-None-Match` 条件请求，数据未变化时返回 304。
   """
   user_id = current_user["user_id"]
   logger.info(f"用户 {user_id} 请求日记详情, ID: {entry_id}")
-  entry = session.exec(
+  etag = await session.run_sync(request_etag, user_id, request)
+  if etag_matches(request, etag):
+    return not_modified_response(etag)
+  entry = (await session.exec(
     select(Entry).where(Entry.id == entry_id, Entry.user_id == user_id)
-  ).first()
+  )).first()
   if not entry:
     logger.warning(f"用户 {user_id} 尝试访问不存在或不属于自己的日记, ID: {entry_id}")
     raise HTTPException(
@@ -420,6 +580,7 @@ def get_diary_detail(
       detail="日记不存在或无权访问"
     )
   logger.info(f"成功返回日记详情, ID: {entry_id}")
+  response.headers.update(etag_headers(etag))
   # 直接返回数据库对象 entry 即可
   # FastAPI 会自动根据 response_model (EntryDetailResponse) 来过滤和格式化数据
   return entry
@@ -429,22 +590,22 @@ def get_diary_detail(
 async def update_diary(
     entry_id: int,
     update_data: EntryUpdate,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
     current_user: dict = Depends(get_current_user)
 ):
   """
   更新一篇日记。
   - 支持部分字段更新。
-  - 照片列表会进行完全同步（先删后增）。
+  - 照片列表按 public_id 差异同步，响应中的 `photo_sync` 报告新增/更新/删除/未变的数量。
   - 自动处理位置信息和缓存失效。
   """
   user_id = current_user["user_id"]
   logger.info(f"用户 {user_id} 正在更新日记, ID: {entry_id}")
   logger.debug(f"收到的更新数据: {update_data.model_dump_json(indent=2)}")
   # 1. 获取并验证日记所有权
-  db_entry = session.exec(
+  db_entry = (await session.exec(
     select(Entry).where(Entry.id == entry_id, Entry.user_id == user_id)
-  ).first()
+  )).first()
   if not db_entry:
     logger.warning(f"用户 {user_id} 尝试更新不存在或不属于自己的日记, ID: {entry_id}")
     raise HTTPException(
@@ -452,6 +613,7 @@ async def update_diary(
       detail="日记不存在或无权访问"
     )
   logger.info(f"[BEFORE UPDATE] 日记ID {entry_id}: date_start={db_entry.date_start}, date_end={db_entry.date_end}")
+  old_stats_key = (db_entry.entry_type, db_entry.location_name)
   try:
     # 2. 更新基础字段 (除照片外的所有字段)
     # exclude_unset=True 确保只更新前端发送了的字段
@@ -477,35 +639,38 @@ async def update_diary(
       # 3.2 同步更新 Entry 对象自身的 location_name 和 coordinates
       db_entry.location_name = update_data.location_name
       db_entry.coordinates = update_data.coordinates
-    # 4. 同步照片列表 (如果提供了 photos 字段)
+    # 4. 同步照片列表 (如果提供了 photos 字段)，按 public_id 只写入变化的部分
+    photo_sync = None
     if update_data.photos is not None:
       logger.info(f"日记 {entry_id} 正在同步照片列表...")
-      # 4.1 先删除所有旧照片
-      old_photos = session.exec(select(Photo).where(Photo.entry_id == entry_id)).all()
-      if old_photos:
-        logger.debug(f"找到 {len(old_photos)} 张旧照片, 准备删除...")
-        for photo in old_photos:
-          session.delete(photo)
-      # 4.2 添加所有新照片
-      if update_data.photos:
-        logger.debug(f"准备添加 {len(update_data.photos)} 张新照片...")
-        for photo_data in update_data.photos:
-          new_photo = Photo.model_validate(photo_data, update={"entry_id": db_entry.id})
-          session.add(new_photo)
+      photo_sync = await session.run_sync(sync_entry_photos, entry_id, update_data.photos)
+      # 照片已由批量语句修改，已加载的照片集合作废，提交后重新加载
+      session.expire(db_entry, ["photos"])
     # [新增] 增加日志，记录提交前的最终数据状态
     logger.info(f"[AFTER UPDATE] 日记ID {entry_id}: date_start={db_entry.date_start}, date_end={db_entry.date_end}")
 
-    # 5. 提交事务
+    # 5. 在同一事务中更新统计计数器，然后提交事务
     session.add(db_entry)
-    session.commit()
+    await session.run_sync(record_entry_change, user_id, old_stats_key, (db_entry.entry_type, db_entry.location_name))
+    await session.commit()
     # 6. 刷新数据并使缓存失效
-    session.refresh(db_entry)
+    await session.refresh(db_entry)
     invalidate_user_stats_cache(user_id)
-    logger.info(f"日记 {entry_id} 更新成功!")
-    return db_entry
+    logger.info(f"日记 {entry_id} 更新成功! 照片同步: {photo_sync}")
+    response = EntryDetailResponse.model_validate(db_entry)
+    if photo_sync is not None:
+      response.photo_sync = PhotoSyncSummary(**photo_sync)
+    return response
+  except ValueError as e:
+    logger.warning(f"更新日记 {entry_id} 的数据无效: {str(e)}")
+    await session.rollback()
+    raise HTTPException(
+      status_code=status.HTTP_400_BAD_REQUEST,
+      detail=str(e)
+    )
   except Exception as e:
     logger.error(f"更新日记 {entry_id} 时发生意外错误: {str(e)}", exc_info=True)
-    session.rollback()
+    await session.rollback()
     raise HTTPException(
       status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
       detail="更新日记失败，服务器内部错误"
@@ -513,38 +678,45 @@ async def update_diary(
 
 # 删除日记
 @router.delete("/{entry_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_diary(
+async def delete_diary(
     entry_id: int,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
     current_user: dict = Depends(get_current_user)
 ):
   user_id = current_user["user_id"]
-  entry = session.exec(select(Entry).where(Entry.id == entry_id, Entry.user_id == user_id)).first()
+  entry = (await session.exec(select(Entry).where(Entry.id == entry_id, Entry.user_id == user_id))).first()
   if not entry:
     raise HTTPException(status_code=404, detail="日记不存在或无权访问")
 
-  session.delete(entry)
-  session.commit()
+  await session.delete(entry)
+  await session.run_sync(record_entry_change, user_id, (entry.entry_type, entry.location_name), None)
+  await session.commit()
   invalidate_user_stats_cache(user_id)
   return None # 204 响应不需要 body
 
 
 # ==================== 统计信息独立接口 ====================
 @router.get("/stats/summary", response_model=UserStatsResponse)
-def get_user_stats_summary(
+async def get_user_stats_summary(
+    request: Request,
+    response: Response,
     force_refresh: bool = Query(False, description="是否强制刷新统计缓存"),
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
     current_user: dict = Depends(get_current_user)
 ):
   """
   获取用户统计信息（独立接口）
 
-  可用于前端单独获取统计信息而不需要获取日记列表
+  可用于前端单独获取统计信息而不需要获取日记列表，支持 `If-None-Match` 条件请求
   """
   user_id = current_user["user_id"]
   logger.debug(f"用户 {user_id} 请求统计信息: force_refresh={force_refresh}")
+  etag = await session.run_sync(request_etag, user_id, request)
+  if etag_matches(request, etag):
+    return not_modified_response(etag)
+  response.headers.update(etag_headers(etag))
 
-  stats = get_user_stats(user_id, session, force_refresh=force_refresh)
+  stats = await session.run_sync(lambda sync_session: get_user_stats(user_id, sync_session, force_refresh=force_refresh))
 
   return UserStatsResponse(
     diary_total=stats["diary_total"],
@@ -552,3 +724,19 @@ def get_user_stats_summary(
     place_total=stats["place_total"],
     total_entries=stats["total_entries"]
   )
+
+
+@router.get("/stats/cache", response_model=CacheInfoResponse)
+async def get_cache_info_summary(
+    session: AsyncSession = Depends(get_async_session),
+    current_user: dict = Depends(get_current_user)
+):
+  """查看缓存和位置索引的状态（容量、命中率、淘汰次数、内存占用）以及当前用户的统计信息"""
+  user_id = current_user["user_id"]
+  return CacheInfoResponse(
+    stats_cache_size=len(stats_cache),
+    stats_cache_ttl_minutes=STATS_CACHE_TTL_MINUTES,
+    user_stats=await session.run_sync(lambda sync_session: get_user_stats(user_id, sync_session)),
+    caches=get_cache_info(),
+    location_resolver=location_resolver.info()
+  )
@@ -1,19 +1,25 @@
 # backend/app/routers/health.py
-from fastapi import APIRouter, status, Response
+from fastapi import APIRouter, Depends, status, Response
 from typing import Dict, Any
 
 # 从 database.py 导入你的健康检查函数
-from ..database import test_database_connection
+from ..database import test_async_database_connection
+from .user import get_current_user
+from ..services.mood_queue import mood_analysis_queue
+from ..services.password_service import password_hasher
 import logging
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# 内部运行状态（工作池、队列）：需要登录，并且与 /metrics 一样只在 METRICS_ENABLED 时注册（见 app/__init__.py）
+monitoring_router = APIRouter(prefix="/health", tags=["Monitoring"], dependencies=[Depends(get_current_user)])
+
 @router.get("/healthz", tags=["Monitoring"])
 async def healthz(response: Response):
   # 只做最基础的连接测试
-  is_alive = test_database_connection()
+  is_alive = await test_async_database_connection()
   if not is_alive:
     response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
     return {"status": "unhealthy", "reason": "Database connection failed"}
@@ -24,3 +30,13 @@ async def healthz(response: Response):
 @router.get("/health")
 def health():
   return {"status": "ok"}
+
+@monitoring_router.get("/password-hasher")
+def password_hasher_stats():
+  # 密码哈希工作池的排队深度、拒绝次数和耗时分布
+  return password_hasher.info()
+
+@monitoring_router.get("/mood-queue")
+def mood_queue_stats():
+  # 心情分析队列的积压与处理情况
+  return mood_analysis_queue.info()
@@ -1,12 +1,13 @@
 # backend/app/routers/mood.py
 from fastapi import APIRouter, Depends, HTTPException, status, Response
-from sqlmodel import Session, select, desc
+from sqlmodel import select, desc
+from sqlmodel.ext.asyncio.session import AsyncSession
 from sqlalchemy.orm import joinedload # [新增] 用于显式预加载
 from typing import List
-from app.database import get_session
+from app.database import get_async_session
 from app.models import Mood, MoodCreate, MoodResponse
 from app.routers.user import get_current_user
-from app.services.ai_service import analyze_mood_text
+from app.services.mood_queue import mood_analysis_queue
 import logging
 
 router = APIRouter(prefix="/moods", tags=["Moods"])
@@ -15,41 +16,31 @@ logger = logging.getLogger(__name__)
 @router.post("", response_model=MoodResponse, status_code=status.HTTP_201_CREATED)
 async def create_mood(
     mood_data: MoodCreate,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
     current_user: dict = Depends(get_current_user)
 ):
   try:
     user_id = current_user["user_id"]
     logger.info(f"User {user_id} creating mood with content: '{mood_data.content[:30]}...'")
 
-    # 1. 调用 AI 分析
-    ai_result = await analyze_mood_text(mood_data.content)
-    logger.info(f"AI analysis completed for user {user_id}.")
-
-    # 2. 创建数据库对象
+    # 1. 创建数据库对象，AI 分析结果由后台队列稍后写回（analysis_status=pending）
     db_mood = Mood(
       user_id=user_id,
       content=mood_data.content,
       photo_url=mood_data.photo_url,
-      photo_public_id=mood_data.photo_public_id,
-      mood_vector=ai_result.get("mood_vector", 0.5),
-      mood_reason=ai_result.get("mood_reason", "")
+      photo_public_id=mood_data.photo_public_id
     )
 
     session.add(db_mood)
-    session.commit()
-    logger.info(f"Mood for user {user_id} committed to database.")
+    await session.commit()
+    logger.info(f"Mood {db_mood.id} for user {user_id} committed to database.")
 
-    # 刷新对象以获取 ID 和默认值
-    session.refresh(db_mood)
-    logger.info(f"Mood object refreshed from DB, new ID is: {db_mood.id}")
+    # 2. 入队分析；expire_on_commit=False，提交后 ID 和默认值可直接读取，无需 refresh
+    mood_analysis_queue.enqueue(db_mood.id)
 
     # [关键步骤] 显式转换为 Pydantic 模型
-    # 配合 models.py 中的 lazy="joined"，这里可以安全地读取数据
     response_data = MoodResponse.model_validate(db_mood)
 
-    logger.info(f"Successfully created response model for mood ID {db_mood.id}. Preparing to send response.")
-
     return response_data
 
   except Exception as e:
@@ -61,8 +52,8 @@ async def create_mood(
     )
 
 @router.get("", response_model=List[MoodResponse])
-def get_moods(
-    session: Session = Depends(get_session),
+async def get_moods(
+    session: AsyncSession = Depends(get_async_session),
     current_user: dict = Depends(get_current_user)
 ):
   user_id = current_user["user_id"]
@@ -75,21 +66,21 @@ def get_moods(
     .options(joinedload(Mood.user))
   )
 
-  moods = session.exec(statement).all()
+  moods = (await session.exec(statement)).all()
   return moods
 
 @router.delete("/{mood_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_mood(
+async def delete_mood(
     mood_id: int,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
     current_user: dict = Depends(get_current_user)
 ):
   user_id = current_user["user_id"]
   logger.info(f"用户 {user_id} 正在尝试删除心情记录, ID: {mood_id}")
 
-  mood_to_delete = session.exec(
+  mood_to_delete = (await session.exec(
     select(Mood).where(Mood.id == mood_id, Mood.user_id == user_id)
-  ).first()
+  )).first()
 
   if not mood_to_delete:
     logger.warning(f"删除失败: 用户 {user_id} 尝试删除不存在或不属于自己的心情, ID: {mood_id}")
@@ -98,8 +89,8 @@ def delete_mood(
       detail="Mood not found or you do not have permission to delete it"
     )
 
-  session.delete(mood_to_delete)
-  session.commit()
+  await session.delete(mood_to_delete)
+  await session.commit()
   logger.info(f"用户 {user_id} 成功删除心情记录, ID: {mood_id}")
 
   return None
@@ -1,14 +1,16 @@
 # backend/app/routers/user.py
 from fastapi import APIRouter, Depends, HTTPException, status, Request, Response
-from sqlmodel import Session, select
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from typing import Optional
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 import logging
 from app.models import User, UserCreate, UserLogin  # 添加 UserLogin 导入
-from app.database import get_session
+from app.database import get_async_session
 from app.config import settings
+from app.services.auth_cache import cache_identity, get_cached_identity, is_revoked, revoke_token
+from app.services.password_service import PasswordHasherBusy, password_hasher
 
 SECRET_KEY = settings.SECRET_KEY
 ALGORITHM = settings.ALGORITHM
@@ -17,20 +19,32 @@ ACCESS_TOKEN_EXPIRE_DAYS = settings.ACCESS_TOKEN_EXPIRE_DAYS
 # 修改router前缀为/api/auth
 router = APIRouter(prefix="/auth", tags=["Authentication"])
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 logger = logging.getLogger(__name__)
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
-
-def get_password_hash(password):
-    return pwd_context.hash(password)
+def _hasher_busy_exception():
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many authentication requests, please retry shortly",
+        headers={"Retry-After": "1"},
+    )
 
-def authenticate_user(session: Session, username: str, password: str):
-    user = session.exec(select(User).where(User.username == username)).first()
-    if not user or not verify_password(password, user.hashed_password):
+async def authenticate_user(session: AsyncSession, username: str, password: str):
+    user = (await session.exec(select(User).where(User.username == username))).first()
+    if not user:
         return False
+    # bcrypt 在专用的哈希工作池中执行，不占用事件循环和共享线程池
+    try:
+        verified, new_hash = await password_hasher.verify(password, user.hashed_password)
+    except PasswordHasherBusy:
+        raise _hasher_busy_exception()
+    if not verified:
+        return False
+    if new_hash:
+        # 哈希的 cost 与当前策略不一致，登录成功时顺便升级
+        user.hashed_password = new_hash
+        session.add(user)
+        await session.commit()
+        logger.info(f"Rehashed password for user: {username}")
     return user
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -44,11 +58,11 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 @router.post("/register")
-def register_user(user: UserCreate, session: Session = Depends(get_session)):
+async def register_user(user: UserCreate, session: AsyncSession = Depends(get_async_session)):
     print("接收到用户注册请求")
     logger.info(f"注册请求: {user.username}")
     # 检查用户名是否已存在
-    existing_user = session.exec(select(User).where(User.username == user.username)).first()
+    existing_user = (await session.exec(select(User).where(User.username == user.username))).first()
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -56,22 +70,26 @@ def register_user(user: UserCreate, session: Session = Depends(get_session)):
         )
 
     # 创建新用户
+    try:
+        hashed_password = await password_hasher.hash(user.password)
+    except PasswordHasherBusy:
+        raise _hasher_busy_exception()
     db_user = User(
         username=user.username,
-        hashed_password=get_password_hash(user.password)  # 修复：直接设置哈希密码
+        hashed_password=hashed_password  # 修复：直接设置哈希密码
     )
     # db_user.set_password(user.password)  # 移除：User模型没有set_password方法
     session.add(db_user)
-    session.commit()
-    session.refresh(db_user)
+    await session.commit()
+    await session.refresh(db_user)
 
     return {"message": "User created successfully"}
 
 
 @router.post("/login")
-def login_user(response: Response, user_data: UserLogin, session: Session = Depends(get_session)):
+async def login_user(response: Response, user_data: UserLogin, session: AsyncSession = Depends(get_async_session)):
     logger.info(f"Attempting login for user: {user_data.username}") # 新增: 记录登录尝试
-    user = authenticate_user(session, user_data.username, user_data.password)
+    user = await authenticate_user(session, user_data.username, user_data.password)
     if not user:
         logger.warning(f"Login failed for user: {user_data.username}") # 新增: 记录登录失败
         raise HTTPException(
@@ -81,7 +99,7 @@ def login_user(response: Response, user_data: UserLogin, session: Session = Depe
         )
     access_token_expires = timedelta(days=ACCESS_TOKEN_EXPIRE_DAYS)
     access_token = create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
+        data={"sub": user.username, "uid": user.id}, expires_delta=access_token_expires
     )
     is_production = settings.ENVIRONMENT == "production"
 
@@ -105,50 +123,83 @@ def login_user(response: Response, user_data: UserLogin, session: Session = Depe
 
 
 @router.post("/logout")
-def logout_user(response: Response):
+async def logout_user(request: Request, response: Response, session: AsyncSession = Depends(get_async_session)):
+    # 撤销当前令牌：即使令牌被复制保留，也不能在过期前继续使用
+    token = request.cookies.get("access_token")
+    if token:
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        except JWTError:
+            payload = None  # 无效或已过期的令牌无需撤销
+        if payload is not None:
+            await revoke_token(session, token, payload.get("exp"))
     # 清除Cookie
     response.delete_cookie("access_token", path="/")
     return {"message": "Logged out successfully"}
 
+def _credentials_exception(detail: str = "Could not validate credentials"):
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail=detail,
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+async def verify_token(token: str, session: AsyncSession) -> dict:
+    """
+    校验 JWT 签名并确认用户仍然存在，返回用户身份
+
+    新令牌携带 uid，按主键读取用户；旧令牌只有 sub，按用户名查询。
+    """
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError as e:
+        logger.warning(f"/me request failed: JWT decoding error. Error: {e}")
+        raise _credentials_exception()
+    username: str = payload.get("sub")
+    if username is None:
+        logger.warning("/me request failed: Invalid token payload (sub is missing).")
+        raise _credentials_exception()
+
+    user_id = payload.get("uid")
+    identity = {
+        "username": username,
+        "user_id": user_id,
+        "expires_at": payload.get("exp"),
+    }
+    if await is_revoked(session, token):
+        logger.warning(f"/me request failed: token for user '{username}' has been revoked.")
+        raise _credentials_exception()
+
+    if user_id is not None:
+        user = await session.get(User, user_id)
+        if user is not None and user.username != username:
+            user = None
+    else:
+        user = (await session.exec(select(User).where(User.username == username))).first()
+    if user is None:
+        logger.warning(f"/me request failed: User '{username}' from token not found in DB.")
+        raise _credentials_exception("User not found")
+
+    identity["user_id"] = user.id
+    return identity
+
 # 新增：检查用户登录状态的接口
 @router.get("/me")
-def get_current_user(request: Request, session: Session = Depends(get_session)):
-    # 新增: 增加日志来调试 cookie 是否被接收到
-    logger.info(f"Received request for /me. Cookies: {request.cookies}")
+async def get_current_user(request: Request, session: AsyncSession = Depends(get_async_session)):
+    """
+    返回当前登录用户，同时作为所有受保护接口的鉴权依赖
 
+    已验证过的令牌在短时间内直接从令牌缓存返回，不再重复校验签名和查询数据库。
+    """
     token = request.cookies.get("access_token")
     if not token:
         logger.warning("/me request failed: No access_token cookie found.") # 新增: 记录失败原因
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Not authenticated",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            logger.warning(f"/me request failed: Invalid token payload (sub is missing). Payload: {payload}") # 新增
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Could not validate credentials",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-    except JWTError as e:
-        logger.error(f"/me request failed: JWT decoding error. Error: {e}") # 新增
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Could not validate credentials",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    user = session.exec(select(User).where(User.username == username)).first()
-    if user is None:
-        logger.warning(f"/me request failed: User '{username}' from token not found in DB.") # 新增
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="User not found",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+        raise _credentials_exception("Not authenticated")
+
+    identity = get_cached_identity(token)
+    if identity is None:
+        identity = await verify_token(token, session)
+        cache_identity(token, identity)
+        logger.debug(f"Authenticated user '{identity['username']}' and cached token.")
 
-    logger.info(f"Successfully authenticated user '{username}' for /me request.") # 新增
-    return {"username": user.username, "user_id": user.id}
\ No newline at end of file
+    return {"username": identity["username"], "user_id": identity["user_id"]}
@@ -0,0 +1,152 @@
+# services/ai_limits.py
+# AI 调用的并发控制
+# - SingleFlight: 相同的请求在执行中时，后来的请求直接等待同一个结果，而不是再发起一次远程调用
+# - ModelLimiter: 每个模型的并发上限 + 有界等待队列；队列已满或等待超时的请求立即被拒绝（AIOverloaded），
+#   不会在事件循环上无限堆积
+import asyncio
+import logging
+import threading
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class AIOverloaded(Exception):
+  """AI 调用已达到并发和排队上限"""
+
+
+class SingleFlight:
+  """
+  按键合并执行中的相同调用
+
+  实际调用在独立的 Task 中执行，发起者被取消（例如客户端断开）不会影响其他等待同一结果的请求。
+  """
+
+  def __init__(self):
+    self._calls: Dict[str, asyncio.Task] = {}
+    self.leaders = 0
+    self.coalesced = 0
+
+  async def run(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+    task = self._calls.get(key)
+    if task is not None and not task.done():
+      self.coalesced += 1
+      logger.info(f"合并相同的 AI 请求（{key[:12]}）")
+    else:
+      self.leaders += 1
+      task = asyncio.ensure_future(func())
+      self._calls[key] = task
+      task.add_done_callback(lambda done, key=key: self._finish(key, done))
+    return await asyncio.shield(task)
+
+  def _finish(self, key: str, task: asyncio.Task):
+    if self._calls.get(key) is task:
+      del self._calls[key]
+    if not task.cancelled():
+      task.exception()  # 所有等待者都已离开时，避免 "exception was never retrieved" 警告
+
+  def info(self) -> Dict[str, int]:
+    return {"in_flight": len(self._calls), "leaders": self.leaders, "coalesced": self.coalesced}
+
+
+class ModelLimiter:
+  """
+  单个模型的并发限制
+
+  Args:
+      max_concurrency: 同时进行的调用数上限
+      max_waiting: 并发已满时最多允许排队等待的请求数
+      queue_timeout: 排队等待的最长时间（秒），超时即拒绝
+  """
+
+  def __init__(self, max_concurrency: int, max_waiting: int, queue_timeout: float):
+    self.max_concurrency = max_concurrency
+    self.max_waiting = max_waiting
+    self.queue_timeout = queue_timeout
+    self.in_flight = 0
+    self._waiters: Deque[asyncio.Future] = deque()
+    self._lock = threading.Lock()
+    self.acquired = 0
+    self.rejected = 0
+    self.timed_out = 0
+
+  @property
+  def waiting(self) -> int:
+    return len(self._waiters)
+
+  def can_schedule(self) -> bool:
+    """是否可以立即执行或进入等待队列"""
+    return self.in_flight < self.max_concurrency or self.waiting < self.max_waiting
+
+  def try_acquire(self) -> bool:
+    """不等待地占用一个名额：并发未满时占用并返回 True，否则返回 False（不计入拒绝次数）"""
+    with self._lock:
+      if self.in_flight < self.max_concurrency:
+        self.in_flight += 1
+        self.acquired += 1
+        return True
+    return False
+
+  async def acquire(self):
+    with self._lock:
+      if self.in_flight < self.max_concurrency:
+        self.in_flight += 1
+        self.acquired += 1
+        return
+      if self.waiting >= self.max_waiting:
+        self.rejected += 1
+        raise AIOverloaded(f"AI 模型并发已满（{self.in_flight} 个执行中，{self.waiting} 个排队）")
+      waiter = asyncio.get_running_loop().create_future()
+      self._waiters.append(waiter)
+
+    try:
+      # release() 把名额直接转交给队首的等待者，in_flight 不变
+      await asyncio.wait_for(waiter, self.queue_timeout)
+    except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+      with self._lock:
+        granted = waiter.done() and not waiter.cancelled()
+        if not granted and waiter in self._waiters:
+          self._waiters.remove(waiter)
+      if granted:
+        self.release()  # 名额已转交但调用方已放弃，交还给下一个等待者
+      if isinstance(e, asyncio.TimeoutError):
+        self.timed_out += 1
+        self.rejected += 1
+        raise AIOverloaded(f"等待 AI 模型空闲超时（{self.queue_timeout} 秒）") from None
+      raise
+    self.acquired += 1
+
+  def release(self):
+    with self._lock:
+      while self._waiters:
+        waiter = self._waiters.popleft()
+        if not waiter.done():
+          waiter.set_result(None)
+          return
+      self.in_flight -= 1
+
+  async def __aenter__(self):
+    await self.acquire()
+    return self
+
+  async def __aexit__(self, exc_type, exc, tb):
+    self.release()
+
+  def info(self) -> Dict[str, Any]:
+    return {
+      "max_concurrency": self.max_concurrency,
+      "max_waiting": self.max_waiting,
+      "in_flight": self.in_flight,
+      "waiting": self.waiting,
+      "acquired": self.acquired,
+      "rejected": self.rejected,
+      "timed_out": self.timed_out,
+    }
+
+
+def create_limiter_factory(max_concurrency: int, max_waiting: int, queue_timeout: float) -> Optional[Callable[[], ModelLimiter]]:
+  """max_concurrency <= 0 表示不限制并发"""
+  if max_concurrency <= 0:
+    return None
+  return lambda: ModelLimiter(max_concurrency, max_waiting, queue_timeout)
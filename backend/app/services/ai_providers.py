@@ -0,0 +1,258 @@
+# services/ai_providers.py
+# AI 服务提供方：模型注册表通过提供方创建模型句柄，ai_service 不直接依赖具体的 SDK
+# - gemini: Google Gemini（google.generativeai）
+# - local:  本地模拟，不访问网络也不需要 API Key，用于压测和基准测试。
+#           延迟服从可配置的对数正态分布，可按比例注入普通错误和配额耗尽错误，
+#           日记和心情分析返回固定格式的 JSON，聊天支持流式输出
+#
+# 模型句柄只需要实现 ai_service 用到的接口：
+#   model_name、generate_content_async(prompt)、start_chat(history).send_message_async(message, stream=...)
+# 响应对象提供 .text；流式响应是逐段产出（带 .text 的）分块的异步迭代器
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import re
+import threading
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple, Type
+
+import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
+
+from app.config import settings
+from app.constants.ai_constants import (
+  CONVERSATION_SUMMARY_SYSTEM_INSTRUCTION,
+  DIARY_GENERATION_SYSTEM_INSTRUCTION,
+  MOOD_ANALYSIS_SYSTEM_INSTRUCTION
+)
+
+logger = logging.getLogger(__name__)
+
+# 流式输出时首个分块占总延迟的比例，其余时间平均分给后续分块
+STREAM_FIRST_CHUNK_RATIO = 0.3
+# 配额错误通常很快返回，只消耗一小部分模拟延迟
+QUOTA_ERROR_LATENCY_RATIO = 0.1
+
+_SUMMARY_INSTRUCTION_PREFIX = CONVERSATION_SUMMARY_SYSTEM_INSTRUCTION.partition("{max_words}")[0]
+
+
+class AIProvider:
+  """提供方接口"""
+
+  name = ""
+  # 表示配额耗尽的异常类型：_execute_genai_request_with_fallback 据此熔断并降级到下一个模型
+  quota_exceptions: Tuple[Type[Exception], ...] = (google_exceptions.ResourceExhausted,)
+
+  @property
+  def configured(self) -> bool:
+    """是否可以发起调用（例如已配置 API Key）"""
+    return True
+
+  def create_model(self, model_name: str, system_instruction: Optional[str] = None) -> Any:
+    """创建模型句柄（由模型注册表缓存）"""
+    raise NotImplementedError
+
+  def info(self) -> Dict[str, Any]:
+    return {"name": self.name, "configured": self.configured}
+
+
+class GeminiProvider(AIProvider):
+  """Google Gemini"""
+
+  name = "gemini"
+
+  def __init__(self, api_key: str):
+    self.api_key = api_key
+    if not api_key:
+      logger.warning("未检测到 GOOGLE_API_KEY")
+    else:
+      genai.configure(api_key=api_key)
+
+  @property
+  def configured(self) -> bool:
+    return bool(self.api_key)
+
+  def create_model(self, model_name: str, system_instruction: Optional[str] = None) -> Any:
+    return genai.GenerativeModel(model_name=model_name, system_instruction=system_instruction)
+
+
+class LocalProviderError(RuntimeError):
+  """本地模拟提供方注入的错误"""
+
+
+class LocalResponse:
+  def __init__(self, text: str):
+    self.text = text
+
+
+class LocalStreamResponse:
+  """流式响应：首个分块已在 send_message_async 中等待完毕，之后按间隔逐段产出"""
+
+  def __init__(self, chunks: List[str], interval: float):
+    self.chunks = chunks
+    self.interval = interval
+
+  async def __aiter__(self) -> AsyncIterator[LocalResponse]:
+    for index, chunk in enumerate(self.chunks):
+      if index:
+        await asyncio.sleep(self.interval)
+      yield LocalResponse(chunk)
+
+
+class LocalChat:
+  def __init__(self, model: "LocalModel", history: Optional[list]):
+    self.model = model
+    self.history = list(history or [])
+
+  async def send_message_async(self, content: str, safety_settings=None, stream: bool = False, **kwargs):
+    return await self.model.provider.respond(self.model, content, stream)
+
+
+class LocalModel:
+  def __init__(self, provider: "LocalProvider", model_name: str, system_instruction: Optional[str]):
+    self.provider = provider
+    self.model_name = model_name
+    self.system_instruction = system_instruction
+
+  async def generate_content_async(self, contents: str, stream: bool = False, **kwargs):
+    return await self.provider.respond(self, contents, stream)
+
+  def start_chat(self, history: Optional[list] = None) -> LocalChat:
+    return LocalChat(self, history)
+
+
+def _stable_fraction(text: str) -> float:
+  """把文本映射到 [0, 1) 内的固定值：相同的输入总是得到相同的模拟结果"""
+  return int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:8], 16) / 0x100000000
+
+
+def _split_chunks(text: str, size: int = 12) -> List[str]:
+  return [text[index:index + size] for index in range(0, len(text), size)] or [""]
+
+
+class LocalProvider(AIProvider):
+  """
+  本地模拟提供方
+
+  Args:
+      latency_ms: 模拟延迟的中位数（毫秒）
+      latency_sigma: 对数正态分布的 sigma，0 表示固定延迟，越大长尾越明显
+      error_rate: 注入普通错误的概率
+      quota_error_rate: 注入配额耗尽错误的概率
+      exhausted_models: 总是返回配额耗尽的模型（用于验证熔断和降级）
+      seed: 随机数种子，设置后延迟和错误注入的序列可复现
+  """
+
+  name = "local"
+
+  def __init__(
+      self,
+      latency_ms: float = 800.0,
+      latency_sigma: float = 0.5,
+      error_rate: float = 0.0,
+      quota_error_rate: float = 0.0,
+      exhausted_models: Optional[List[str]] = None,
+      seed: Optional[int] = None
+  ):
+    self.latency_ms = latency_ms
+    self.latency_sigma = latency_sigma
+    self.error_rate = error_rate
+    self.quota_error_rate = quota_error_rate
+    self.exhausted_models = set(exhausted_models or [])
+    self._random = random.Random(seed)
+    self._lock = threading.Lock()
+    self.calls = 0
+    self.injected_errors = 0
+    self.injected_quota_errors = 0
+
+  def create_model(self, model_name: str, system_instruction: Optional[str] = None) -> LocalModel:
+    return LocalModel(self, model_name, system_instruction)
+
+  def _sample(self) -> Tuple[float, float]:
+    """抽取一次调用的 (延迟秒数, 用于错误注入的随机数)"""
+    with self._lock:
+      self.calls += 1
+      latency = self.latency_ms
+      if self.latency_sigma > 0:
+        latency *= self._random.lognormvariate(0.0, self.latency_sigma)
+      return latency / 1000, self._random.random()
+
+  async def respond(self, model: LocalModel, prompt: str, stream: bool):
+    latency, roll = self._sample()
+    if model.model_name in self.exhausted_models or roll < self.quota_error_rate:
+      await asyncio.sleep(latency * QUOTA_ERROR_LATENCY_RATIO)
+      with self._lock:
+        self.injected_quota_errors += 1
+      raise google_exceptions.ResourceExhausted(f"Local provider: quota exhausted for {model.model_name}")
+    if roll < self.quota_error_rate + self.error_rate:
+      await asyncio.sleep(latency)
+      with self._lock:
+        self.injected_errors += 1
+      raise LocalProviderError(f"Local provider: injected failure for {model.model_name}")
+
+    text = self.canned_text(model.system_instruction, prompt)
+    if not stream:
+      await asyncio.sleep(latency)
+      return LocalResponse(text)
+    # 与 Gemini 一致：stream=True 时等到首个分块返回
+    chunks = _split_chunks(text)
+    await asyncio.sleep(latency * STREAM_FIRST_CHUNK_RATIO)
+    interval = latency * (1 - STREAM_FIRST_CHUNK_RATIO) / max(1, len(chunks) - 1)
+    return LocalStreamResponse(chunks, interval)
+
+  @staticmethod
+  def canned_text(system_instruction: Optional[str], prompt: str) -> str:
+    """按系统指令返回固定格式的结果，内容由提示词决定"""
+    fraction = _stable_fraction(prompt)
+    if system_instruction == DIARY_GENERATION_SYSTEM_INSTRUCTION:
+      match = re.search(r"\d{4}-\d{2}-\d{2}", prompt)
+      date = match.group(0) if match else datetime.now().strftime("%Y-%m-%d")
+      draft = {
+        "title": "本地模拟的旅行日记",
+        "dateStart": date,
+        "dateEnd": date,
+        "location": "Hangzhou, China",
+        "coordinates": {"lat": round(30.25 + fraction / 10, 4), "lng": round(120.15 + fraction / 10, 4)},
+        "transportation": "Walking",
+        "content": f"✨ 本地模拟生成的日记内容。\n{prompt[-200:]}",
+      }
+      return f"```json\n{json.dumps(draft, ensure_ascii=False)}\n```"
+    if system_instruction == MOOD_ANALYSIS_SYSTEM_INSTRUCTION:
+      return json.dumps({"mood_vector": round(0.1 + fraction * 0.8, 2), "mood_reason": "本地模拟分析"}, ensure_ascii=False)
+    if system_instruction and system_instruction.startswith(_SUMMARY_INSTRUCTION_PREFIX):
+      return f"本地模拟摘要：{prompt[-300:]}"
+    return f"（本地模拟回复）关于「{prompt[:30]}」，这里是一段用于压测的固定建议：先确定路线，再安排住宿和交通。"
+
+  def info(self) -> Dict[str, Any]:
+    with self._lock:
+      return {
+        **super().info(),
+        "latency_ms": self.latency_ms,
+        "latency_sigma": self.latency_sigma,
+        "error_rate": self.error_rate,
+        "quota_error_rate": self.quota_error_rate,
+        "exhausted_models": sorted(self.exhausted_models),
+        "calls": self.calls,
+        "injected_errors": self.injected_errors,
+        "injected_quota_errors": self.injected_quota_errors,
+      }
+
+
+def create_provider(name: Optional[str] = None) -> AIProvider:
+  """按配置创建提供方，默认读取 settings.AI_PROVIDER"""
+  name = name or settings.AI_PROVIDER
+  if name == "gemini":
+    return GeminiProvider(settings.GOOGLE_API_KEY)
+  if name == "local":
+    logger.warning("使用本地模拟的 AI 提供方，所有 AI 结果均为模拟数据")
+    return LocalProvider(
+      latency_ms=settings.AI_LOCAL_LATENCY_MS,
+      latency_sigma=settings.AI_LOCAL_LATENCY_SIGMA,
+      error_rate=settings.AI_LOCAL_ERROR_RATE,
+      quota_error_rate=settings.AI_LOCAL_QUOTA_ERROR_RATE,
+      exhausted_models=[m.strip() for m in settings.AI_LOCAL_EXHAUSTED_MODELS.split(",") if m.strip()],
+      seed=settings.AI_LOCAL_SEED,
+    )
+  raise ValueError(f"未知的 AI 提供方: {name}")
@@ -2,19 +2,27 @@
 import os
 import google.generativeai as genai
 from google.generativeai.types import HarmCategory, HarmBlockThreshold
-from google.api_core import exceptions as google_exceptions
 import logging
 from app.constants.ai_constants import (
   TRAVEL_ADVICE_SYSTEM_INSTRUCTION,
   AI_MODEL_FALLBACK_LIST,
   DIARY_GENERATION_SYSTEM_INSTRUCTION,
-  MOOD_ANALYSIS_SYSTEM_INSTRUCTION
+  MOOD_ANALYSIS_SYSTEM_INSTRUCTION,
+  CONVERSATION_SUMMARY_SYSTEM_INSTRUCTION
 )
+import hashlib
 import json
 import re
+import time
+import unicodedata
+from contextlib import aclosing
 from datetime import datetime
 from app.config import settings
-from typing import Callable, Any
+from app.services.ai_limits import AIOverloaded, ModelLimiter, SingleFlight
+from app.services.ai_providers import create_provider
+from app.services.cache import create_cache
+from app.services.model_registry import create_model_registry
+from typing import AsyncIterator, Callable, Any, List, NamedTuple, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
@@ -23,61 +31,177 @@ if settings.ENVIRONMENT == "development":
   os.environ["http_proxy"] = "http://127.0.0.1:7890"
   pass
 
-# 配置 API Key
-GOOGLE_API_KEY = settings.GOOGLE_API_KEY
-if not GOOGLE_API_KEY:
-  logger.warning("未检测到 GOOGLE_API_KEY")
-else:
-  genai.configure(api_key=GOOGLE_API_KEY)
+# AI 服务提供方：gemini 或本地模拟（AI_PROVIDER=local）
+ai_provider = create_provider()
+
+# 模型注册表：缓存模型句柄，记录每个模型的调用结果，配额耗尽或连续失败的模型熔断一段时间
+model_registry = create_model_registry(AI_MODEL_FALLBACK_LIST, ai_provider.create_model)
+
+# 合并执行中的相同生成请求（相同系统指令 + 规范化提示词）
+ai_single_flight = SingleFlight()
+
+# AI 生成结果缓存：按 (系统指令, 模型, 规范化后的提示词) 内容寻址，默认存放在本地 SQLite 文件中
+# 本地模拟的结果使用单独的命名空间，不会混入真实模型的缓存
+ai_result_cache = create_cache(
+  "ai_results" if ai_provider.name == "gemini" else f"ai_results_{ai_provider.name}",
+  maxsize=settings.AI_CACHE_MAX_ENTRIES,
+  ttl=settings.AI_CACHE_TTL_HOURS * 60 * 60,
+  backend=settings.AI_CACHE_BACKEND
+)
+
+
+class AIText(NamedTuple):
+  """一次生成的文本结果"""
+  text: str
+  model_name: str
+  cache_key: str
+  cached: bool
+
+
+def normalize_prompt(prompt: str) -> str:
+  """
+  规范化提示词：Unicode NFKC、去掉首尾空白、合并连续空白
+
+  不忽略大小写：大小写可能改变提示词的含义（专有名词、缩写），模型的回答也可能不同。
+  """
+  return " ".join(unicodedata.normalize("NFKC", prompt).split())
+
+
+# 模型输出中的 JSON 对象（可能包在 ```json 代码块或说明文字中）
+JSON_OBJECT_PATTERN = re.compile(r"\{.*\}", re.DOTALL)
+
+
+def extract_json_text(text: str) -> Optional[str]:
+  """取出模型输出中第一个 { 到最后一个 } 之间的文本，没有时返回 None"""
+  match = JSON_OBJECT_PATTERN.search(text)
+  return match.group(0) if match else None
+
+
+def ai_cache_key(system_instruction: Optional[str], model_name: str, prompt: str) -> str:
+  payload = json.dumps([system_instruction or "", model_name, normalize_prompt(prompt)], ensure_ascii=False)
+  return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+async def _model_slots(candidates: List[str], skipped: dict) -> AsyncIterator[Tuple[str, Optional[ModelLimiter]]]:
+  """
+  按顺序产出已经占到并发名额的模型
+
+  先不等待地依次尝试全部候选模型，都满载时才按顺序进入各模型的等待队列：
+  排在前面的模型满载时，空闲的后备模型立即接手，而不是先在前面的模型上排队等到超时。
+  并发和排队都已满（或排队超时）的模型被跳过，并在 skipped["overloaded"] 中记录。
+  """
+  busy = []
+  for model_name in candidates:
+    limiter = model_registry.limiter(model_name)
+    if limiter is None or limiter.try_acquire():
+      yield model_name, limiter
+    else:
+      busy.append((model_name, limiter))
+
+  for model_name, limiter in busy:
+    if not limiter.can_schedule():
+      skipped["overloaded"] = True
+      continue
+    try:
+      await limiter.acquire()
+    except AIOverloaded as e:
+      logger.warning(f"Model {model_name} is busy: {e}")
+      skipped["overloaded"] = True
+      continue
+    yield model_name, limiter
+
+
+def _slot_releaser(limiter: Optional[ModelLimiter]) -> Callable[[], None]:
+  """返回只生效一次的释放函数"""
+  released = False
+
+  def release():
+    nonlocal released
+    if limiter is not None and not released:
+      released = True
+      limiter.release()
+
+  return release
 
 
 async def _execute_genai_request_with_fallback(
     generation_func: Callable,
-    system_instruction: str = None
+    system_instruction: str = None,
+    with_model_name: bool = False,
+    stream: bool = False
 ) -> Any:
   """
   执行 GenAI 请求，并在遇到配额错误时自动降级到下一个可用模型。
 
+  模型句柄由当前的提供方（ai_provider）创建，配额错误的类型也由提供方决定。
+
+  模型的尝试顺序由 model_registry 按健康度决定，熔断中的模型被跳过，
+  每次调用的结果（成功 / 配额耗尽 / 超时 / 其他错误）都会记录到注册表。
+  每个模型的并发数受限：先尝试有空闲名额的模型，都满载时再排队；所有可用模型的并发和排队都已满时抛出 AIOverloaded。
+
   Args:
       generation_func: 一个接受 model_name 作为参数并返回 GenAI 响应的 lambda 函数。
       system_instruction: 用于初始化模型的系统指令。
+      with_model_name: 为 True 时返回 (响应对象, 实际使用的模型名)。
+      stream: 响应是流式的。成功时不释放并发名额，返回 (响应对象, 实际使用的模型名, release)，
+              调用方在读完或关闭流时调用 release()。
 
   Returns:
       成功时的 GenAI 响应对象。
 
   Raises:
+      AIOverloaded: 所有可用模型的并发和排队都已满。
       Exception: 如果所有模型都尝试失败，则抛出最后一个遇到的异常。
   """
-  if not GOOGLE_API_KEY:
+  if not ai_provider.configured:
     logger.error("API Key missing, cannot execute GenAI request.")
     raise ValueError("Server is not configured with an AI API Key.")
 
   last_exception = None
-  for model_name in AI_MODEL_FALLBACK_LIST:
-    try:
-      logger.info(f"Attempting to use model: {model_name}")
-      model = genai.GenerativeModel(
-        model_name=model_name,
-        system_instruction=system_instruction
-      )
-      response = await generation_func(model)
-      logger.info(f"Successfully received response from model: {model_name}")
-      return response
-
-    except google_exceptions.ResourceExhausted as e:
-      logger.warning(f"Quota exceeded for model {model_name}. Details: {str(e)[:150]}...")
-      logger.warning(f"Falling back to the next available model...")
-      last_exception = e
-      continue
+  skipped = {"overloaded": False}
+  async with aclosing(_model_slots(model_registry.candidates(), skipped)) as slots:
+    async for model_name, limiter in slots:
+      release = _slot_releaser(limiter)
+      try:
+        if not model_registry.try_acquire(model_name):
+          continue
+        started = time.perf_counter()
+        try:
+          logger.info(f"Attempting to use model: {model_name}")
+          model = model_registry.get_model(model_name, system_instruction)
+          response = await generation_func(model)
+          model_registry.record_success(model_name, (time.perf_counter() - started) * 1000)
+          logger.info(f"Successfully received response from model: {model_name}")
+          if stream:
+            # 名额交给调用方，流结束时才释放
+            stream_release, release = release, None
+            return response, model_name, stream_release
+          return (response, model_name) if with_model_name else response
+
+        except ai_provider.quota_exceptions as e:
+          model_registry.record_quota_exhausted(model_name, e)
+          logger.warning(f"Quota exceeded for model {model_name}. Details: {str(e)[:150]}...")
+          logger.warning(f"Falling back to the next available model...")
+          last_exception = e
+          continue
 
-    except Exception as e:
-      logger.error(f"An unexpected error occurred with model {model_name}: {e}", exc_info=True)
-      if "403" in str(e) or "User location is not supported" in str(e):
-        raise RuntimeError("AI service is not available in the current region (Region Error).")
-      if "504" in str(e) or "timeout" in str(e).lower():
-        raise RuntimeError("Connection to AI server timed out, please check network settings.")
-      raise e
+        except Exception as e:
+          logger.error(f"An unexpected error occurred with model {model_name}: {e}", exc_info=True)
+          if "403" in str(e) or "User location is not supported" in str(e):
+            model_registry.record_error(model_name, e)
+            raise RuntimeError("AI service is not available in the current region (Region Error).")
+          if "504" in str(e) or "timeout" in str(e).lower():
+            model_registry.record_timeout(model_name, e)
+            raise RuntimeError("Connection to AI server timed out, please check network settings.")
+          model_registry.record_error(model_name, e)
+          raise e
+      finally:
+        if release is not None:
+          release()
 
+  if skipped["overloaded"]:
+    logger.warning("All available AI models are at their concurrency limit.")
+    raise AIOverloaded("AI service is busy, please retry shortly.")
   logger.error("All AI models in the fallback list have failed.")
   if last_exception:
     raise last_exception
@@ -85,33 +209,78 @@ async def _execute_genai_request_with_fallback(
     raise RuntimeError("AI service is currently unavailable after trying all models.")
 
 
-async def get_travel_advice(frontend_messages: list):
+async def _generate_text(
+    generation_func: Callable,
+    system_instruction: str,
+    prompt: str,
+    bypass_cache: bool = False
+) -> AIText:
+  """
+  生成文本，优先返回缓存结果
+
+  按降级列表的顺序查找各模型的缓存结果，命中时不发起任何网络请求。
+  新生成的结果不会立即写入缓存，调用方确认结果可用后调用 _remember() 写入，避免缓存无法解析的输出。
+  bypass_cache=True 时跳过查找（例如用户点击“重新生成”），新结果仍可写入缓存覆盖旧结果。
+  缓存未命中时，相同的请求如果正在执行，直接等待同一个结果（single-flight）。
+  """
+  if not bypass_cache:
+    for model_name in AI_MODEL_FALLBACK_LIST:
+      cache_key = ai_cache_key(system_instruction, model_name, prompt)
+      cached_text = ai_result_cache.get(cache_key)
+      if cached_text is not None:
+        logger.info(f"AI result cache hit (model: {model_name})")
+        return AIText(cached_text, model_name, cache_key, True)
+
+  async def generate() -> AIText:
+    response, model_name = await _execute_genai_request_with_fallback(
+      generation_func=generation_func,
+      system_instruction=system_instruction,
+      with_model_name=True
+    )
+    return AIText(response.text, model_name, ai_cache_key(system_instruction, model_name, prompt), False)
+
+  return await ai_single_flight.run(ai_cache_key(system_instruction, "*", prompt), generate)
+
+
+def _remember(result: AIText):
+  """把确认可用的新结果写入缓存"""
+  if not result.cached:
+    ai_result_cache.set(result.cache_key, result.text)
+
+
+# 旅行建议对话的安全设置
+CHAT_SAFETY_SETTINGS = {
+  HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE,
+  HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE,
+  HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE,
+  HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE,
+}
+
+
+def _build_chat_history(frontend_messages: list):
+  """把前端消息列表转换为 (Gemini 历史记录, 最后一条用户消息)"""
+  gemini_history = []
+  for msg in frontend_messages[:-1]:
+    role = "user" if msg['role'] == "user" else "model"
+    gemini_history.append({"role": role, "parts": [msg['content']]})
+  return gemini_history, frontend_messages[-1]['content']
+
+
+async def get_travel_advice(frontend_messages: list, fallback: bool = True):
   """
   调用 Gemini 模型获取旅行建议，并支持自动降级。
+
+  fallback=False 时失败直接抛出异常，否则返回一段致歉文本。
   """
   try:
     logger.info("Preparing to call Gemini API for travel advice...")
 
-    gemini_history = []
-    history_messages = frontend_messages[:-1]
-    last_message = frontend_messages[-1]['content']
-
-    for msg in history_messages:
-      role = "user" if msg['role'] == "user" else "model"
-      gemini_history.append({"role": role, "parts": [msg['content']]})
+    gemini_history, last_message = _build_chat_history(frontend_messages)
 
     async def generation_logic(model: genai.GenerativeModel):
       chat = model.start_chat(history=gemini_history)
       logger.info(f"Sending message to Gemini ({model.model_name}): {last_message[:30]}...")
-      return await chat.send_message_async(
-        last_message,
-        safety_settings={
-          HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE,
-          HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE,
-          HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE,
-          HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE,
-        }
-      )
+      return await chat.send_message_async(last_message, safety_settings=CHAT_SAFETY_SETTINGS)
 
     response = await _execute_genai_request_with_fallback(
       generation_func=generation_logic,
@@ -121,14 +290,62 @@ async def get_travel_advice(frontend_messages: list):
     logger.info("Gemini API call successful.")
     return response.text
 
+  except AIOverloaded:
+    raise
   except Exception as e:
     logger.error(f"Failed to get travel advice: {e}", exc_info=True)
-    return f"抱歉，AI 暂时有点累，请稍后再试。(Error: {e})"
+    if not fallback:
+      raise
+    return travel_advice_apology(e)
 
 
-async def generate_diary_draft(user_prompt: str):
+def travel_advice_apology(error: Exception) -> str:
+  """获取旅行建议失败时返回给用户的文本"""
+  return f"抱歉，AI 暂时有点累，请稍后再试。(Error: {error})"
+
+
+async def stream_travel_advice(frontend_messages: list) -> AsyncIterator[str]:
+  """
+  流式获取旅行建议，模型每生成一段文本就立即产出
+
+  降级只发生在第一段文本之前：stream=True 时 send_message_async 会等到首个分块返回，
+  配额耗尽等错误在此时抛出，由 _execute_genai_request_with_fallback 切换到下一个模型；
+  开始输出后出现的错误直接抛给调用方。调用方提前关闭生成器（客户端断开）时，上游流随之停止读取。
+  """
+  gemini_history, last_message = _build_chat_history(frontend_messages)
+
+  async def generation_logic(model: genai.GenerativeModel):
+    chat = model.start_chat(history=gemini_history)
+    logger.info(f"Streaming message to Gemini ({model.model_name}): {last_message[:30]}...")
+    return await chat.send_message_async(last_message, safety_settings=CHAT_SAFETY_SETTINGS, stream=True)
+
+  response, model_name, release = await _execute_genai_request_with_fallback(
+    generation_func=generation_logic,
+    system_instruction=TRAVEL_ADVICE_SYSTEM_INSTRUCTION,
+    stream=True
+  )
+  # 模型的并发名额一直占用到流读完，或调用方关闭生成器（客户端断开）为止
+  chunks = 0
+  try:
+    async for chunk in response:
+      try:
+        text = chunk.text
+      except ValueError:
+        # 被安全策略拦截或没有文本内容的分块
+        continue
+      if text:
+        chunks += 1
+        yield text
+  finally:
+    release()
+  logger.info(f"Streaming travel advice finished (model: {model_name}, chunks: {chunks})")
+
+
+async def generate_diary_draft(user_prompt: str, bypass_cache: bool = False):
   """
   根据用户描述生成日记草稿 JSON，并支持自动降级。
+
+  相同日期、相同描述的请求直接返回缓存的草稿；bypass_cache=True 时强制重新生成。
   """
   try:
     today_str = datetime.now().strftime("%Y-%m-%d")
@@ -144,18 +361,20 @@ async def generate_diary_draft(user_prompt: str):
       logger.debug(f"Full prompt for diary generation:\n---\n{full_prompt}\n---")
       return await model.generate_content_async(full_prompt)
 
-    response = await _execute_genai_request_with_fallback(
+    result = await _generate_text(
       generation_func=generation_logic,
-      system_instruction=DIARY_GENERATION_SYSTEM_INSTRUCTION
+      system_instruction=DIARY_GENERATION_SYSTEM_INSTRUCTION,
+      prompt=full_prompt,
+      bypass_cache=bypass_cache
     )
-    text = response.text
-    match = re.search(r"\{.*\}", text, re.DOTALL)
-    if not match:
+    text = result.text
+    json_str = extract_json_text(text)
+    if json_str is None:
       logger.error(f"AI response did not contain a valid JSON object. Raw response: {text}")
       raise ValueError("AI response did not contain a valid JSON object.")
-    json_str = match.group(0)
 
     data = json.loads(json_str)
+    _remember(result)
     return data
 
   except json.JSONDecodeError as e:
@@ -166,9 +385,12 @@ async def generate_diary_draft(user_prompt: str):
     raise e
 
 
-async def analyze_mood_text(text: str):
+async def analyze_mood_text(text: str, fallback: bool = True, bypass_cache: bool = False):
   """
   分析心情文本，返回情感向量，并支持自动降级。
+
+  fallback=False 时失败直接抛出异常（由后台队列负责重试），否则返回中性的默认结果。
+  相同（规范化后）的文本直接返回缓存的分析结果。
   """
   try:
     async def generation_logic(model: genai.GenerativeModel):
@@ -176,19 +398,56 @@ async def analyze_mood_text(text: str):
       return await model.generate_content_async(text)
 
     # [确认] 此处实现正确，使用了 MOOD_ANALYSIS_SYSTEM_INSTRUCTION
-    response = await _execute_genai_request_with_fallback(
+    result = await _generate_text(
       generation_func=generation_logic,
-      system_instruction=MOOD_ANALYSIS_SYSTEM_INSTRUCTION
+      system_instruction=MOOD_ANALYSIS_SYSTEM_INSTRUCTION,
+      prompt=text,
+      bypass_cache=bypass_cache
     )
-    result_text = response.text
+    result_text = result.text
 
-    match = re.search(r"\{.*\}", result_text, re.DOTALL)
-    if not match:
+    json_str = extract_json_text(result_text)
+    if json_str is None:
       logger.error(f"Mood analysis response did not contain JSON. Raw: {result_text}")
+      if not fallback:
+        raise ValueError("Mood analysis response did not contain JSON.")
       return {"mood_vector": 0.5, "mood_reason": "分析失败(格式错误)"}
-    json_str = match.group(0)
     data = json.loads(json_str)
+    _remember(result)
     return data
   except Exception as e:
     logger.error(f"Mood Analysis Failed: {e}", exc_info=True)
+    if not fallback:
+      raise
     return {"mood_vector": 0.5, "mood_reason": "分析失败"}
+
+
+async def summarize_conversation(previous_summary: str, turns: list, max_words: int) -> str:
+  """
+  把即将移出上下文窗口的对话轮次合并进滚动摘要
+
+  Args:
+      previous_summary: 之前的摘要（可以为空）
+      turns: [{"role", "content"}]，按时间顺序
+      max_words: 摘要的长度上限（提示给模型）
+  """
+  transcript = "\n".join(
+    f"{'Traveller' if turn['role'] == 'user' else 'Bee'}: {turn['content']}" for turn in turns
+  )
+  prompt = f"Previous summary:\n{previous_summary or '(empty)'}\n\nTurns to fold in:\n{transcript}"
+  system_instruction = CONVERSATION_SUMMARY_SYSTEM_INSTRUCTION.format(max_words=max_words)
+
+  async def generation_logic(model: genai.GenerativeModel):
+    logger.info(f"Summarizing {len(turns)} conversation turns with model {model.model_name}...")
+    return await model.generate_content_async(prompt)
+
+  result = await _generate_text(
+    generation_func=generation_logic,
+    system_instruction=system_instruction,
+    prompt=prompt
+  )
+  summary = result.text.strip()
+  if not summary:
+    raise ValueError("AI returned an empty conversation summary.")
+  _remember(result)
+  return summary
@@ -0,0 +1,88 @@
+# services/auth_cache.py
+# 已验证令牌缓存：令牌 -> 用户身份（username / user_id）
+# - 命中时跳过 JWT 签名校验和按用户名查库，只需一次哈希和一次缓存读取
+# - 条目的有效期不超过令牌本身的过期时间
+# - 撤销：登出时把令牌摘要写入 revoked_token 表，保存到令牌过期为止。
+#   表由所有 worker 共用，不按容量淘汰；缓存未命中的完整校验都会查询它。
+#   当前 worker 撤销时同时删除本地缓存；其他 worker 中已缓存的身份最多再保留 TOKEN_CACHE_TTL_SECONDS
+#   （CACHE_BACKEND=redis 时令牌缓存本身是共享的，删除对所有 worker 立即生效）
+import hashlib
+import time
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import delete
+from sqlalchemy.exc import IntegrityError
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.config import settings
+from app.models import RevokedToken
+from app.services.cache import create_cache
+
+token_cache = create_cache(
+  "auth_tokens", maxsize=settings.TOKEN_CACHE_MAX_ENTRIES, ttl=settings.TOKEN_CACHE_TTL_SECONDS
+)
+
+
+def token_key(token: str) -> str:
+  """缓存键使用令牌的 SHA-256 摘要，不在缓存中保存令牌原文"""
+  return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def _remaining_seconds(expires_at: Optional[float]) -> Optional[float]:
+  return expires_at - time.time() if expires_at is not None else None
+
+
+async def is_revoked(session: AsyncSession, token: str) -> bool:
+  """令牌是否已被撤销（按主键读取 revoked_token 表）"""
+  return await session.get(RevokedToken, token_key(token)) is not None
+
+
+def get_cached_identity(token: str) -> Optional[dict]:
+  """
+  返回缓存的用户身份，未命中或已过期时返回 None
+
+  Returns:
+      dict: {"username", "user_id", "expires_at"}
+  """
+  identity = token_cache.get(token_key(token))
+  if identity is None:
+    return None
+  remaining = _remaining_seconds(identity.get("expires_at"))
+  if remaining is not None and remaining <= 0:
+    token_cache.delete(token_key(token))
+    return None
+  return identity
+
+
+def cache_identity(token: str, identity: dict):
+  """缓存签名校验并确认用户存在后的身份，有效期不超过令牌剩余时间"""
+  remaining = _remaining_seconds(identity.get("expires_at"))
+  if remaining is not None and remaining <= 0:
+    return
+  ttl = settings.TOKEN_CACHE_TTL_SECONDS if remaining is None else min(settings.TOKEN_CACHE_TTL_SECONDS, remaining)
+  token_cache.set(token_key(token), identity, ttl=ttl)
+
+
+async def revoke_token(session: AsyncSession, token: str, expires_at: Optional[float] = None):
+  """
+  撤销单个令牌（登出），并顺带清理已过期的撤销记录
+
+  没有过期时间的令牌按最长有效期保存。
+  """
+  key = token_key(token)
+  token_cache.delete(key)
+  if expires_at is None:
+    expires_at = time.time() + settings.ACCESS_TOKEN_EXPIRE_DAYS * 24 * 60 * 60
+  if expires_at <= time.time():
+    return
+
+  now = datetime.now()
+  await session.exec(delete(RevokedToken).where(RevokedToken.expires_at <= now))
+  if await session.get(RevokedToken, key) is None:
+    session.add(RevokedToken(token_hash=key, expires_at=datetime.fromtimestamp(expires_at), revoked_at=now))
+  try:
+    await session.commit()
+  except IntegrityError:
+    # 同一令牌被并发撤销，已有记录即可
+    await session.rollback()
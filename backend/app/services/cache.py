@@ -0,0 +1,337 @@
+# services/cache.py
+# 通用缓存组件：容量上限 + 单条 TTL + O(1) LRU 淘汰 + 命中/未命中/淘汰计数
+# 后端可插拔：
+# - memory: 进程内 OrderedDict（默认）
+# - redis:  任何兼容 Redis 协议的服务（Redis / Valkey / KeyDB 等），多进程共享；需要安装 redis 包
+# - sqlite: 本地 SQLite 文件，重启后仍然有效，适合计算代价高、可长期复用的结果（如 AI 生成内容）
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class CacheStats:
+  """缓存计数器"""
+
+  def __init__(self):
+    self.hits = 0
+    self.misses = 0
+    self.sets = 0
+    self.evictions = 0
+    self.expirations = 0
+
+  @property
+  def hit_rate(self) -> float:
+    lookups = self.hits + self.misses
+    return self.hits / lookups if lookups else 0.0
+
+  def as_dict(self) -> Dict[str, Any]:
+    return {
+      "hits": self.hits,
+      "misses": self.misses,
+      "sets": self.sets,
+      "evictions": self.evictions,
+      "expirations": self.expirations,
+      "hit_rate": round(self.hit_rate, 4),
+    }
+
+
+class MemoryBackend:
+  """
+  进程内 LRU 后端
+
+  OrderedDict 按访问顺序排列，命中时 move_to_end，超出容量时 popitem(last=False) 淘汰最久未使用的一项，
+  两者都是 O(1)。过期项在被访问时惰性删除，或随 LRU 淘汰，不需要全量扫描。
+  """
+
+  def __init__(self, maxsize: int):
+    self.maxsize = maxsize
+    self._data: "OrderedDict[str, tuple]" = OrderedDict()
+    self._lock = threading.Lock()
+
+  def get(self, key: str, stats: CacheStats) -> Any:
+    with self._lock:
+      item = self._data.get(key, _MISSING)
+      if item is _MISSING:
+        return _MISSING
+      value, expires_at = item
+      if expires_at is not None and expires_at <= time.monotonic():
+        del self._data[key]
+        stats.expirations += 1
+        return _MISSING
+      self._data.move_to_end(key)
+      return value
+
+  def set(self, key: str, value: Any, ttl: Optional[float], stats: CacheStats):
+    expires_at = time.monotonic() + ttl if ttl else None
+    with self._lock:
+      self._data[key] = (value, expires_at)
+      self._data.move_to_end(key)
+      while len(self._data) > self.maxsize:
+        self._data.popitem(last=False)
+        stats.evictions += 1
+
+  def delete(self, key: str) -> bool:
+    with self._lock:
+      return self._data.pop(key, _MISSING) is not _MISSING
+
+  def clear(self):
+    with self._lock:
+      self._data.clear()
+
+  def size(self) -> int:
+    return len(self._data)
+
+
+class RedisBackend:
+  """
+  Redis 协议后端
+
+  值以 JSON 序列化存储，TTL 交给服务端（PX），容量上限由服务端的 maxmemory-policy（如 allkeys-lru）负责，
+  因此这里无法统计淘汰次数。client 可以是 redis.Redis，也可以是实现了 get/set/delete/scan_iter 的本地替身。
+  """
+
+  def __init__(self, client, namespace: str):
+    self.client = client
+    self.prefix = f"travel-globe:{namespace}:"
+
+  @classmethod
+  def from_url(cls, url: str, namespace: str) -> "RedisBackend":
+    try:
+      import redis
+    except ImportError as e:
+      raise RuntimeError("CACHE_BACKEND=redis 需要安装 redis 包: pip install redis") from e
+    return cls(redis.Redis.from_url(url), namespace)
+
+  def get(self, key: str, stats: CacheStats) -> Any:
+    raw = self.client.get(self.prefix + key)
+    if raw is None:
+      return _MISSING
+    return json.loads(raw)
+
+  def set(self, key: str, value: Any, ttl: Optional[float], stats: CacheStats):
+    px = int(ttl * 1000) if ttl else None
+    self.client.set(self.prefix + key, json.dumps(value), px=px)
+
+  def delete(self, key: str) -> bool:
+    return bool(self.client.delete(self.prefix + key))
+
+  def clear(self):
+    keys = list(self.client.scan_iter(match=self.prefix + "*"))
+    if keys:
+      self.client.delete(*keys)
+
+  def size(self) -> int:
+    return sum(1 for _ in self.client.scan_iter(match=self.prefix + "*"))
+
+
+class SQLiteBackend:
+  """
+  本地 SQLite 文件后端
+
+  每个命名空间一行一个键，值以 JSON 存储。过期时间使用墙上时钟（重启后仍然有效），读取时惰性删除；
+  每次命中更新 last_access，新增的键使条目数超出容量时按 last_access 淘汰最久未使用的条目（LRU）。
+
+  条目数在内存中增量维护，写入不需要 COUNT(*) 全表计数。多个进程共用同一个文件时各自的计数会有偏差，
+  因此每新增 maxsize / 10 个键按 COUNT(*) 校正一次，均摊到每次写入的代价是常数。
+  """
+
+  def __init__(self, path: str, namespace: str, maxsize: int):
+    self.path = path
+    self.namespace = namespace
+    self.maxsize = maxsize
+    self._lock = threading.Lock()
+    directory = os.path.dirname(path)
+    if directory:
+      os.makedirs(directory, exist_ok=True)
+    self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+    self._conn.execute("PRAGMA journal_mode=WAL")
+    self._conn.execute("PRAGMA synchronous=NORMAL")
+    self._conn.execute(
+      "CREATE TABLE IF NOT EXISTS cache_entry ("
+      " namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,"
+      " expires_at REAL, last_access REAL NOT NULL, PRIMARY KEY (namespace, key))"
+    )
+    self._conn.execute(
+      "CREATE INDEX IF NOT EXISTS idx_cache_entry_lru ON cache_entry (namespace, last_access)"
+    )
+    self._recount_every = max(1, maxsize // 10)
+    self._inserts_since_recount = 0
+    self._count = self._size_locked()
+
+  def get(self, key: str, stats: CacheStats) -> Any:
+    now = time.time()
+    with self._lock:
+      row = self._conn.execute(
+        "SELECT value, expires_at FROM cache_entry WHERE namespace = ? AND key = ?", (self.namespace, key)
+      ).fetchone()
+      if row is None:
+        return _MISSING
+      value, expires_at = row
+      if expires_at is not None and expires_at <= now:
+        cursor = self._conn.execute("DELETE FROM cache_entry WHERE namespace = ? AND key = ?", (self.namespace, key))
+        self._count -= cursor.rowcount
+        stats.expirations += 1
+        return _MISSING
+      self._conn.execute(
+        "UPDATE cache_entry SET last_access = ? WHERE namespace = ? AND key = ?", (now, self.namespace, key)
+      )
+    return json.loads(value)
+
+  def set(self, key: str, value: Any, ttl: Optional[float], stats: CacheStats):
+    now = time.time()
+    expires_at = now + ttl if ttl else None
+    with self._lock:
+      exists = self._conn.execute(
+        "SELECT 1 FROM cache_entry WHERE namespace = ? AND key = ?", (self.namespace, key)
+      ).fetchone() is not None
+      self._conn.execute(
+        "INSERT OR REPLACE INTO cache_entry (namespace, key, value, expires_at, last_access) VALUES (?, ?, ?, ?, ?)",
+        (self.namespace, key, json.dumps(value, ensure_ascii=False), expires_at, now)
+      )
+      if exists:
+        return  # 覆盖已有的键，条目数不变
+
+      self._count += 1
+      self._inserts_since_recount += 1
+      if self._inserts_since_recount >= self._recount_every:
+        self._count = self._size_locked()
+        self._inserts_since_recount = 0
+      overflow = self._count - self.maxsize
+      if overflow > 0:
+        cursor = self._conn.execute(
+          "DELETE FROM cache_entry WHERE namespace = ? AND key IN ("
+          " SELECT key FROM cache_entry WHERE namespace = ? ORDER BY last_access LIMIT ?)",
+          (self.namespace, self.namespace, overflow)
+        )
+        self._count -= cursor.rowcount
+        stats.evictions += cursor.rowcount
+
+  def delete(self, key: str) -> bool:
+    with self._lock:
+      cursor = self._conn.execute(
+        "DELETE FROM cache_entry WHERE namespace = ? AND key = ?", (self.namespace, key)
+      )
+      self._count -= cursor.rowcount
+      return cursor.rowcount > 0
+
+  def clear(self):
+    with self._lock:
+      self._conn.execute("DELETE FROM cache_entry WHERE namespace = ?", (self.namespace,))
+      self._count = 0
+      self._inserts_since_recount = 0
+
+  def _size_locked(self) -> int:
+    return self._conn.execute(
+      "SELECT COUNT(*) FROM cache_entry WHERE namespace = ?", (self.namespace,)
+    ).fetchone()[0]
+
+  def size(self) -> int:
+    with self._lock:
+      self._count = self._size_locked()
+      return self._count
+
+
+class Cache:
+  """带统计的缓存，对外屏蔽具体后端"""
+
+  def __init__(self, name: str, backend, default_ttl: Optional[float] = None):
+    self.name = name
+    self.backend = backend
+    self.default_ttl = default_ttl
+    self.stats = CacheStats()
+
+  def get(self, key: str, default: Any = None) -> Any:
+    try:
+      value = self.backend.get(key, self.stats)
+    except Exception as e:
+      logger.warning(f"读取缓存失败: cache={self.name}, key={key}, 错误: {str(e)}")
+      value = _MISSING
+    if value is _MISSING:
+      self.stats.misses += 1
+      return default
+    self.stats.hits += 1
+    return value
+
+  def set(self, key: str, value: Any, ttl: Optional[float] = None):
+    try:
+      self.backend.set(key, value, ttl if ttl is not None else self.default_ttl, self.stats)
+      self.stats.sets += 1
+    except Exception as e:
+      logger.warning(f"写入缓存失败: cache={self.name}, key={key}, 错误: {str(e)}")
+
+  def delete(self, key: str) -> bool:
+    try:
+      return self.backend.delete(key)
+    except Exception as e:
+      logger.warning(f"删除缓存失败: cache={self.name}, key={key}, 错误: {str(e)}")
+      return False
+
+  def clear(self):
+    self.backend.clear()
+
+  def __len__(self) -> int:
+    return self.backend.size()
+
+  def info(self) -> Dict[str, Any]:
+    return {
+      "name": self.name,
+      "backend": type(self.backend).__name__,
+      "size": len(self),
+      "maxsize": getattr(self.backend, "maxsize", None),
+      "default_ttl": self.default_ttl,
+      **self.stats.as_dict(),
+    }
+
+
+# ==================== 缓存注册表 ====================
+_caches: Dict[str, Cache] = {}
+
+
+def create_cache(name: str, maxsize: int, ttl: Optional[float] = None, backend: Optional[str] = None) -> Cache:
+  """
+  创建并注册一个缓存
+
+  Args:
+      name: 缓存名称（同时作为 Redis 的命名空间）
+      maxsize: 进程内后端的容量上限
+      ttl: 默认过期时间（秒），None 表示不过期
+      backend: "memory"、"redis" 或 "sqlite"，默认读取 settings.CACHE_BACKEND
+  """
+  backend = backend or settings.CACHE_BACKEND
+  if backend == "redis":
+    if not settings.CACHE_REDIS_URL:
+      raise RuntimeError("CACHE_BACKEND=redis 时必须配置 CACHE_REDIS_URL")
+    cache_backend = RedisBackend.from_url(settings.CACHE_REDIS_URL, name)
+  elif backend == "sqlite":
+    cache_backend = SQLiteBackend(settings.CACHE_SQLITE_PATH, name, maxsize)
+  elif backend == "memory":
+    cache_backend = MemoryBackend(maxsize)
+  else:
+    raise ValueError(f"未知的缓存后端: {backend}")
+
+  cache = Cache(name, cache_backend, default_ttl=ttl)
+  _caches[name] = cache
+  logger.info(f"创建缓存: name={name}, backend={backend}, maxsize={maxsize}, ttl={ttl}")
+  return cache
+
+
+def get_cache_info() -> Dict[str, Dict[str, Any]]:
+  """所有已注册缓存的状态和计数（用于监控）"""
+  return {name: cache.info() for name, cache in _caches.items()}
+
+
+def clear_all_caches():
+  """清空所有已注册缓存（测试与运维使用）"""
+  for cache in _caches.values():
+    cache.clear()
@@ -0,0 +1,248 @@
+# services/conversation_service.py
+# AI 对话上下文管理：服务端按会话ID保存对话，每次请求只携带有限的上下文
+# - 最近的消息在 token 预算内原样（过长的截断）发送
+# - 超出预算的较早轮次在后台合并进滚动摘要，摘要作为一对前置消息随请求发送
+# - 摘要完成后较早的消息从存储中移除，会话状态的大小和每次请求的大小都不随对话长度增长
+# - 会话ID由服务端签发并用 HMAC 绑定到所有者（登录用户或匿名会话），其他人提交的ID一律拒绝
+import asyncio
+import base64
+import hashlib
+import hmac
+import logging
+import math
+import secrets
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from app.config import settings
+from app.services.ai_service import summarize_conversation
+from app.services.cache import create_cache
+
+logger = logging.getLogger(__name__)
+
+# 摘要以一对前置消息的形式放在历史记录开头（Gemini 的历史记录需要从 user 开始、角色交替）
+SUMMARY_PREFIX = "Summary of our earlier conversation (for context):\n"
+SUMMARY_ACK = "Got it, I'll keep that in mind."
+
+Summarizer = Callable[[str, List[dict], int], Awaitable[str]]
+
+
+class ConversationNotFound(Exception):
+  """会话ID不是服务端为当前所有者签发的"""
+
+
+def _is_cjk(char: str) -> bool:
+  code = ord(char)
+  return (
+    0x3040 <= code <= 0x30FF  # 日文假名
+    or 0x3400 <= code <= 0x9FFF  # CJK 统一表意文字
+    or 0xAC00 <= code <= 0xD7AF  # 韩文
+    or 0xF900 <= code <= 0xFAFF
+    or 0xFF00 <= code <= 0xFFEF  # 全角符号
+  )
+
+
+def estimate_tokens(text: str) -> int:
+  """估算 token 数：中日韩字符每个约 1 个 token，其余字符约 4 个一个 token"""
+  cjk = sum(1 for char in text if _is_cjk(char))
+  return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+  """按估算的 token 数截断文本，截断时以省略号结尾"""
+  if estimate_tokens(text) <= max_tokens:
+    return text
+  used = 0.0
+  for index, char in enumerate(text):
+    used += 1 if _is_cjk(char) else 0.25
+    if used > max_tokens - 1:
+      return text[:index].rstrip() + "…"
+  return text
+
+
+def extractive_summary(previous_summary: str, turns: List[dict], max_tokens: int) -> str:
+  """AI 摘要失败时的兜底：保留之前的摘要，并附上每条消息的开头部分"""
+  lines = [previous_summary] if previous_summary else []
+  lines += [f"{turn['role']}: {truncate_to_tokens(turn['content'], 40)}" for turn in turns]
+  return truncate_to_tokens("\n".join(lines), max_tokens)
+
+
+class ConversationManager:
+  """
+  会话存储与上下文构建
+
+  Args:
+      store: 保存会话状态的缓存（会话ID -> {"summary": str, "messages": [...]}）
+      summarizer: (之前的摘要, 要合并的消息, 长度上限) -> 新摘要
+      token_budget: 每次请求携带的历史消息的估算 token 上限
+      message_max_tokens: 单条历史消息的长度上限
+      summary_max_tokens: 摘要的长度上限
+      secret: 签发会话ID使用的密钥
+  """
+
+  def __init__(
+      self,
+      store,
+      summarizer: Summarizer,
+      token_budget: int,
+      message_max_tokens: int,
+      summary_max_tokens: int,
+      secret: str
+  ):
+    self.store = store
+    self.summarizer = summarizer
+    self.token_budget = token_budget
+    self.message_max_tokens = message_max_tokens
+    self.summary_max_tokens = summary_max_tokens
+    self._secret = secret.encode("utf-8")
+    self._compacting: Set[str] = set()
+    self._tasks: Set[asyncio.Task] = set()
+    self.compactions = 0
+    self.summary_failures = 0
+
+  def _sign(self, token: str, owner: str) -> str:
+    digest = hmac.new(self._secret, f"{owner}:{token}".encode("utf-8"), hashlib.sha256).digest()[:16]
+    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode("ascii")
+
+  def new_id(self, owner: str) -> str:
+    """签发新的会话ID：随机部分 + 所有者签名（共 47 个字符）"""
+    token = secrets.token_urlsafe(18)
+    return f"{token}.{self._sign(token, owner)}"
+
+  def verify_id(self, conversation_id: str, owner: str) -> bool:
+    """会话ID是否由服务端为该所有者签发"""
+    token, _, signature = conversation_id.partition(".")
+    return bool(token) and hmac.compare_digest(signature, self._sign(token, owner))
+
+  def load(self, conversation_id: str, owner: str, seed: Optional[List[dict]] = None) -> dict:
+    """
+    读取会话；不存在（新会话、已过期或保存在其他 worker 的进程内缓存中）时以客户端提供的历史记录初始化
+
+    Raises:
+        ConversationNotFound: 会话ID不是为该所有者签发的
+    """
+    if not self.verify_id(conversation_id, owner):
+      raise ConversationNotFound(conversation_id)
+    state = self.store.get(conversation_id)
+    if state is None:
+      state = {"summary": "", "messages": [{"role": m["role"], "content": m["content"]} for m in seed or []]}
+    return state
+
+  def _fit_recent(self, messages: List[dict]) -> List[dict]:
+    """从最新的消息往前取，直到用完 token 预算；返回截断后的消息（按时间顺序）"""
+    recent = []
+    used = 0
+    for message in reversed(messages):
+      content = truncate_to_tokens(message["content"], self.message_max_tokens)
+      cost = estimate_tokens(content)
+      if used + cost > self.token_budget:
+        break
+      recent.append({"role": message["role"], "content": content})
+      used += cost
+    recent.reverse()
+    # 历史记录需要从 user 消息开始
+    while recent and recent[0]["role"] != "user":
+      recent.pop(0)
+    return recent
+
+  def build_messages(self, state: dict, new_message: dict) -> List[dict]:
+    """构建发送给模型的消息列表：摘要 + 预算内的最近消息 + 新消息"""
+    context = []
+    if state["summary"]:
+      context += [
+        {"role": "user", "content": SUMMARY_PREFIX + state["summary"]},
+        {"role": "assistant", "content": SUMMARY_ACK},
+      ]
+    context += self._fit_recent(state["messages"])
+    context.append(new_message)
+    return context
+
+  def _overflow(self, state: dict) -> int:
+    """超出预算、需要合并进摘要的较早消息条数"""
+    return len(state["messages"]) - len(self._fit_recent(state["messages"]))
+
+  def record_turn(self, conversation_id: str, state: dict, user_message: dict, reply: str):
+    """
+    保存一轮对话；有消息超出预算时在后台更新摘要
+
+    追加到重新读取的最新状态上，而不是写回请求开始时读到的 state：
+    同一会话的并发请求和后台摘要在此期间写入的内容不会被覆盖。
+    读取到写入之间没有 await，在同一个进程内不会与其他协程交错。
+    """
+    latest = self.store.get(conversation_id) or state
+    latest = {**latest, "messages": latest["messages"] + [
+      {"role": "user", "content": user_message["content"]},
+      {"role": "assistant", "content": reply},
+    ]}
+    self.store.set(conversation_id, latest)
+    if self._overflow(latest) > 0:
+      self.schedule_compaction(conversation_id)
+
+  def schedule_compaction(self, conversation_id: str):
+    if conversation_id in self._compacting:
+      return
+    self._compacting.add(conversation_id)
+    task = asyncio.create_task(self.compact(conversation_id))
+    self._tasks.add(task)
+    task.add_done_callback(self._tasks.discard)
+
+  async def compact(self, conversation_id: str):
+    """把超出预算的较早消息合并进摘要，并从会话中移除"""
+    self._compacting.add(conversation_id)
+    try:
+      state = self.store.get(conversation_id)
+      if state is None:
+        return
+      overflow = self._overflow(state)
+      if overflow <= 0:
+        return
+      turns = state["messages"][:overflow]
+      try:
+        summary = await self.summarizer(state["summary"], turns, self.summary_max_tokens)
+      except Exception as e:
+        logger.warning(f"会话 {conversation_id} 的 AI 摘要失败，使用摘录代替: {str(e)}")
+        self.summary_failures += 1
+        summary = extractive_summary(state["summary"], turns, self.summary_max_tokens)
+
+      # 摘要期间会话可能追加了新消息（只会追加），重新读取后移除已合并的部分
+      latest = self.store.get(conversation_id) or state
+      self.store.set(conversation_id, {
+        **latest,
+        "summary": truncate_to_tokens(summary, self.summary_max_tokens),
+        "messages": latest["messages"][overflow:],
+      })
+      self.compactions += 1
+      logger.info(f"会话 {conversation_id} 已将 {overflow} 条消息合并进摘要")
+    finally:
+      self._compacting.discard(conversation_id)
+
+  async def wait_idle(self):
+    """等待后台摘要任务全部完成（测试与平滑关闭使用）"""
+    while self._tasks:
+      await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+  def info(self) -> Dict[str, int]:
+    return {
+      "conversations": len(self.store),
+      "compacting": len(self._compacting),
+      "compactions": self.compactions,
+      "summary_failures": self.summary_failures,
+    }
+
+
+def create_conversation_manager(summarizer: Summarizer) -> ConversationManager:
+  """按配置创建会话管理器"""
+  return ConversationManager(
+    create_cache(
+      "conversations",
+      maxsize=settings.CONVERSATION_MAX_ENTRIES,
+      ttl=settings.CONVERSATION_TTL_HOURS * 60 * 60
+    ),
+    summarizer,
+    token_budget=settings.CHAT_CONTEXT_TOKEN_BUDGET,
+    message_max_tokens=settings.CHAT_MESSAGE_MAX_TOKENS,
+    summary_max_tokens=settings.CHAT_SUMMARY_MAX_TOKENS,
+    secret=settings.SECRET_KEY,
+  )
+
+
+conversation_manager = create_conversation_manager(summarize_conversation)
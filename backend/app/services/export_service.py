@@ -0,0 +1,160 @@
+# services/export_service.py
+# 流式导出用户的全部日记（含照片）：GeoJSON FeatureCollection / JSONL / CSV
+# - 通过服务端游标按固定大小分块读取日记，每块只额外查询一次照片，内存占用与日记总数无关
+# - 每块序列化后立即输出，可选用 zlib 边生成边 gzip 压缩
+import csv
+import io
+import json
+import logging
+import zlib
+from datetime import date, datetime
+from typing import AsyncIterable, AsyncIterator, Dict, List
+
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.models import Entry, Photo
+
+logger = logging.getLogger(__name__)
+
+EXPORT_CHUNK_SIZE = 500  # 每块读取的日记数
+
+EXPORT_FORMATS = {
+  "geojson": ("application/geo+json", "geojson"),
+  "jsonl": ("application/x-ndjson", "jsonl"),
+  "csv": ("text/csv; charset=utf-8", "csv"),
+}
+
+# 导出的日记字段（不含 user_id），照片单独附加
+ENTRY_EXPORT_COLUMNS = [
+  Entry.id, Entry.title, Entry.content, Entry.location_name, Entry.date_start, Entry.date_end,
+  Entry.entry_type, Entry.coordinates, Entry.transportation, Entry.description, Entry.travel_partner,
+  Entry.cost, Entry.mood, Entry.created_time, Entry.location_id
+]
+PHOTO_EXPORT_COLUMNS = [
+  Photo.entry_id, Photo.public_id, Photo.url, Photo.width, Photo.height, Photo.format,
+  Photo.bytes, Photo.original_filename, Photo.created_at
+]
+
+CSV_FIELDS = [column.key for column in ENTRY_EXPORT_COLUMNS if column.key != "coordinates"] + ["lat", "lng", "photos"]
+
+
+def _json_default(value):
+  if isinstance(value, (date, datetime)):
+    return value.isoformat()
+  raise TypeError(f"无法序列化的类型: {type(value)}")
+
+
+def _dumps(data) -> str:
+  return json.dumps(data, ensure_ascii=False, default=_json_default)
+
+
+async def iter_entry_chunks(session: AsyncSession, user_id: int, chunk_size: int = EXPORT_CHUNK_SIZE) -> AsyncIterator[List[dict]]:
+  """
+  按 id 顺序分块读取用户的日记，每条附带 photos 列表
+
+  日记通过服务端游标（yield_per）读取；照片每块一次 IN 查询，按 position 保持日记中的顺序。
+  """
+  result = await session.stream(
+    select(*ENTRY_EXPORT_COLUMNS)
+    .where(Entry.user_id == user_id)
+    .order_by(Entry.id)
+    .execution_options(yield_per=chunk_size)
+  )
+  async for rows in result.partitions(chunk_size):
+    entries = [dict(row._mapping) for row in rows]
+    photos: Dict[int, List[dict]] = {entry["id"]: [] for entry in entries}
+    photo_rows = await session.exec(
+      select(*PHOTO_EXPORT_COLUMNS).where(Photo.entry_id.in_(list(photos))).order_by(Photo.position, Photo.id)
+    )
+    for photo_row in photo_rows:
+      photo = dict(photo_row._mapping)
+      photos[photo.pop("entry_id")].append(photo)
+    for entry in entries:
+      entry["photos"] = photos[entry["id"]]
+    yield entries
+
+
+def _lat_lng(entry: dict):
+  coordinates = entry.get("coordinates") or {}
+  return coordinates.get("lat"), coordinates.get("lng")
+
+
+def _geojson_feature(entry: dict) -> dict:
+  lat, lng = _lat_lng(entry)
+  properties = {key: value for key, value in entry.items() if key != "coordinates"}
+  geometry = {"type": "Point", "coordinates": [lng, lat]} if lat is not None and lng is not None else None
+  return {"type": "Feature", "id": entry["id"], "geometry": geometry, "properties": properties}
+
+
+async def iter_geojson(chunks: AsyncIterable[List[dict]]) -> AsyncIterator[str]:
+  """输出 GeoJSON FeatureCollection，Feature 逐块拼接，不在内存中构建整个数组"""
+  yield '{"type": "FeatureCollection", "features": ['
+  first = True
+  async for entries in chunks:
+    parts = []
+    for entry in entries:
+      parts.append(("" if first else ",") + _dumps(_geojson_feature(entry)))
+      first = False
+    yield "\n".join(parts)
+  yield "]}\n"
+
+
+async def iter_jsonl(chunks: AsyncIterable[List[dict]]) -> AsyncIterator[str]:
+  """每行一条日记"""
+  async for entries in chunks:
+    yield "".join(_dumps(entry) + "\n" for entry in entries)
+
+
+async def iter_csv(chunks: AsyncIterable[List[dict]]) -> AsyncIterator[str]:
+  """
+  输出 CSV：坐标拆成 lat / lng 两列，照片以 JSON 数组放在 photos 列
+
+  开头写入 UTF-8 BOM，便于 Excel 正确识别中文。
+  """
+  buffer = io.StringIO()
+  writer = csv.DictWriter(buffer, fieldnames=CSV_FIELDS, extrasaction="ignore")
+  buffer.write("\ufeff")
+  writer.writeheader()
+  async for entries in chunks:
+    for entry in entries:
+      lat, lng = _lat_lng(entry)
+      row = {key: value.isoformat() if isinstance(value, (date, datetime)) else value for key, value in entry.items()}
+      row.update({"lat": lat, "lng": lng, "photos": _dumps(entry["photos"]) if entry["photos"] else ""})
+      writer.writerow(row)
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate(0)
+
+
+async def gzip_stream(chunks: AsyncIterable[bytes], level: int = 6) -> AsyncIterator[bytes]:
+  """边生成边 gzip 压缩（wbits=31 输出带 gzip 头的数据流）"""
+  compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+  async for chunk in chunks:
+    compressed = compressor.compress(chunk)
+    if compressed:
+      yield compressed
+  yield compressor.flush()
+
+
+async def export_entries(session: AsyncSession, user_id: int, export_format: str, compress: bool = False) -> AsyncIterator[bytes]:
+  """
+  生成导出内容的字节流
+
+  Args:
+      session: 异步数据库会话（需要在整个流式输出期间保持打开）
+      user_id: 用户ID
+      export_format: geojson / jsonl / csv
+      compress: 是否 gzip 压缩
+  """
+  serializers = {"geojson": iter_geojson, "jsonl": iter_jsonl, "csv": iter_csv}
+  text_chunks = serializers[export_format](iter_entry_chunks(session, user_id))
+  byte_chunks = (chunk.encode("utf-8") async for chunk in text_chunks if chunk)
+  if compress:
+    byte_chunks = gzip_stream(byte_chunks)
+
+  total = 0
+  async for chunk in byte_chunks:
+    total += len(chunk)
+    yield chunk
+  logger.info(f"用户 {user_id} 导出完成: format={export_format}, gzip={compress}, 字节数={total}")
@@ -0,0 +1,52 @@
+# services/http_cache.py
+# ETag / 条件请求 (If-None-Match) 支持
+# ETag 由用户的数据版本号（user_stats.data_version，日记每次变更都会递增）和请求参数计算得出，
+# 因此判断是否命中只需要一次主键查询，不需要查询 entry 表
+import hashlib
+from typing import Any, Dict
+
+from fastapi import Request, Response, status
+from sqlmodel import Session
+
+from app.services.stats_service import get_data_version
+
+# 允许浏览器缓存，但每次使用前必须带 If-None-Match 重新验证
+CACHE_CONTROL = "private, no-cache"
+
+
+def make_etag(version: int, *parts: Any) -> str:
+  """根据数据版本号和请求相关的参数生成强 ETag"""
+  digest = hashlib.sha1("|".join(str(part) for part in parts).encode("utf-8")).hexdigest()[:16]
+  return f'"{version}-{digest}"'
+
+
+def request_etag(session: Session, user_id: int, request: Request) -> str:
+  """当前用户对某个资源（路径 + 查询参数）的 ETag"""
+  return make_etag(
+    get_data_version(session, user_id),
+    user_id,
+    request.url.path,
+    sorted(request.query_params.multi_items())
+  )
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+  """判断请求的 If-None-Match 是否与当前 ETag 匹配（按 RFC 9110 使用弱比较）"""
+  header = request.headers.get("if-none-match")
+  if not header:
+    return False
+  for candidate in header.split(","):
+    candidate = candidate.strip()
+    if candidate.startswith("W/"):
+      candidate = candidate[2:]
+    if candidate == "*" or candidate == etag:
+      return True
+  return False
+
+
+def etag_headers(etag: str) -> Dict[str, str]:
+  return {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+
+
+def not_modified_response(etag: str) -> Response:
+  return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=etag_headers(etag))
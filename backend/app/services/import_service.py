@@ -0,0 +1,198 @@
+# services/import_service.py
+# 批量导入日记：逐条校验、一次性解析全部坐标，再用批量 INSERT 在同一个事务里写入日记和照片
+# 与逐条调用 POST /entries 相比，省去了每条日记的 flush / commit / refresh 往返，统计计数器也只重建一次
+# 每一组日记在各自的 SAVEPOINT 中写入；某一组写库失败时回滚这一组并逐条重试，失败的条目记入 errors，不影响其他条目
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlmodel import Session, select
+
+from app.models import Entry, EntryCreate, Location, Photo
+from app.services.location_resolver import LocationResolver, resolve_location
+from app.services.location_service import parse_coordinates
+from app.services.photo_service import check_new_photo, photo_row
+from app.services.stats_service import invalidate_user_stats_cache, rebuild_user_stats
+
+logger = logging.getLogger(__name__)
+
+# 单次导入的最大条数
+BULK_IMPORT_MAX_ITEMS = 1000
+# 每个 SAVEPOINT 中批量写入的日记条数
+BULK_IMPORT_CHUNK_SIZE = 100
+
+def _format_validation_error(error: ValidationError) -> str:
+  return "; ".join(
+    f"{'.'.join(str(part) for part in detail['loc'])}: {detail['msg']}" for detail in error.errors()
+  )
+
+
+def _photo_rows(entry_data: EntryCreate) -> List[dict]:
+  """
+  整理一条日记的照片行（不含 entry_id）
+
+  与 POST /entries 一致，缺少 public_id 或 url 的照片被跳过；缺少宽高或格式的照片无法写入，整条日记报错。
+  """
+  rows = []
+  for photo_data in entry_data.photos:
+    row = photo_row(photo_data)
+    if row is not None:
+      row["position"] = len(rows)
+      rows.append(check_new_photo(row))
+  return rows
+
+
+def _resolve_locations(session: Session, items: List[EntryCreate]) -> Dict[Tuple[float, float], int]:
+  """
+  一次性解析批次中所有不重复的坐标，返回 {(lat, lng): location_id}
+
+  规则与 get_or_create_location 相同：先找容差范围内的已有位置（内存索引 / 数据库），
+  再找同名位置，都没有时新建。批次内彼此相近的新坐标共用同一个新位置，新位置统一 flush 一次。
+  """
+  coordinate_names: Dict[Tuple[float, float], str] = {}
+  for entry_data in items:
+    parsed = parse_coordinates(entry_data.coordinates)
+    if parsed:
+      coordinate_names.setdefault(parsed, entry_data.location_name)
+
+  # 1. 容差范围内的已有位置（内存索引命中时不访问数据库，未命中再查库）
+  resolved: Dict[Tuple[float, float], int] = {}
+  unresolved: Dict[Tuple[float, float], str] = {}
+  for (lat, lng), location_name in coordinate_names.items():
+    location = resolve_location(session, lat, lng)
+    if location:
+      resolved[(lat, lng)] = location.id
+    else:
+      unresolved[(lat, lng)] = location_name
+
+  # 2. 同名位置，或新建位置
+  if unresolved:
+    by_name: Dict[str, int] = {}
+    for location_id, name in session.exec(
+      select(Location.id, Location.name).where(Location.name.in_(set(unresolved.values()))).order_by(Location.id)
+    ):
+      by_name.setdefault(name, location_id)
+    # 批次内新建的位置用局部网格索引去重，索引中的 id 是 new_locations 的下标
+    batch_resolver = LocationResolver()
+    new_locations: List[Location] = []
+    pending: Dict[Tuple[float, float], int] = {}
+    for (lat, lng), location_name in unresolved.items():
+      index = batch_resolver.find(lat, lng)
+      if index is not None:
+        pending[(lat, lng)] = index
+      elif location_name in by_name:
+        resolved[(lat, lng)] = by_name[location_name]
+      else:
+        batch_resolver.add(len(new_locations), lat, lng)
+        pending[(lat, lng)] = len(new_locations)
+        new_locations.append(Location(name=location_name, coordinates={"lat": lat, "lng": lng}))
+    if new_locations:
+      session.add_all(new_locations)
+      session.flush()
+      logger.info(f"批量导入新建 {len(new_locations)} 个位置")
+    for key, index in pending.items():
+      resolved[key] = new_locations[index].id
+
+  return resolved
+
+
+def _format_database_error(error: SQLAlchemyError) -> str:
+  return str(getattr(error, "orig", None) or error)
+
+
+def _insert_entries(session: Session, entry_rows: List[dict], photo_lists: List[List[dict]]) -> List[int]:
+  """批量 INSERT ... RETURNING 日记（按参数顺序返回新 id），再批量写入照片"""
+  ids = list(session.exec(
+    insert(Entry).returning(Entry.id, sort_by_parameter_order=True), params=entry_rows
+  ).scalars())
+  photo_rows = [
+    {**photo, "entry_id": entry_id}
+    for entry_id, photos in zip(ids, photo_lists)
+    for photo in photos
+  ]
+  if photo_rows:
+    session.exec(insert(Photo), params=photo_rows)
+  return ids
+
+
+def _insert_chunk(session: Session, chunk: List[Tuple[int, dict, List[dict]]], errors: List[dict]) -> List[Tuple[int, int]]:
+  """
+  在 SAVEPOINT 中写入一组日记；失败时回滚这一组，再逐条在各自的 SAVEPOINT 中重试
+
+  Returns:
+      成功写入的 [(输入下标, 日记ID)]
+  """
+  try:
+    with session.begin_nested():
+      ids = _insert_entries(session, [row for _, row, _ in chunk], [photos for _, _, photos in chunk])
+    return [(index, entry_id) for (index, _, _), entry_id in zip(chunk, ids)]
+  except SQLAlchemyError as e:
+    if len(chunk) == 1:
+      errors.append({"index": chunk[0][0], "error": _format_database_error(e)})
+      return []
+    logger.warning(f"批量导入的一组日记写入失败，逐条重试: {_format_database_error(e)}")
+
+  created = []
+  for item in chunk:
+    created += _insert_chunk(session, [item], errors)
+  return created
+
+
+def import_entries(session: Session, user_id: int, payloads: List[Any]) -> dict:
+  """
+  批量导入日记（提交事务）
+
+  Args:
+      session: 数据库会话
+      user_id: 用户ID
+      payloads: 原始的 EntryCreate 数据列表，逐条校验，无效或写库失败的条目记录错误后跳过
+
+  Returns:
+      dict: created / failed / ids（按成功条目的输入顺序）/ errors（[{index, error}]，按输入顺序）
+  """
+  errors = []
+  valid: List[Tuple[int, EntryCreate, List[dict]]] = []
+  for index, payload in enumerate(payloads):
+    try:
+      entry_data = EntryCreate.model_validate(payload)
+      valid.append((index, entry_data, _photo_rows(entry_data)))
+    except ValidationError as e:
+      errors.append({"index": index, "error": _format_validation_error(e)})
+    except ValueError as e:
+      errors.append({"index": index, "error": str(e)})
+
+  ids: List[int] = []
+  if valid:
+    location_ids = _resolve_locations(session, [entry_data for _, entry_data, _ in valid])
+
+    now = datetime.now()
+    items = []
+    for index, entry_data, photos in valid:
+      row = entry_data.model_dump(exclude={"photos"})
+      parsed = parse_coordinates(entry_data.coordinates)
+      row.update({
+        "user_id": user_id,
+        "location_id": location_ids.get(parsed) if parsed else None,
+        "created_time": now
+      })
+      items.append((index, row, photos))
+
+    created = []
+    for start in range(0, len(items), BULK_IMPORT_CHUNK_SIZE):
+      created += _insert_chunk(session, items[start:start + BULK_IMPORT_CHUNK_SIZE], errors)
+    ids = [entry_id for _, entry_id in created]
+    errors.sort(key=lambda error: error["index"])
+
+    # 计数器按最终数据重建一次（同时递增数据版本号），而不是逐条增量更新
+    if ids:
+      rebuild_user_stats(session, user_id)
+
+  session.commit()
+  if ids:
+    invalidate_user_stats_cache(user_id)
+  logger.info(f"用户 {user_id} 批量导入日记: 成功 {len(ids)} 条, 失败 {len(errors)} 条")
+
+  return {"created": len(ids), "failed": len(errors), "ids": ids, "errors": errors}
@@ -0,0 +1,244 @@
+# services/location_resolver.py
+# 进程内空间索引：启动时把所有位置按网格分桶载入内存，回答 "容差范围内是否已有位置"
+# - 网格边长等于匹配容差，容差内的两个点一定落在同一格或相邻格，因此只需检查 3x3 个桶
+# - 位置的新增、坐标修改和删除（ORM 的 after_insert / after_update / after_delete）先记在会话上，
+#   事务提交后才写入索引，回滚（包括 SAVEPOINT 回滚）的修改直接丢弃，索引中只有已提交的数据
+# - 命中直接返回索引中的数据，不访问数据库；未命中（包括其他进程在载入之后新建的位置，
+#   以及启动时载入失败的情况）回落到数据库的索引范围查询，并把查到的位置补充进来
+import logging
+import math
+import sys
+import threading
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import Engine, event
+from sqlalchemy.orm import Session as OrmSession, SessionTransaction, object_session
+from sqlmodel import Session, select
+
+from app.models import Location
+from app.services.location_service import (
+  COORDINATE_TOLERANCE, find_nearby_location, parse_coordinates, within_tolerance
+)
+
+logger = logging.getLogger(__name__)
+
+# 桶内条目: (location_id, lat, lng)
+Point = Tuple[int, float, float]
+
+
+class LocationRef(NamedTuple):
+  """索引中的位置数据（调用方只需要位置ID）"""
+  id: int
+  lat: float
+  lng: float
+
+
+class LocationResolver:
+  """按网格分桶的位置索引"""
+
+  def __init__(self, cell_size: float = COORDINATE_TOLERANCE):
+    self.cell_size = cell_size
+    self._buckets: Dict[Tuple[int, int], List[Point]] = {}
+    self._cells: Dict[int, Tuple[int, int]] = {}  # location_id -> 所在的桶，用于删除
+    self._lock = threading.Lock()
+    self.loaded = False
+    self.lookups = 0
+    self.hits = 0
+    self.removed = 0
+
+  def _cell(self, lat: float, lng: float) -> Tuple[int, int]:
+    return math.floor(lat / self.cell_size), math.floor(lng / self.cell_size)
+
+  def add(self, location_id: int, lat: float, lng: float):
+    """加入（或更新）一个位置"""
+    with self._lock:
+      self._remove_locked(location_id)
+      cell = self._cell(lat, lng)
+      self._buckets.setdefault(cell, []).append((location_id, lat, lng))
+      self._cells[location_id] = cell
+
+  def remove(self, location_id: int):
+    """移除一个位置（位置被删除）"""
+    with self._lock:
+      if self._remove_locked(location_id):
+        self.removed += 1
+
+  def _remove_locked(self, location_id: int) -> bool:
+    cell = self._cells.pop(location_id, None)
+    if cell is None:
+      return False
+    bucket = [point for point in self._buckets[cell] if point[0] != location_id]
+    if bucket:
+      self._buckets[cell] = bucket
+    else:
+      del self._buckets[cell]
+    return True
+
+  def lookup(self, lat: float, lng: float) -> Optional[LocationRef]:
+    """
+    返回容差范围内的位置，多个候选时与数据库查询一致，取 id 最小的一个
+
+    只检查所在格及周围 8 格，耗时与位置总数无关。
+    """
+    row, column = self._cell(lat, lng)
+    best = None
+    with self._lock:
+      self.lookups += 1
+      for d_row in (-1, 0, 1):
+        for d_column in (-1, 0, 1):
+          for point in self._buckets.get((row + d_row, column + d_column), ()):
+            if within_tolerance(lat, lng, point[1], point[2]) and (best is None or point[0] < best[0]):
+              best = point
+      if best is not None:
+        self.hits += 1
+    return LocationRef(*best) if best is not None else None
+
+  def find(self, lat: float, lng: float) -> Optional[int]:
+    """返回容差范围内的位置ID"""
+    location = self.lookup(lat, lng)
+    return location.id if location is not None else None
+
+  def load(self, session: Session) -> int:
+    """从数据库全量载入，替换当前内容，返回载入的位置数"""
+    buckets: Dict[Tuple[int, int], List[Point]] = {}
+    cells: Dict[int, Tuple[int, int]] = {}
+    rows = session.exec(
+      select(Location.id, Location.lat, Location.lng).where(Location.lat.is_not(None))
+      .execution_options(yield_per=5000)
+    )
+    for location_id, lat, lng in rows:
+      cell = self._cell(lat, lng)
+      buckets.setdefault(cell, []).append((location_id, lat, lng))
+      cells[location_id] = cell
+
+    with self._lock:
+      self._buckets = buckets
+      self._cells = cells
+      self.loaded = True
+    return len(cells)
+
+  def clear(self):
+    """清空索引；清空后不再是权威的，直到重新载入"""
+    with self._lock:
+      self._buckets = {}
+      self._cells = {}
+      self.loaded = False
+      self.lookups = self.hits = self.removed = 0
+
+  def __len__(self) -> int:
+    return len(self._cells)
+
+  def memory_bytes(self) -> int:
+    """估算占用的内存（字典、桶列表、条目元组及其中的数值对象）"""
+    with self._lock:
+      total = sys.getsizeof(self._buckets) + sys.getsizeof(self._cells)
+      for cell, bucket in self._buckets.items():
+        total += sys.getsizeof(cell) + sys.getsizeof(bucket)
+        for point in bucket:
+          total += sys.getsizeof(point) + sum(sys.getsizeof(value) for value in point)
+    return total
+
+  def info(self) -> dict:
+    return {
+      "loaded": self.loaded,
+      "size": len(self),
+      "buckets": len(self._buckets),
+      "cell_size": self.cell_size,
+      "memory_bytes": self.memory_bytes(),
+      "lookups": self.lookups,
+      "hits": self.hits,
+      "misses": self.lookups - self.hits,
+      "removed": self.removed,
+      "hit_rate": round(self.hits / self.lookups, 4) if self.lookups else 0.0,
+    }
+
+
+location_resolver = LocationResolver()
+
+
+def resolve_location(session: Session, lat: float, lng: float) -> Optional[LocationRef]:
+  """
+  查找容差范围内的已有位置
+
+  先查内存索引，命中时不访问数据库。未命中时再做一次 (lat, lng) 索引上的范围查询：
+  其他 worker 在本进程载入索引之后创建的位置不在本地索引中，未命中之后紧接着就是插入，
+  这次查询的代价很小，却能避免重复创建位置。查到的已提交位置补充进索引。
+  """
+  location = location_resolver.lookup(lat, lng)
+  if location is not None:
+    return location
+
+  row = find_nearby_location(session, lat, lng)
+  if row is None:
+    return None
+  # 本事务中新建、尚未提交的位置由 after_commit 加入索引，回滚时不会残留
+  pending_ids = {change[1] for change in session.info.get(PENDING_CHANGES_KEY, ())}
+  if row.id not in pending_ids:
+    location_resolver.add(row.id, row.lat, row.lng)
+  return LocationRef(row.id, row.lat, row.lng)
+
+
+def warm_location_resolver(engine: Engine):
+  """应用启动时载入全部位置"""
+  try:
+    with Session(engine) as session:
+      count = location_resolver.load(session)
+    logger.info(f"位置索引已载入 {count} 个位置，约 {location_resolver.memory_bytes() / 1024:.1f} KB")
+  except Exception as e:
+    logger.warning(f"载入位置索引失败，将回落到数据库查询: {str(e)}")
+
+
+# ==================== 与事务同步 ====================
+# 会话上记录的待生效修改: [(所属事务, location_id, (lat, lng) 或删除时为 None)]
+PENDING_CHANGES_KEY = "location_resolver_pending"
+
+
+def _record_change(target: Location, point: Optional[Tuple[float, float]]):
+  session = object_session(target)
+  if session is None or target.id is None:
+    return
+  transaction = session.get_nested_transaction() or session.get_transaction()
+  session.info.setdefault(PENDING_CHANGES_KEY, []).append((transaction, target.id, point))
+
+
+def _on_location_write(mapper, connection, target: Location):
+  parsed = parse_coordinates(target.coordinates)
+  if parsed:
+    _record_change(target, parsed)
+
+
+def _on_location_delete(mapper, connection, target: Location):
+  _record_change(target, None)
+
+
+def _within(transaction: Optional[SessionTransaction], ancestor: SessionTransaction) -> bool:
+  while transaction is not None:
+    if transaction is ancestor:
+      return True
+    transaction = transaction.parent
+  return False
+
+
+def _apply_pending_changes(session: OrmSession):
+  """事务提交后把记录的修改写入索引"""
+  for _, location_id, point in session.info.pop(PENDING_CHANGES_KEY, ()):
+    if point is None:
+      location_resolver.remove(location_id)
+    else:
+      location_resolver.add(location_id, *point)
+
+
+def _discard_pending_changes(session: OrmSession, previous_transaction: SessionTransaction):
+  """事务（或 SAVEPOINT）回滚后丢弃其中记录的修改"""
+  pending = session.info.get(PENDING_CHANGES_KEY)
+  if pending:
+    session.info[PENDING_CHANGES_KEY] = [
+      change for change in pending if not _within(change[0], previous_transaction)
+    ]
+
+
+event.listen(Location, "after_insert", _on_location_write)
+event.listen(Location, "after_update", _on_location_write)
+event.listen(Location, "after_delete", _on_location_delete)
+event.listen(OrmSession, "after_commit", _apply_pending_changes)
+event.listen(OrmSession, "after_soft_rollback", _discard_pending_changes)
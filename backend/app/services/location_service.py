@@ -0,0 +1,93 @@
+# services/location_service.py
+# 位置去重：按坐标查找容差范围内的已有位置
+# location 表冗余保存 lat / lng 数值列（与 coordinates JSON 同步）并建立 (lat, lng) 复合索引，
+# 查找时只读取 lat ± 容差、lng ± 容差 这个小范围内的行，代替原来全表读取后在 Python 中逐个比较
+import logging
+from typing import Optional, Tuple
+
+from sqlalchemy import Engine, event, inspect
+from sqlmodel import Session, select
+
+from app.models import Location
+
+logger = logging.getLogger(__name__)
+
+# 坐标匹配容差（度），约 11 米
+COORDINATE_TOLERANCE = 0.0001
+
+
+def parse_coordinates(coords) -> Optional[Tuple[float, float]]:
+  """从坐标字典中取出 (lat, lng)，无效时返回 None"""
+  if not isinstance(coords, dict) or coords.get("lat") is None or coords.get("lng") is None:
+    return None
+  try:
+    return float(coords["lat"]), float(coords["lng"])
+  except (TypeError, ValueError):
+    return None
+
+
+def within_tolerance(lat: float, lng: float, other_lat: float, other_lng: float) -> bool:
+  """两个坐标是否在容差范围内（与原实现一致，使用严格小于）"""
+  return abs(other_lat - lat) < COORDINATE_TOLERANCE and abs(other_lng - lng) < COORDINATE_TOLERANCE
+
+
+def find_nearby_location(session: Session, lat: float, lng: float) -> Optional[Location]:
+  """
+  查找容差范围内的已有位置
+
+  (lat, lng) 索引上的范围查询只会命中附近的少量行，耗时与 location 表的总行数无关（O(log n)）。
+  BETWEEN 是闭区间，因此取出候选后再按严格小于过滤；多个候选时与原实现一样返回 id 最小的一个。
+  """
+  candidates = session.exec(
+    select(Location)
+    .where(Location.lat.between(lat - COORDINATE_TOLERANCE, lat + COORDINATE_TOLERANCE))
+    .where(Location.lng.between(lng - COORDINATE_TOLERANCE, lng + COORDINATE_TOLERANCE))
+    .order_by(Location.id)
+  ).all()
+
+  for location in candidates:
+    if within_tolerance(lat, lng, location.lat, location.lng):
+      return location
+  return None
+
+
+# ==================== lat / lng 列维护 ====================
+def _sync_lat_lng(mapper, connection, target: Location):
+  """写入前根据 coordinates 同步 lat / lng，所有创建位置的路径（Geocoder、/locations 接口）都会经过这里"""
+  parsed = parse_coordinates(target.coordinates)
+  target.lat, target.lng = parsed if parsed else (None, None)
+
+
+event.listen(Location, "before_insert", _sync_lat_lng)
+event.listen(Location, "before_update", _sync_lat_lng)
+
+
+def ensure_location_columns(engine: Engine):
+  """
+  为已存在的数据库补充 lat / lng 列和索引，并从 coordinates 回填
+
+  新建的数据库由 create_all 直接建出这些列和索引，这里只处理旧库，可以重复执行。
+  """
+  try:
+    columns = {column["name"] for column in inspect(engine).get_columns("location")}
+    with engine.begin() as conn:
+      for name in ("lat", "lng"):
+        if name not in columns:
+          conn.exec_driver_sql(f"ALTER TABLE location ADD COLUMN {name} FLOAT")
+          logger.info(f"location 表新增 {name} 列")
+      conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS idx_location_lat_lng ON location (lat, lng)")
+
+    with Session(engine) as session:
+      pending = session.exec(select(Location).where(Location.lat.is_(None))).all()
+      filled = 0
+      for location in pending:
+        parsed = parse_coordinates(location.coordinates)
+        if parsed:
+          location.lat, location.lng = parsed
+          session.add(location)
+          filled += 1
+      if filled:
+        session.commit()
+        logger.info(f"已回填 {filled} 个位置的 lat / lng 列")
+  except Exception as e:
+    logger.warning(f"补充 location 坐标列失败: {str(e)}")
@@ -0,0 +1,333 @@
+# services/metrics.py
+# 进程内指标，按 Prometheus 文本格式（0.0.4）输出，不依赖 prometheus_client
+# - HTTP: 每个路由的请求数（按状态码）、延迟直方图、响应大小直方图，以及正在处理的请求数
+# - 数据库连接池: 取连接的等待时间、连接被占用的时长，抓取时读取池的大小 / 占用 / 溢出
+# - 缓存: 抓取时读取所有已注册缓存和位置网格索引的命中、未命中、淘汰次数与命中率
+# 多进程部署时每个 worker 各自计数，由 Prometheus 按实例抓取后汇总
+import logging
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+from sqlalchemy import Engine, event
+
+logger = logging.getLogger(__name__)
+
+# 一组样本: (标签, 值)
+Sample = Tuple[Dict[str, str], float]
+# 抓取时生成的指标: (名称, 类型, 说明, 样本)
+MetricFamily = Tuple[str, str, str, List[Sample]]
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+POOL_WAIT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+
+# 未匹配任何路由的请求（404、扫描器等）合并成一个标签值，避免标签数量无限增长
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+def _escape(value: str) -> str:
+  return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+  if not labels:
+    return ""
+  return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+  if value == float("inf"):
+    return "+Inf"
+  if float(value).is_integer():
+    return str(int(value))
+  return repr(float(value))
+
+
+def _render_family(name: str, kind: str, help_text: str, lines: Iterable[str]) -> str:
+  return f"# HELP {name} {help_text}\n# TYPE {name} {kind}\n" + "".join(lines)
+
+
+class _Metric:
+  kind = ""
+
+  def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+    self.name = name
+    self.help = help_text
+    self.labelnames = tuple(labelnames)
+    self._lock = threading.Lock()
+
+  def _labels(self, values: Tuple[str, ...]) -> Dict[str, str]:
+    return dict(zip(self.labelnames, values))
+
+
+class Counter(_Metric):
+  """只增不减的计数器"""
+
+  kind = "counter"
+
+  def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+    super().__init__(name, help_text, labelnames)
+    self._values: Dict[Tuple[str, ...], float] = {}
+
+  def inc(self, *labels: str, amount: float = 1.0):
+    with self._lock:
+      self._values[labels] = self._values.get(labels, 0.0) + amount
+
+  def value(self, *labels: str) -> float:
+    return self._values.get(labels, 0.0)
+
+  def render(self) -> str:
+    with self._lock:
+      items = sorted(self._values.items())
+    return _render_family(self.name, self.kind, self.help, (
+      f"{self.name}{_format_labels(self._labels(labels))} {_format_value(value)}\n" for labels, value in items
+    ))
+
+
+class Gauge(Counter):
+  """可增可减的当前值"""
+
+  kind = "gauge"
+
+  def dec(self, *labels: str, amount: float = 1.0):
+    self.inc(*labels, amount=-amount)
+
+  def set(self, value: float, *labels: str):
+    with self._lock:
+      self._values[labels] = value
+
+
+class Histogram(_Metric):
+  """分桶直方图：每个标签组合记录各桶的累计次数、总和与总次数"""
+
+  kind = "histogram"
+
+  def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+    super().__init__(name, help_text, labelnames)
+    self.buckets = tuple(sorted(buckets))
+    # 标签 -> [各桶计数（非累计，最后一个是 +Inf）, 总和, 总次数]
+    self._values: Dict[Tuple[str, ...], list] = {}
+
+  def observe(self, value: float, *labels: str):
+    index = len(self.buckets)
+    for position, bound in enumerate(self.buckets):
+      if value <= bound:
+        index = position
+        break
+    with self._lock:
+      state = self._values.get(labels)
+      if state is None:
+        state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+      state[0][index] += 1
+      state[1] += value
+      state[2] += 1
+
+  def count(self, *labels: str) -> int:
+    state = self._values.get(labels)
+    return state[2] if state else 0
+
+  def render(self) -> str:
+    with self._lock:
+      items = sorted((labels, [list(state[0]), state[1], state[2]]) for labels, state in self._values.items())
+    lines = []
+    for labels, (counts, total, observations) in items:
+      base = self._labels(labels)
+      cumulative = 0
+      for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+        cumulative += bucket_count
+        lines.append(f"{self.name}_bucket{_format_labels({**base, 'le': _format_value(bound)})} {cumulative}\n")
+      lines.append(f"{self.name}_sum{_format_labels(base)} {_format_value(total)}\n")
+      lines.append(f"{self.name}_count{_format_labels(base)} {observations}\n")
+    return _render_family(self.name, self.kind, self.help, lines)
+
+
+class MetricsRegistry:
+  """指标注册表：直接计数的指标，加上抓取时才读取当前状态的收集函数"""
+
+  def __init__(self):
+    self._metrics: List[_Metric] = []
+    self._collectors: List[Callable[[], Iterable[MetricFamily]]] = []
+
+  def register(self, metric: _Metric) -> _Metric:
+    self._metrics.append(metric)
+    return metric
+
+  def add_collector(self, collector: Callable[[], Iterable[MetricFamily]]):
+    self._collectors.append(collector)
+
+  def render(self) -> str:
+    parts = [metric.render() for metric in self._metrics]
+    for collector in self._collectors:
+      try:
+        families = list(collector())
+      except Exception as e:
+        # 某个数据源不可用（例如 Redis 断开）时跳过，不影响其余指标
+        logger.warning(f"收集指标失败 ({collector.__name__}): {str(e)}")
+        continue
+      for name, kind, help_text, samples in families:
+        parts.append(_render_family(name, kind, help_text, (
+          f"{name}{_format_labels(labels)} {_format_value(value)}\n" for labels, value in samples
+        )))
+    return "".join(parts)
+
+
+metrics_registry = MetricsRegistry()
+
+# ==================== HTTP 请求 ====================
+http_requests_total = metrics_registry.register(Counter(
+  "http_requests_total", "HTTP requests by route, method and status code.", ("method", "route", "status")
+))
+http_request_duration_seconds = metrics_registry.register(Histogram(
+  "http_request_duration_seconds", "HTTP request latency until the last response byte is sent.",
+  ("method", "route"), LATENCY_BUCKETS
+))
+http_response_size_bytes = metrics_registry.register(Histogram(
+  "http_response_size_bytes", "HTTP response body size.", ("method", "route"), SIZE_BUCKETS
+))
+http_requests_in_flight = metrics_registry.register(Gauge(
+  "http_requests_in_flight", "HTTP requests currently being processed."
+))
+
+
+class MetricsMiddleware:
+  """
+  记录每个请求的路由、状态码、耗时和响应大小的 ASGI 中间件
+
+  路由标签使用匹配到的路由模板（例如 /api/entries/{entry_id}），而不是实际路径；
+  耗时到最后一个响应分块发出为止，流式响应（SSE、NDJSON）按完整的传输时间计算。
+  """
+
+  def __init__(self, app):
+    self.app = app
+
+  async def __call__(self, scope, receive, send):
+    if scope["type"] != "http":
+      await self.app(scope, receive, send)
+      return
+
+    status_code = 500
+    size = 0
+
+    async def send_wrapper(message):
+      nonlocal status_code, size
+      if message["type"] == "http.response.start":
+        status_code = message["status"]
+      elif message["type"] == "http.response.body":
+        size += len(message.get("body", b""))
+      await send(message)
+
+    started = time.perf_counter()
+    http_requests_in_flight.inc()
+    try:
+      await self.app(scope, receive, send_wrapper)
+    finally:
+      http_requests_in_flight.dec()
+      route = scope.get("route")
+      route_path = getattr(route, "path", None) or UNMATCHED_ROUTE
+      method = scope["method"]
+      http_requests_total.inc(method, route_path, str(status_code))
+      http_request_duration_seconds.observe(time.perf_counter() - started, method, route_path)
+      http_response_size_bytes.observe(size, method, route_path)
+
+
+# ==================== 数据库连接池 ====================
+db_pool_checkout_wait_seconds = metrics_registry.register(Histogram(
+  "db_pool_checkout_wait_seconds", "Time spent waiting for a connection from the SQLAlchemy pool (including new connects).",
+  ("pool",), POOL_WAIT_BUCKETS
+))
+db_pool_checkout_duration_seconds = metrics_registry.register(Histogram(
+  "db_pool_checkout_duration_seconds", "Time a connection was held between checkout and checkin.",
+  ("pool",), LATENCY_BUCKETS
+))
+_instrumented_engines: Dict[str, Engine] = {}
+
+
+def _wrap_pool_connect(pool, name: str):
+  # 连接池没有 "开始等待" 事件，因此包装 pool.connect()，计时覆盖排队等待和新建连接
+  if getattr(pool, "_metrics_instrumented", False):
+    return
+  connect = pool.connect
+
+  def timed_connect():
+    started = time.perf_counter()
+    try:
+      return connect()
+    finally:
+      db_pool_checkout_wait_seconds.observe(time.perf_counter() - started, name)
+
+  pool.connect = timed_connect
+  pool._metrics_instrumented = True
+
+
+def instrument_engine(engine: Engine, name: str):
+  """为引擎（异步引擎传入 async_engine.sync_engine）的连接池记录取连接等待和占用时长"""
+  if name in _instrumented_engines:
+    return
+  _instrumented_engines[name] = engine
+  _wrap_pool_connect(engine.pool, name)
+
+  @event.listens_for(engine, "engine_disposed")
+  def _on_dispose(disposed_engine):
+    # dispose() 会创建新的连接池
+    _wrap_pool_connect(disposed_engine.pool, name)
+
+  @event.listens_for(engine.pool, "checkout")
+  def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    connection_record.info["metrics_checkout_at"] = time.perf_counter()
+
+  @event.listens_for(engine.pool, "checkin")
+  def _on_checkin(dbapi_connection, connection_record):
+    checked_out_at = connection_record.info.pop("metrics_checkout_at", None)
+    if checked_out_at is not None:
+      db_pool_checkout_duration_seconds.observe(time.perf_counter() - checked_out_at, name)
+
+
+def _pool_metrics() -> Iterable[MetricFamily]:
+  gauges = {
+    "db_pool_size": ("Configured pool size.", "size"),
+    "db_pool_checked_out": ("Connections currently checked out.", "checkedout"),
+    "db_pool_checked_in": ("Idle connections in the pool.", "checkedin"),
+    "db_pool_overflow": ("Connections opened beyond the pool size (negative while the pool is not full).", "overflow"),
+  }
+  for metric_name, (help_text, method) in gauges.items():
+    samples = [
+      ({"pool": name}, getattr(engine.pool, method)())
+      for name, engine in _instrumented_engines.items()
+      if callable(getattr(engine.pool, method, None))
+    ]
+    yield metric_name, "gauge", help_text, samples
+
+
+# ==================== 缓存 ====================
+def _cache_metrics() -> Iterable[MetricFamily]:
+  from app.services.cache import get_cache_info
+  from app.services.location_resolver import location_resolver
+
+  caches = dict(get_cache_info())
+  location_info = location_resolver.info()
+  caches["location_index"] = {
+    "hits": location_info["hits"],
+    "misses": location_info["misses"],
+    "evictions": location_info["removed"],
+    "size": location_info["size"],
+    "hit_rate": location_info["hit_rate"],
+  }
+  for metric_name, kind, help_text, key in (
+      ("cache_hits_total", "counter", "Cache hits.", "hits"),
+      ("cache_misses_total", "counter", "Cache misses.", "misses"),
+      ("cache_evictions_total", "counter", "Entries evicted (for location_index: deleted locations removed).", "evictions"),
+      ("cache_entries", "gauge", "Entries currently stored.", "size"),
+      ("cache_hit_ratio", "gauge", "Hits / lookups since the process started.", "hit_rate"),
+  ):
+    yield metric_name, kind, help_text, [({"cache": name}, info[key]) for name, info in sorted(caches.items())]
+
+
+metrics_registry.add_collector(_pool_metrics)
+metrics_registry.add_collector(_cache_metrics)
+
+
+def render_metrics() -> str:
+  return metrics_registry.render()
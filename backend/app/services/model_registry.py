@@ -0,0 +1,239 @@
+# services/model_registry.py
+# AI 模型注册表：缓存模型句柄，按模型记录调用结果，并对不可用的模型熔断
+# - closed:    正常可用
+# - open:      配额耗尽（ResourceExhausted）或连续失败达到阈值后熔断，冷却期内不再路由到该模型
+# - half_open: 冷却期结束，只放行一次试探请求；成功则恢复，失败则以加倍的冷却时间重新熔断
+# 请求跳过熔断中的模型，按状态和列表优先级直接路由，不再每次都从列表第一个模型开始试错；
+# 冷却期结束的模型优先获得试探请求，恢复后按优先级重新承接流量
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.services.ai_limits import ModelLimiter, create_limiter_factory
+
+logger = logging.getLogger(__name__)
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+# 延迟的指数滑动平均系数
+LATENCY_EWMA_ALPHA = 0.2
+# half_open 试探请求超过该时间仍未返回结果（例如请求被取消），允许再次试探
+TRIAL_TIMEOUT_SECONDS = 120.0
+
+
+class ModelHealth:
+  """单个模型的健康状态与调用统计"""
+
+  def __init__(self, name: str, priority: int):
+    self.name = name
+    self.priority = priority  # 在降级列表中的位置，越小越优先
+    self.state = STATE_CLOSED
+    self.consecutive_failures = 0
+    self.cooldown_seconds = 0.0
+    self.opened_until = 0.0
+    self.trial_started_at: Optional[float] = None
+    self.successes = 0
+    self.quota_errors = 0
+    self.timeouts = 0
+    self.errors = 0
+    self.last_error: Optional[str] = None
+    self.last_error_at: Optional[float] = None
+    self.latency_ms: Optional[float] = None
+
+  def trial_in_flight(self, now: float) -> bool:
+    return self.trial_started_at is not None and now - self.trial_started_at < TRIAL_TIMEOUT_SECONDS
+
+  def as_dict(self, now: float) -> Dict[str, Any]:
+    return {
+      "name": self.name,
+      "priority": self.priority,
+      "state": self.state,
+      "consecutive_failures": self.consecutive_failures,
+      "retry_in_seconds": round(max(0.0, self.opened_until - now), 1) if self.state == STATE_OPEN else 0.0,
+      "successes": self.successes,
+      "quota_errors": self.quota_errors,
+      "timeouts": self.timeouts,
+      "errors": self.errors,
+      "last_error": self.last_error,
+      "latency_ms": round(self.latency_ms, 1) if self.latency_ms is not None else None,
+    }
+
+
+class ModelRegistry:
+  """
+  模型注册表
+
+  Args:
+      model_names: 按优先级排列的模型列表
+      model_factory: (model_name, system_instruction) -> 模型句柄，例如 genai.GenerativeModel
+      failure_threshold: 连续失败多少次后熔断
+      cooldown_seconds: 失败熔断的初始冷却时间
+      quota_cooldown_seconds: 配额耗尽熔断的初始冷却时间
+      max_cooldown_seconds: 反复熔断时冷却时间加倍的上限
+      limiter_factory: 为每个模型创建并发限制器，None 表示不限制
+  """
+
+  def __init__(
+      self,
+      model_names: List[str],
+      model_factory: Callable[[str, Optional[str]], Any],
+      failure_threshold: int,
+      cooldown_seconds: float,
+      quota_cooldown_seconds: float,
+      max_cooldown_seconds: float,
+      limiter_factory: Optional[Callable[[], ModelLimiter]] = None
+  ):
+    self.model_factory = model_factory
+    self.failure_threshold = failure_threshold
+    self.cooldown_seconds = cooldown_seconds
+    self.quota_cooldown_seconds = quota_cooldown_seconds
+    self.max_cooldown_seconds = max_cooldown_seconds
+    self._health = {name: ModelHealth(name, index) for index, name in enumerate(model_names)}
+    self._handles: Dict[Tuple[str, Optional[str]], Any] = {}
+    self._limiters: Dict[str, ModelLimiter] = {
+      name: limiter_factory() for name in model_names
+    } if limiter_factory else {}
+    self._lock = threading.Lock()
+
+  def get_model(self, model_name: str, system_instruction: Optional[str] = None) -> Any:
+    """返回缓存的模型句柄（每个模型 + 系统指令只创建一次）"""
+    key = (model_name, system_instruction)
+    with self._lock:
+      handle = self._handles.get(key)
+      if handle is None:
+        handle = self.model_factory(model_name, system_instruction)
+        self._handles[key] = handle
+      return handle
+
+  def limiter(self, model_name: str) -> Optional[ModelLimiter]:
+    """模型的并发限制器（未配置时为 None）"""
+    return self._limiters.get(model_name)
+
+  def candidates(self) -> List[str]:
+    """
+    返回本次请求依次尝试的模型
+
+    冷却期已过的熔断模型转为 half_open 并排在最前面，获得它唯一的一次试探请求
+    （实际尝试前需调用 try_acquire）；其余可用（closed）的模型按列表优先级排序。
+    连续失败次数和延迟不参与排序：它们只在成功时更新，按它们排序会让偶尔失败一次的首选模型
+    或还没有延迟数据的模型再也得不到请求。
+    所有模型都在熔断中时，返回最早结束冷却的一个，而不是直接拒绝请求。
+    """
+    now = time.monotonic()
+    with self._lock:
+      available = []
+      for health in self._health.values():
+        if health.state == STATE_OPEN and health.opened_until <= now:
+          health.state = STATE_HALF_OPEN
+          health.trial_started_at = None
+        if health.state == STATE_CLOSED:
+          available.append(health)
+        elif health.state == STATE_HALF_OPEN and not health.trial_in_flight(now):
+          available.append(health)
+      available.sort(key=lambda health: (health.state != STATE_HALF_OPEN, health.priority))
+      if available:
+        return [health.name for health in available]
+      soonest = min(self._health.values(), key=lambda health: (health.opened_until, health.priority))
+      return [soonest.name]
+
+  def try_acquire(self, model_name: str) -> bool:
+    """
+    在实际调用模型前确认仍可使用：half_open 的模型同一时间只放行一个试探请求，
+    期间被其他请求熔断的模型直接跳过。所有模型都在熔断中时的兜底候选总是放行。
+    """
+    now = time.monotonic()
+    with self._lock:
+      health = self._health[model_name]
+      if health.state == STATE_HALF_OPEN:
+        if health.trial_in_flight(now):
+          return False
+        health.trial_started_at = now
+        return True
+      if health.state == STATE_OPEN:
+        return all(other.state == STATE_OPEN for other in self._health.values())
+      return True
+
+  def _open(self, health: ModelHealth, base_cooldown: float, now: float):
+    # 试探失败或再次熔断时冷却时间加倍
+    if health.state in (STATE_HALF_OPEN, STATE_OPEN) and health.cooldown_seconds:
+      health.cooldown_seconds = min(health.cooldown_seconds * 2, self.max_cooldown_seconds)
+    else:
+      health.cooldown_seconds = base_cooldown
+    health.state = STATE_OPEN
+    health.opened_until = now + health.cooldown_seconds
+    health.trial_started_at = None
+    logger.warning(f"模型 {health.name} 熔断 {health.cooldown_seconds:.0f} 秒")
+
+  def record_success(self, model_name: str, latency_ms: float):
+    with self._lock:
+      health = self._health[model_name]
+      if health.state != STATE_CLOSED:
+        logger.info(f"模型 {model_name} 恢复可用")
+      health.state = STATE_CLOSED
+      health.consecutive_failures = 0
+      health.cooldown_seconds = 0.0
+      health.trial_started_at = None
+      health.successes += 1
+      health.latency_ms = latency_ms if health.latency_ms is None else (
+        LATENCY_EWMA_ALPHA * latency_ms + (1 - LATENCY_EWMA_ALPHA) * health.latency_ms
+      )
+
+  def _record_failure(self, model_name: str, error: Exception, counter: str, open_now: bool, base_cooldown: float):
+    now = time.monotonic()
+    with self._lock:
+      health = self._health[model_name]
+      setattr(health, counter, getattr(health, counter) + 1)
+      health.consecutive_failures += 1
+      health.last_error = f"{type(error).__name__}: {str(error)[:200]}"
+      health.last_error_at = time.time()
+      if open_now or health.state == STATE_HALF_OPEN or health.consecutive_failures >= self.failure_threshold:
+        self._open(health, base_cooldown, now)
+
+  def record_quota_exhausted(self, model_name: str, error: Exception):
+    """配额耗尽：立即熔断"""
+    self._record_failure(model_name, error, "quota_errors", True, self.quota_cooldown_seconds)
+
+  def record_timeout(self, model_name: str, error: Exception):
+    self._record_failure(model_name, error, "timeouts", False, self.cooldown_seconds)
+
+  def record_error(self, model_name: str, error: Exception):
+    self._record_failure(model_name, error, "errors", False, self.cooldown_seconds)
+
+  def reset(self):
+    """恢复所有模型为可用状态并清空统计（测试与运维使用）"""
+    with self._lock:
+      self._health = {name: ModelHealth(name, health.priority) for name, health in self._health.items()}
+
+  def info(self) -> Dict[str, Any]:
+    now = time.monotonic()
+    with self._lock:
+      models = [health.as_dict(now) for health in sorted(self._health.values(), key=lambda h: h.priority)]
+      for model in models:
+        limiter = self._limiters.get(model["name"])
+        model["concurrency"] = limiter.info() if limiter else None
+      return {
+        "failure_threshold": self.failure_threshold,
+        "cooldown_seconds": self.cooldown_seconds,
+        "quota_cooldown_seconds": self.quota_cooldown_seconds,
+        "cached_handles": len(self._handles),
+        "models": models,
+      }
+
+
+def create_model_registry(model_names: List[str], model_factory: Callable[[str, Optional[str]], Any]) -> ModelRegistry:
+  """按配置创建注册表"""
+  return ModelRegistry(
+    model_names,
+    model_factory,
+    failure_threshold=settings.AI_BREAKER_FAILURE_THRESHOLD,
+    cooldown_seconds=settings.AI_BREAKER_COOLDOWN_SECONDS,
+    quota_cooldown_seconds=settings.AI_QUOTA_COOLDOWN_SECONDS,
+    max_cooldown_seconds=settings.AI_BREAKER_MAX_COOLDOWN_SECONDS,
+    limiter_factory=create_limiter_factory(
+      settings.AI_MAX_CONCURRENCY_PER_MODEL, settings.AI_MAX_WAITING_PER_MODEL, settings.AI_QUEUE_TIMEOUT_SECONDS
+    ),
+  )
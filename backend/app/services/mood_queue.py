@@ -0,0 +1,232 @@
+# services/mood_queue.py
+# 心情情感分析的后台任务队列
+# - POST /moods 只写入一行 analysis_status=pending 的记录并入队，立即返回
+# - 若干个 asyncio 工作协程从队列取出心情ID，调用 AI 分析后写回 mood_vector / mood_reason
+# - 失败时按指数退避重试，超过最大次数标记为 failed 并写入中性的默认结果
+# - 工作协程处理前先用条件 UPDATE 把 pending 原子地改为 processing（认领），
+#   同一条心情被多个 worker / 进程重复入队时只有认领成功的一方会调用 AI
+# - 数据库中的状态即持久化的队列：应用启动时重新入队 pending 的心情，
+#   以及认领超过 MOOD_ANALYSIS_CLAIM_TIMEOUT_SECONDS 仍处于 processing 的心情（处理中进程已退出）
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Callable, Optional, Set
+
+from sqlalchemy import Engine, and_, inspect, or_, update
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.config import settings
+from app.database import async_engine
+from app.models import Mood
+from app.services.ai_service import analyze_mood_text
+
+logger = logging.getLogger(__name__)
+
+ANALYSIS_PENDING = "pending"
+ANALYSIS_PROCESSING = "processing"
+ANALYSIS_DONE = "done"
+ANALYSIS_FAILED = "failed"
+
+# 最终失败时写入的默认结果（与同步分析失败时一致）
+FALLBACK_RESULT = {"mood_vector": 0.5, "mood_reason": "分析失败"}
+
+
+def _default_session_factory() -> AsyncSession:
+  return AsyncSession(async_engine, expire_on_commit=False)
+
+
+class MoodAnalysisQueue:
+  """
+  进程内的心情分析队列
+
+  Args:
+      workers: 并发分析的工作协程数
+      max_attempts: 每条心情最多尝试的次数
+      retry_base_seconds: 重试退避的基数，第 n 次失败后等待 base * 2^(n-1) 秒
+      claim_timeout_seconds: processing 状态超过该时长视为处理中断，可以被重新认领
+  """
+
+  def __init__(self, workers: int, max_attempts: int, retry_base_seconds: float, claim_timeout_seconds: float):
+    self.workers = workers
+    self.max_attempts = max_attempts
+    self.retry_base_seconds = retry_base_seconds
+    self.claim_timeout_seconds = claim_timeout_seconds
+    self.session_factory: Callable[[], AsyncSession] = _default_session_factory
+    self._queue: Optional[asyncio.Queue] = None
+    self._tasks: Set[asyncio.Task] = set()
+    self._retry_tasks: Set[asyncio.Task] = set()
+    self.processed = 0
+    self.retried = 0
+    self.failed = 0
+
+  @property
+  def running(self) -> bool:
+    return self._queue is not None
+
+  def _claimable(self):
+    """可以被认领的心情：pending，或认领已超时的 processing（没有认领时间的也视为超时）"""
+    cutoff = datetime.now() - timedelta(seconds=self.claim_timeout_seconds)
+    return or_(
+      Mood.analysis_status == ANALYSIS_PENDING,
+      and_(
+        Mood.analysis_status == ANALYSIS_PROCESSING,
+        or_(Mood.analysis_claimed_at.is_(None), Mood.analysis_claimed_at < cutoff),
+      ),
+    )
+
+  async def start(self):
+    """启动工作协程，并重新入队 pending 和认领已超时的 processing 心情"""
+    if self.running:
+      return
+    self._queue = asyncio.Queue()
+    for index in range(self.workers):
+      self._tasks.add(asyncio.create_task(self._worker(), name=f"mood-analysis-{index}"))
+    try:
+      async with self.session_factory() as session:
+        pending_ids = (await session.exec(
+          select(Mood.id).where(self._claimable()).order_by(Mood.id)
+        )).all()
+      for mood_id in pending_ids:
+        self.enqueue(mood_id)
+      if pending_ids:
+        logger.info(f"重新入队 {len(pending_ids)} 条未完成分析的心情")
+    except Exception as e:
+      logger.warning(f"恢复未完成的心情分析失败: {str(e)}")
+
+  async def stop(self):
+    """
+    停止工作协程和等待中的重试
+
+    等待重试的心情保持 pending，下次启动时继续；
+    正在分析时被中断的心情停留在 processing，认领超时后由下次启动恢复。
+    """
+    tasks = self._tasks | self._retry_tasks
+    for task in tasks:
+      task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    self._tasks.clear()
+    self._retry_tasks.clear()
+    self._queue = None
+
+  def enqueue(self, mood_id: int):
+    """加入队列；队列未启动时只保留 pending 状态，等待下次启动恢复"""
+    if self._queue is None:
+      logger.warning(f"心情分析队列未启动，心情 {mood_id} 将在下次启动时分析")
+      return
+    self._queue.put_nowait(mood_id)
+
+  async def join(self):
+    """等待队列中的任务和等待中的重试全部完成（测试与平滑关闭使用）"""
+    while self._queue is not None and (self._queue.unfinished_tasks or self._retry_tasks):
+      await asyncio.sleep(0.01)
+
+  async def _worker(self):
+    while True:
+      mood_id = await self._queue.get()
+      try:
+        await self._process(mood_id)
+      except Exception as e:
+        logger.error(f"处理心情 {mood_id} 的分析任务时发生意外错误: {e}", exc_info=True)
+      finally:
+        self._queue.task_done()
+
+  async def _claim(self, mood_id: int) -> Optional[Mood]:
+    """
+    原子地把心情标记为 processing 并返回它；已删除、已完成或已被其他 worker 认领时返回 None
+    """
+    async with self.session_factory() as session:
+      result = await session.exec(
+        update(Mood)
+        .where(Mood.id == mood_id, self._claimable())
+        .values(analysis_status=ANALYSIS_PROCESSING, analysis_claimed_at=datetime.now())
+      )
+      await session.commit()
+      if result.rowcount != 1:
+        return None
+      return await session.get(Mood, mood_id)
+
+  async def _process(self, mood_id: int):
+    mood = await self._claim(mood_id)
+    if mood is None:
+      return
+    content = mood.content
+    attempts = mood.analysis_attempts + 1
+
+    try:
+      result = await analyze_mood_text(content, fallback=False)
+      values = {
+        "mood_vector": float(result.get("mood_vector", 0.5)),
+        "mood_reason": result.get("mood_reason", ""),
+        "analysis_status": ANALYSIS_DONE,
+      }
+      self.processed += 1
+    except Exception as e:
+      if attempts < self.max_attempts:
+        delay = self.retry_base_seconds * 2 ** (attempts - 1)
+        logger.warning(f"心情 {mood_id} 第 {attempts} 次分析失败，{delay:.1f} 秒后重试: {str(e)}")
+        # 放回 pending 并释放认领，重试时重新认领
+        await self._save(
+          mood_id, analysis_status=ANALYSIS_PENDING, analysis_attempts=attempts, analysis_claimed_at=None
+        )
+        self._schedule_retry(mood_id, delay)
+        self.retried += 1
+        return
+      logger.error(f"心情 {mood_id} 分析失败 {attempts} 次，放弃重试: {str(e)}")
+      values = {**FALLBACK_RESULT, "analysis_status": ANALYSIS_FAILED}
+      self.failed += 1
+
+    await self._save(mood_id, analysis_attempts=attempts, analysis_claimed_at=None, **values)
+    logger.info(f"心情 {mood_id} 分析完成: status={values['analysis_status']}")
+
+  async def _save(self, mood_id: int, **values):
+    async with self.session_factory() as session:
+      await session.exec(update(Mood).where(Mood.id == mood_id).values(**values))
+      await session.commit()
+
+  def _schedule_retry(self, mood_id: int, delay: float):
+    async def retry_later():
+      await asyncio.sleep(delay)
+      self.enqueue(mood_id)
+
+    task = asyncio.create_task(retry_later())
+    self._retry_tasks.add(task)
+    task.add_done_callback(self._retry_tasks.discard)
+
+  def info(self) -> dict:
+    return {
+      "running": self.running,
+      "workers": self.workers,
+      "queued": self._queue.qsize() if self._queue is not None else 0,
+      "waiting_retry": len(self._retry_tasks),
+      "processed": self.processed,
+      "retried": self.retried,
+      "failed": self.failed,
+    }
+
+
+mood_analysis_queue = MoodAnalysisQueue(
+  workers=settings.MOOD_ANALYSIS_WORKERS,
+  max_attempts=settings.MOOD_ANALYSIS_MAX_ATTEMPTS,
+  retry_base_seconds=settings.MOOD_ANALYSIS_RETRY_BASE_SECONDS,
+  claim_timeout_seconds=settings.MOOD_ANALYSIS_CLAIM_TIMEOUT_SECONDS,
+)
+
+
+def ensure_mood_columns(engine: Engine):
+  """为已存在的数据库补充分析状态列（旧心情在创建时已同步分析，标记为 done）"""
+  try:
+    columns = {column["name"] for column in inspect(engine).get_columns("mood")}
+    with engine.begin() as conn:
+      if "analysis_status" not in columns:
+        conn.exec_driver_sql("ALTER TABLE mood ADD COLUMN analysis_status VARCHAR NOT NULL DEFAULT 'done'")
+        conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_mood_analysis_status ON mood (analysis_status)")
+        logger.info("mood 表新增 analysis_status 列")
+      if "analysis_attempts" not in columns:
+        conn.exec_driver_sql("ALTER TABLE mood ADD COLUMN analysis_attempts INTEGER NOT NULL DEFAULT 0")
+        logger.info("mood 表新增 analysis_attempts 列")
+      if "analysis_claimed_at" not in columns:
+        conn.exec_driver_sql("ALTER TABLE mood ADD COLUMN analysis_claimed_at TIMESTAMP")
+        logger.info("mood 表新增 analysis_claimed_at 列")
+  except Exception as e:
+    logger.warning(f"补充 mood 分析状态列失败: {str(e)}")
@@ -0,0 +1,174 @@
+# services/password_service.py
+# 密码哈希专用的有界工作池
+# - bcrypt 是 CPU 密集操作，放在独立的线程池（或进程池）中执行，不占用 FastAPI 共享的线程池，
+#   登录高峰时不会拖慢日记列表、详情等接口
+# - 排队任务数超过上限时直接拒绝（PasswordHasherBusy），由路由返回 503，而不是无限排队
+# - 登录校验时按当前的 cost 策略检查旧哈希，rounds 不符合时返回新哈希，由调用方写回（rehash-on-login）
+# - 统计排队深度、排队等待时间和执行时间
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Deque, Optional, Tuple
+
+from passlib.context import CryptContext
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# min_rounds / max_rounds 与默认值一致：cost 不同的旧哈希在登录成功时会被重新计算
+pwd_context = CryptContext(
+  schemes=["bcrypt"],
+  deprecated="auto",
+  bcrypt__default_rounds=settings.BCRYPT_ROUNDS,
+  bcrypt__min_rounds=settings.BCRYPT_ROUNDS,
+  bcrypt__max_rounds=settings.BCRYPT_ROUNDS,
+)
+
+# 保留最近多少次任务的耗时用于计算分位数
+LATENCY_WINDOW = 1000
+
+
+class PasswordHasherBusy(Exception):
+  """哈希任务排队已满"""
+
+
+def _timed(func, *args):
+  """在工作线程 / 进程中执行，返回 (开始时间, 结束时间, 结果)；monotonic 时钟在进程间可比较"""
+  started = time.monotonic()
+  result = func(*args)
+  return started, time.monotonic(), result
+
+
+def _hash(password: str) -> str:
+  return pwd_context.hash(password)
+
+
+def _verify_and_update(password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+  return pwd_context.verify_and_update(password, hashed_password)
+
+
+def _latency_summary(samples: Deque[float]) -> dict:
+  if not samples:
+    return {"avg": 0.0, "p95": 0.0, "max": 0.0}
+  ordered = sorted(samples)
+  return {
+    "avg": round(sum(ordered) / len(ordered), 2),
+    "p95": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 2),
+    "max": round(ordered[-1], 2),
+  }
+
+
+class PasswordHasher:
+  """
+  有界的密码哈希工作池
+
+  Args:
+      workers: 工作线程 / 进程数
+      max_queue: 所有工作者都忙时最多允许排队的任务数
+      pool: "thread"（默认，bcrypt 计算时会释放 GIL）或 "process"
+  """
+
+  def __init__(self, workers: int, max_queue: int, pool: str = "thread"):
+    if pool not in ("thread", "process"):
+      raise ValueError(f"未知的密码哈希工作池类型: {pool}")
+    self.workers = workers
+    self.max_queue = max_queue
+    self.pool = pool
+    self._executor: Optional[Executor] = None
+    self._lock = threading.Lock()
+    self.in_flight = 0  # 已提交、尚未完成的任务（排队中 + 执行中）
+    self.submitted = 0
+    self.completed = 0
+    self.failed = 0
+    self.rejected = 0
+    self.rehashed = 0
+    self._wait_ms: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+    self._run_ms: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+
+  @property
+  def executor(self) -> Executor:
+    with self._lock:
+      if self._executor is None:
+        if self.pool == "process":
+          self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        else:
+          self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password-hasher")
+      return self._executor
+
+  async def _submit(self, func, *args):
+    executor = self.executor
+    with self._lock:
+      if self.in_flight >= self.workers + self.max_queue:
+        self.rejected += 1
+        raise PasswordHasherBusy(f"密码哈希队列已满（{self.in_flight} 个任务）")
+      self.in_flight += 1
+      self.submitted += 1
+
+    queued_at = time.monotonic()
+    try:
+      started, finished, result = await asyncio.get_running_loop().run_in_executor(executor, _timed, func, *args)
+    except Exception:
+      with self._lock:
+        self.failed += 1
+      raise
+    finally:
+      with self._lock:
+        self.in_flight -= 1
+
+    with self._lock:
+      self.completed += 1
+      self._wait_ms.append((started - queued_at) * 1000)
+      self._run_ms.append((finished - started) * 1000)
+    return result
+
+  async def hash(self, password: str) -> str:
+    """计算密码哈希"""
+    return await self._submit(_hash, password)
+
+  async def verify(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    校验密码
+
+    Returns:
+        (是否匹配, 新哈希)：哈希的 cost 不符合当前策略时返回重新计算的哈希，否则为 None
+    """
+    verified, new_hash = await self._submit(_verify_and_update, password, hashed_password)
+    if verified and new_hash:
+      with self._lock:
+        self.rehashed += 1
+    return verified, new_hash
+
+  def shutdown(self):
+    with self._lock:
+      executor, self._executor = self._executor, None
+    if executor is not None:
+      executor.shutdown(wait=True)
+
+  def info(self) -> dict:
+    with self._lock:
+      return {
+        "pool": self.pool,
+        "workers": self.workers,
+        "max_queue": self.max_queue,
+        "bcrypt_rounds": settings.BCRYPT_ROUNDS,
+        "in_flight": self.in_flight,
+        "queue_depth": max(0, self.in_flight - self.workers),
+        "submitted": self.submitted,
+        "completed": self.completed,
+        "failed": self.failed,
+        "rejected": self.rejected,
+        "rehashed": self.rehashed,
+        "wait_ms": _latency_summary(self._wait_ms),
+        "run_ms": _latency_summary(self._run_ms),
+      }
+
+
+password_hasher = PasswordHasher(
+  workers=settings.PASSWORD_HASH_WORKERS,
+  max_queue=settings.PASSWORD_HASH_MAX_QUEUE,
+  pool=settings.PASSWORD_HASH_POOL,
+)
@@ -0,0 +1,109 @@
+# services/photo_service.py
+# 日记照片的整理与同步
+# 更新日记时按 public_id 对比新旧照片列表，只对真正变化的部分执行集合式 DELETE / UPDATE / INSERT：
+# 未变化的照片行保持不动（id 不变），只改了元数据或顺序的照片原地更新
+import logging
+from typing import Dict, List, Optional
+
+from sqlalchemy import Engine, delete, inspect, insert, update
+from sqlmodel import Session, select
+
+from app.models import Photo, PhotoCreate
+
+logger = logging.getLogger(__name__)
+
+# 照片表中可由客户端写入的列
+PHOTO_COLUMNS = set(Photo.__table__.columns.keys()) - {"id", "entry_id"}
+# 新建照片时必须提供的字段（数据库非空列）
+PHOTO_REQUIRED_FIELDS = ("width", "height", "format")
+
+
+def photo_row(photo_data: PhotoCreate) -> Optional[dict]:
+  """
+  把客户端传来的照片整理为照片表的一行（只包含客户端显式提供的字段）
+
+  与新建日记时一致，缺少 public_id 或 url 的照片返回 None，由调用方跳过。
+  """
+  # model_dump() 会自动处理 size -> bytes 的映射
+  photo_dict = photo_data.model_dump(exclude_unset=True)
+  if not photo_dict.get("public_id") or not photo_dict.get("url"):
+    logger.warning(f"跳过一张无效的照片数据: {photo_dict}")
+    return None
+  return {key: value for key, value in photo_dict.items() if key in PHOTO_COLUMNS}
+
+
+def check_new_photo(row: dict) -> dict:
+  """校验新照片的必填字段并补全默认值，缺少字段时抛出 ValueError"""
+  missing = [field for field in PHOTO_REQUIRED_FIELDS if row.get(field) is None]
+  if missing:
+    raise ValueError(f"照片 {row['public_id']} 缺少字段: {', '.join(missing)}")
+  row["bytes"] = row.get("bytes") or 0
+  return row
+
+
+def sync_entry_photos(session: Session, entry_id: int, photos: List[PhotoCreate]) -> Dict[str, int]:
+  """
+  按 public_id 把日记的照片同步为 photos 列表（不提交事务，由调用方提交）
+
+  - 列表中没有的旧照片（以及同一 public_id 的重复行）：一条 DELETE ... WHERE id IN (...)
+  - 元数据或顺序变化的照片：按主键批量 UPDATE，只写变化的列
+  - 新照片：一条批量 INSERT
+
+  Returns:
+      dict: added / updated / removed / unchanged 的数量
+  """
+  incoming: Dict[str, dict] = {}
+  for photo_data in photos:
+    row = photo_row(photo_data)
+    if row is not None and row["public_id"] not in incoming:
+      row["position"] = len(incoming)
+      incoming[row["public_id"]] = row
+
+  existing = {}
+  removed_ids = []
+  for current in session.exec(
+    select(Photo).where(Photo.entry_id == entry_id).order_by(Photo.position, Photo.id)
+  ):
+    if current.public_id in incoming and current.public_id not in existing:
+      existing[current.public_id] = current
+    else:
+      removed_ids.append(current.id)
+
+  updates = []
+  inserts = []
+  for public_id, row in incoming.items():
+    current = existing.get(public_id)
+    if current is None:
+      inserts.append({**check_new_photo(row), "entry_id": entry_id})
+      continue
+    changes = {key: value for key, value in row.items() if getattr(current, key) != value}
+    if changes:
+      updates.append({"id": current.id, **changes})
+
+  if removed_ids:
+    session.exec(delete(Photo).where(Photo.id.in_(removed_ids)))
+  if updates:
+    session.exec(update(Photo), params=updates)
+  if inserts:
+    session.exec(insert(Photo), params=inserts)
+
+  summary = {
+    "added": len(inserts),
+    "updated": len(updates),
+    "removed": len(removed_ids),
+    "unchanged": len(existing) - len(updates)
+  }
+  logger.debug(f"日记 {entry_id} 照片同步结果: {summary}")
+  return summary
+
+
+def ensure_photo_columns(engine: Engine):
+  """为已存在的数据库补充 photo.position 列（旧照片默认为 0，按 id 保持原有顺序）"""
+  try:
+    columns = {column["name"] for column in inspect(engine).get_columns("photo")}
+    if "position" not in columns:
+      with engine.begin() as conn:
+        conn.exec_driver_sql("ALTER TABLE photo ADD COLUMN position INTEGER NOT NULL DEFAULT 0")
+      logger.info("photo 表新增 position 列")
+  except Exception as e:
+    logger.warning(f"补充 photo.position 列失败: {str(e)}")
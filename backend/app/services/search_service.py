@@ -0,0 +1,146 @@
+# services/search_service.py
+# 日记关键词搜索：按数据库方言使用全文索引，替代无法走索引的 ILIKE '%kw%' 全表扫描
+# - PostgreSQL: pg_trgm 三元组 GIN 索引（见 database.create_indexes），ILIKE 直接走索引，similarity() 做相关度排序；
+#   没有权限安装扩展时（常见于托管的 PostgreSQL），启动时检测到后不使用 similarity()，只按标题匹配和时间排序
+# - SQLite: FTS5 外部内容表 entry_fts（trigram 分词器），由触发器与 entry 表同步；测试的内存库同样走这条路径
+# 两种实现都保持原有的子串匹配语义（不区分大小写，对中文有效），并保留 "标题匹配优先" 的排序规则
+import logging
+from typing import List
+
+from sqlalchemy import DDL, Engine, event, literal_column, text
+from sqlmodel import Session, col, desc, func, or_
+
+from app.models import Entry
+
+logger = logging.getLogger(__name__)
+
+# trigram 分词器只能为 3 个字符及以上的查询使用 MATCH，更短的关键词直接在 entry 表上 LIKE，
+# 由外层查询的 user_id 条件限定在当前用户的日记内（FTS 表没有 user_id 列，在上面 LIKE 会扫描所有用户的数据）
+FTS_MIN_MATCH_LENGTH = 3
+
+# PostgreSQL 是否安装了 pg_trgm 扩展，由 ensure_search_index 在启动时检测
+pg_trgm_available = False
+
+# ==================== SQLite FTS5 DDL ====================
+SQLITE_FTS_DDL = [
+  """
+  CREATE VIRTUAL TABLE IF NOT EXISTS entry_fts USING fts5(
+    title, content, content='entry', content_rowid='id', tokenize='trigram'
+  )
+  """,
+  """
+  CREATE TRIGGER IF NOT EXISTS entry_fts_ai AFTER INSERT ON entry BEGIN
+    INSERT INTO entry_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+  END
+  """,
+  """
+  CREATE TRIGGER IF NOT EXISTS entry_fts_ad AFTER DELETE ON entry BEGIN
+    INSERT INTO entry_fts(entry_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+  END
+  """,
+  """
+  CREATE TRIGGER IF NOT EXISTS entry_fts_au AFTER UPDATE OF title, content ON entry BEGIN
+    INSERT INTO entry_fts(entry_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+    INSERT INTO entry_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+  END
+  """,
+]
+
+# 随 entry 表一起创建 / 删除，保证 SQLModel.metadata.create_all / drop_all 时索引与表结构一致
+for _statement in SQLITE_FTS_DDL:
+  event.listen(Entry.__table__, "after_create", DDL(_statement).execute_if(dialect="sqlite"))
+event.listen(
+  Entry.__table__, "before_drop", DDL("DROP TABLE IF EXISTS entry_fts").execute_if(dialect="sqlite")
+)
+
+
+def ensure_search_index(engine: Engine):
+  """
+  为已存在的 SQLite 数据库补建 FTS 索引，并在首次创建时回填已有数据。
+
+  PostgreSQL 的三元组索引在 database.create_indexes 中创建，这里只检测 pg_trgm 扩展是否可用。
+  """
+  if engine.dialect.name == "postgresql":
+    _detect_pg_trgm(engine)
+    return
+  if engine.dialect.name != "sqlite":
+    return
+
+  try:
+    with engine.begin() as conn:
+      exists = conn.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'entry_fts'"
+      ).first()
+      for statement in SQLITE_FTS_DDL:
+        conn.exec_driver_sql(statement)
+      if not exists:
+        conn.exec_driver_sql("INSERT INTO entry_fts(entry_fts) VALUES ('rebuild')")
+        logger.info("已创建并回填 entry_fts 全文索引")
+  except Exception as e:
+    logger.warning(f"创建 SQLite 全文索引失败: {str(e)}")
+
+
+def _detect_pg_trgm(engine: Engine):
+  global pg_trgm_available
+  try:
+    with engine.connect() as conn:
+      pg_trgm_available = conn.exec_driver_sql(
+        "SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'"
+      ).first() is not None
+  except Exception as e:
+    pg_trgm_available = False
+    logger.warning(f"检测 pg_trgm 扩展失败: {str(e)}")
+  if not pg_trgm_available:
+    logger.warning("pg_trgm 扩展不可用：关键词搜索不使用三元组索引和 similarity() 相关度排序")
+
+
+# ==================== 查询构建 ====================
+def _dialect_name(session: Session) -> str:
+  return session.get_bind().dialect.name
+
+
+def _fts_match_query(keyword: str) -> str:
+  """将关键词转义为 FTS5 短语查询（trigram 下等价于子串匹配）"""
+  return '"' + keyword.replace('"', '""') + '"'
+
+
+def keyword_condition(session: Session, keyword: str):
+  """
+  返回关键词匹配条件（标题或内容包含关键词），可用于列表查询和统计查询。
+  """
+  search_term = f"%{keyword}%"
+
+  if _dialect_name(session) == "sqlite" and len(keyword) >= FTS_MIN_MATCH_LENGTH:
+    fts_rows = text("SELECT rowid FROM entry_fts WHERE entry_fts MATCH :fts_query").bindparams(
+      fts_query=_fts_match_query(keyword)
+    )
+    return col(Entry.id).in_(fts_rows.columns(literal_column("rowid")))
+
+  # PostgreSQL: pg_trgm GIN 索引可以直接加速 ILIKE '%kw%'；
+  # SQLite 的短关键词和其他方言保持原有行为，由调用方的 user_id 条件限定扫描范围
+  return or_(
+    col(Entry.title).ilike(search_term),
+    col(Entry.content).ilike(search_term)
+  )
+
+
+def relevance_order(session: Session, keyword: str) -> List:
+  """
+  返回关键词搜索的排序规则：标题匹配优先，其次按相关度，最后按创建时间倒序。
+  """
+  search_term = f"%{keyword}%"
+  order: List = [desc(col(Entry.title).ilike(search_term))]
+
+  dialect = _dialect_name(session)
+  if dialect == "postgresql" and pg_trgm_available:
+    order.append(desc(func.similarity(Entry.title, keyword)))
+  elif dialect == "sqlite" and len(keyword) >= FTS_MIN_MATCH_LENGTH:
+    # bm25 越小越相关；相关子查询只在已命中的行上计算
+    rank = text(
+      "(SELECT bm25(entry_fts) FROM entry_fts WHERE entry_fts MATCH :fts_rank_query AND rowid = entry.id)"
+    ).bindparams(fts_rank_query=_fts_match_query(keyword))
+    order.append(rank)
+
+  order.append(Entry.created_time.desc())
+  return order
+
@@ -0,0 +1,335 @@
+# services/stats_service.py
+# 用户日记统计，供日记列表和 /entries/stats/summary 共用
+# - 全局计数器持久化在 user_stats 表中，由日记的增删改在同一事务内增量维护，读取只需一次主键查询
+# - 关键词统计用一条条件聚合查询（CASE，等价于 PostgreSQL 的 FILTER 子句，SQLite 同样支持）一次扫描算出
+# - 计数器出现偏差时可以重建: python -m app.services.stats_service rebuild [--user-id ID]
+import argparse
+import logging
+from datetime import datetime
+from typing import Optional, Tuple
+
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import Session, select, func, case, and_, delete, update
+
+from app.config import settings
+from app.models import Entry, UserStats, UserPlaceCount
+from app.services.cache import create_cache
+from app.services.search_service import keyword_condition
+
+logger = logging.getLogger(__name__)
+
+# ==================== 缓存配置 ====================
+# 统计信息缓存：只缓存还没有计数器行的历史用户的聚合结果（见 get_user_stats）
+# 容量有上限，按 LRU 淘汰，单条 5 分钟过期；键: "user_stats_{user_id}"，值: 统计字典
+STATS_CACHE_TTL_MINUTES = 5  # 统计信息缓存5分钟
+stats_cache = create_cache(
+  "stats",
+  maxsize=settings.STATS_CACHE_MAX_ENTRIES,
+  ttl=STATS_CACHE_TTL_MINUTES * 60
+)
+
+EMPTY_STATS = {
+  "diary_total": 0,
+  "guide_total": 0,
+  "place_total": 0,
+  "total_entries": 0
+}
+
+
+def compute_entry_counts(session: Session, user_id: int, keyword: Optional[str] = None) -> dict:
+  """
+  单次扫描计算用户的全部统计计数
+
+  Args:
+      session: 数据库会话
+      user_id: 用户ID
+      keyword: 搜索关键词，提供时额外返回命中关键词的计数
+
+  Returns:
+      dict: diary_total / guide_total / place_total / total_entries，
+            有关键词时另含 keyword_diary_total / keyword_guide_total / keyword_total
+  """
+  matched = case((keyword_condition(session, keyword), 1), else_=0) if keyword else None
+
+  # 先在用户的行上算出是否命中关键词，外层再做条件聚合，保证只扫描一次
+  columns = [Entry.entry_type, Entry.location_name]
+  if matched is not None:
+    columns.append(matched.label("matched"))
+  rows = select(*columns).where(Entry.user_id == user_id).subquery()
+
+  is_visited = rows.c.entry_type == "visited"
+  is_wishlist = rows.c.entry_type == "wishlist"
+  aggregates = [
+    func.count(case((is_visited, 1))).label("diary_total"),
+    func.count(case((is_wishlist, 1))).label("guide_total"),
+    func.count(case((is_visited, rows.c.location_name)).distinct()).label("place_total"),
+    func.count().label("total_entries"),
+  ]
+  if matched is not None:
+    is_matched = rows.c.matched == 1
+    aggregates += [
+      func.count(case((and_(is_matched, is_visited), 1))).label("keyword_diary_total"),
+      func.count(case((and_(is_matched, is_wishlist), 1))).label("keyword_guide_total"),
+      func.count(case((is_matched, 1))).label("keyword_total"),
+    ]
+
+  row = session.exec(select(*aggregates)).one()
+  return {key: value or 0 for key, value in row._mapping.items()}
+
+
+# ==================== 持久化计数器 ====================
+# 日记在统计中的 "身份"：(entry_type, location_name)，不存在时为 None
+EntryKey = Optional[Tuple[str, str]]
+
+
+def _insert(session: Session, model):
+  """当前数据库方言的 INSERT 语句，支持 ON CONFLICT（PostgreSQL 与 SQLite 语法一致）"""
+  if session.get_bind().dialect.name == "postgresql":
+    return postgresql_insert(model)
+  return sqlite_insert(model)
+
+
+def rebuild_user_stats(session: Session, user_id: int) -> dict:
+  """
+  根据 entry 表重建指定用户的计数器和地点引用计数（不提交事务，由调用方提交）
+
+  计数器行用 INSERT ... ON CONFLICT DO UPDATE 写入，两个请求同时为历史用户初始化计数器时不会因主键冲突失败。
+
+  Returns:
+      dict: 重建后的 diary_total / guide_total / place_total / total_entries
+  """
+  counts = {key: compute_entry_counts(session, user_id)[key] for key in EMPTY_STATS}
+
+  session.exec(delete(UserPlaceCount).where(UserPlaceCount.user_id == user_id))
+  place_rows = session.exec(
+    select(Entry.location_name, func.count(Entry.id))
+    .where(Entry.user_id == user_id)
+    .where(Entry.entry_type == "visited")
+    .group_by(Entry.location_name)
+  ).all()
+  if place_rows:
+    statement = _insert(session, UserPlaceCount).values([
+      {"user_id": user_id, "location_name": location_name, "ref_count": ref_count}
+      for location_name, ref_count in place_rows
+    ])
+    session.exec(statement.on_conflict_do_update(
+      index_elements=["user_id", "location_name"], set_={"ref_count": statement.excluded.ref_count}
+    ))
+
+  now = datetime.now()
+  statement = _insert(session, UserStats).values(user_id=user_id, data_version=1, updated_at=now, **counts)
+  session.exec(statement.on_conflict_do_update(
+    index_elements=["user_id"],
+    set_={**counts, "data_version": UserStats.data_version + 1, "updated_at": now}
+  ))
+  logger.info(f"已重建用户统计计数器: user_id={user_id}, 结果: {counts}")
+  return counts
+
+
+def _change_place_ref(session: Session, user_id: int, location_name: str, delta: int) -> int:
+  """调整地点引用计数，返回 place_total 的变化量（新增地点 +1，地点引用归零 -1）"""
+  if delta > 0:
+    # 单条 upsert：返回的引用计数等于 delta 说明这一行是新插入的（引用归零的行会被删除）
+    statement = _insert(session, UserPlaceCount).values(
+      user_id=user_id, location_name=location_name, ref_count=delta
+    )
+    ref_count = session.exec(
+      statement.on_conflict_do_update(
+        index_elements=["user_id", "location_name"], set_={"ref_count": UserPlaceCount.ref_count + delta}
+      ).returning(UserPlaceCount.ref_count)
+    ).scalar_one()
+    return 1 if ref_count == delta else 0
+
+  session.exec(
+    update(UserPlaceCount)
+    .where(UserPlaceCount.user_id == user_id, UserPlaceCount.location_name == location_name)
+    .values(ref_count=UserPlaceCount.ref_count + delta)
+  )
+  removed = session.exec(
+    delete(UserPlaceCount)
+    .where(UserPlaceCount.user_id == user_id, UserPlaceCount.location_name == location_name)
+    .where(UserPlaceCount.ref_count <= 0)
+  )
+  return -1 if removed.rowcount else 0
+
+
+def record_entry_change(session: Session, user_id: int, old: EntryKey, new: EntryKey):
+  """
+  在日记增删改的事务中增量更新计数器，并递增数据版本号（不提交事务，由调用方提交）
+
+  Args:
+      old: 修改前的 (entry_type, location_name)，新建时为 None
+      new: 修改后的 (entry_type, location_name)，删除时为 None
+  """
+  if session.get(UserStats, user_id) is None:
+    # 首次写入（历史用户）：直接按当前数据重建，重建结果已包含本次修改
+    rebuild_user_stats(session, user_id)
+    return
+
+  deltas = {"diary_total": 0, "guide_total": 0, "place_total": 0, "total_entries": 0}
+  for key, sign in ((old, -1), (new, 1)):
+    if key is None or old == new:
+      continue
+    entry_type, location_name = key
+    deltas["total_entries"] += sign
+    if entry_type == "visited":
+      deltas["diary_total"] += sign
+      deltas["place_total"] += _change_place_ref(session, user_id, location_name, sign)
+    elif entry_type == "wishlist":
+      deltas["guide_total"] += sign
+
+  session.exec(
+    update(UserStats)
+    .where(UserStats.user_id == user_id)
+    .values(
+      updated_at=datetime.now(),
+      data_version=UserStats.data_version + 1,
+      **{key: getattr(UserStats, key) + delta for key, delta in deltas.items() if delta}
+    )
+  )
+
+
+def get_data_version(session: Session, user_id: int) -> int:
+  """主键读取用户的数据版本号（尚未建立计数器的用户为 0）"""
+  version = session.exec(select(UserStats.data_version).where(UserStats.user_id == user_id)).first()
+  return version or 0
+
+
+def get_user_stats(user_id: int, session: Session, force_refresh: bool = False):
+  """
+  获取用户统计信息
+
+  有计数器行时直接主键读取，不经过缓存：ETag 使用同一行的 data_version，
+  而统计缓存默认是每个 worker 各自的内存，只有执行写操作的 worker 会使其失效，
+  从缓存返回可能把其他 worker 的旧数据和新版本号的 ETag 组合在一起。
+  还没有计数器行的历史用户按 entry 表聚合，结果进入缓存；
+  计数器行在该用户第一次增删改日记时（或运行 rebuild 命令时）建立，此后不再读取这份缓存。
+
+  Args:
+      user_id: 用户ID
+      session: 数据库会话
+      force_refresh: 是否跳过缓存重新聚合
+
+  Returns:
+      dict: 包含统计信息的字典
+
+  Raises:
+      SQLAlchemyError: 读取失败时回滚会话并继续抛出，不返回全零的统计
+  """
+  cache_key = f"user_stats_{user_id}"
+
+  try:
+    user_stats = session.get(UserStats, user_id)
+    if user_stats is not None:
+      return {key: getattr(user_stats, key) for key in EMPTY_STATS}
+
+    # 检查缓存（除非强制刷新），过期和容量淘汰由缓存组件负责
+    if not force_refresh:
+      cached_data = stats_cache.get(cache_key)
+      if cached_data is not None:
+        logger.debug(f"使用缓存的统计信息: user_id={user_id}")
+        return cached_data
+
+    logger.debug(f"计算用户统计信息: user_id={user_id}")
+    start_time = datetime.now()
+    counts = compute_entry_counts(session, user_id)
+    stats = {key: counts[key] for key in EMPTY_STATS}
+    stats_cache.set(cache_key, stats)
+
+    elapsed = (datetime.now() - start_time).total_seconds()
+    logger.info(f"用户统计计算完成: user_id={user_id}, "
+                f"耗时: {elapsed:.3f}秒, "
+                f"结果: diary_total={stats['diary_total']}, "
+                f"guide_total={stats['guide_total']}, "
+                f"place_total={stats['place_total']}")
+    return stats
+
+  except Exception as e:
+    logger.error(f"读取用户统计信息失败: user_id={user_id}, 错误: {str(e)}", exc_info=True)
+    # 回滚失败的事务后继续抛出：调用方已经设置了 ETag，返回默认值会把全零的统计固定在客户端缓存中
+    session.rollback()
+    raise
+
+
+def get_list_stats(
+    user_id: int,
+    session: Session,
+    keyword: Optional[str] = None,
+    entry_type: Optional[str] = None,
+    force_refresh: bool = False
+) -> dict:
+  """
+  获取日记列表需要的全部统计信息
+
+  - 没有关键词时直接使用缓存的全局统计
+  - 有关键词时用一条聚合查询同时算出全局统计和关键词统计；
+    diary_total / guide_total 替换为命中关键词的数量，place_total 保持全局值不变
+
+  Returns:
+      dict: diary_total / guide_total / place_total / total_entries，
+            以及 list_total（当前筛选条件下列表的总条数，用于分页）
+  """
+  if not keyword:
+    stats = dict(get_user_stats(user_id, session, force_refresh=force_refresh))
+    if entry_type == "visited":
+      stats["list_total"] = stats["diary_total"]
+    elif entry_type == "wishlist":
+      stats["list_total"] = stats["guide_total"]
+    else:
+      stats["list_total"] = stats["total_entries"]
+    return stats
+
+  logger.debug(f"检测到搜索关键词 '{keyword}'，正在重新计算筛选后的统计信息...")
+  counts = compute_entry_counts(session, user_id, keyword=keyword)
+  if entry_type == "visited":
+    list_total = counts["keyword_diary_total"]
+  elif entry_type == "wishlist":
+    list_total = counts["keyword_guide_total"]
+  else:
+    list_total = counts["keyword_total"]
+
+  return {
+    "diary_total": counts["keyword_diary_total"],
+    "guide_total": counts["keyword_guide_total"],
+    "place_total": counts["place_total"],  # 保持不变
+    "total_entries": counts["total_entries"],
+    "list_total": list_total
+  }
+
+
+def invalidate_user_stats_cache(user_id: int):
+  """使指定用户的统计缓存失效"""
+  cache_key = f"user_stats_{user_id}"
+  if stats_cache.delete(cache_key):
+    logger.debug(f"已使缓存失效: {cache_key}")
+
+
+def rebuild_all_user_stats(session: Session, user_id: Optional[int] = None) -> int:
+  """重建全部（或指定）用户的计数器并提交，返回处理的用户数"""
+  if user_id is not None:
+    user_ids = [user_id]
+  else:
+    user_ids = list(session.exec(select(Entry.user_id).distinct()).all())
+    # 已经没有日记的用户也需要清零
+    user_ids += [uid for uid in session.exec(select(UserStats.user_id)).all() if uid not in user_ids]
+
+  for uid in user_ids:
+    rebuild_user_stats(session, uid)
+    invalidate_user_stats_cache(uid)
+  session.commit()
+  return len(user_ids)
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="用户统计计数器维护工具")
+  subparsers = parser.add_subparsers(dest="command", required=True)
+  rebuild_parser = subparsers.add_parser("rebuild", help="根据 entry 表重建 user_stats 计数器，修复偏差")
+  rebuild_parser.add_argument("--user-id", type=int, default=None, help="只重建指定用户")
+  args = parser.parse_args()
+
+  from app.database import engine, create_db_and_tables
+  create_db_and_tables()
+  with Session(engine) as db_session:
+    rebuilt = rebuild_all_user_stats(db_session, user_id=args.user_id)
+  print(f"已重建 {rebuilt} 个用户的统计计数器")
@@ -0,0 +1,182 @@
+# benchmarks/harness.py
+# 微基准测试的计时、统计与结果比较（不依赖应用代码，也不依赖 pytest-benchmark）
+# - 先试跑一次估算单次耗时，把很快的函数合并成一轮执行多次，减少计时本身的误差
+# - 至少执行 min_rounds 轮，并持续到累计耗时达到 min_time
+# - 结果按单次调用的秒数统计，写成 JSON，可以与之前保存的基线逐项比较中位数
+import inspect
+import json
+import math
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+# 每一轮的目标耗时：单次调用比这更快的函数，一轮内连续执行多次
+TARGET_ROUND_SECONDS = 0.002
+MAX_CALLS_PER_ROUND = 10000
+
+
+def _calls_per_round(single_call_seconds: float) -> int:
+  if single_call_seconds <= 0:
+    return MAX_CALLS_PER_ROUND
+  return max(1, min(MAX_CALLS_PER_ROUND, int(TARGET_ROUND_SECONDS / single_call_seconds)))
+
+
+def summarize(samples: List[float], calls_per_round: int) -> Dict[str, Any]:
+  """单次调用耗时（秒）的统计"""
+  ordered = sorted(samples)
+  mean = statistics.fmean(ordered)
+  return {
+    "rounds": len(ordered),
+    "calls_per_round": calls_per_round,
+    "min": ordered[0],
+    "max": ordered[-1],
+    "mean": mean,
+    "median": statistics.median(ordered),
+    "p95": ordered[min(len(ordered) - 1, math.ceil(len(ordered) * 0.95) - 1)],
+    "stdev": statistics.stdev(ordered) if len(ordered) > 1 else 0.0,
+    "ops": 1 / mean if mean > 0 else 0.0,
+  }
+
+
+def measure(func: Callable[[], Any], min_time: float = 0.5, min_rounds: int = 5, max_rounds: int = 1000) -> Dict[str, Any]:
+  """对同步函数计时"""
+  started = time.perf_counter()
+  func()  # 预热，同时估算单次耗时
+  calls = _calls_per_round(time.perf_counter() - started)
+
+  samples = []
+  elapsed = 0.0
+  while len(samples) < max_rounds and (len(samples) < min_rounds or elapsed < min_time):
+    round_started = time.perf_counter()
+    for _ in range(calls):
+      func()
+    round_seconds = time.perf_counter() - round_started
+    samples.append(round_seconds / calls)
+    elapsed += round_seconds
+  return summarize(samples, calls)
+
+
+async def measure_async(func: Callable[[], Awaitable[Any]], min_time: float = 0.5, min_rounds: int = 5, max_rounds: int = 1000) -> Dict[str, Any]:
+  """对协程函数计时（在调用方的事件循环中执行）"""
+  started = time.perf_counter()
+  await func()
+  calls = _calls_per_round(time.perf_counter() - started)
+
+  samples = []
+  elapsed = 0.0
+  while len(samples) < max_rounds and (len(samples) < min_rounds or elapsed < min_time):
+    round_started = time.perf_counter()
+    for _ in range(calls):
+      await func()
+    round_seconds = time.perf_counter() - round_started
+    samples.append(round_seconds / calls)
+    elapsed += round_seconds
+  return summarize(samples, calls)
+
+
+class BenchmarkRun:
+  """
+  一次基准测试运行的结果集合
+
+  Args:
+      name_filter: 只运行名称中包含该子串的用例
+      min_time: 每个用例的最短累计计时（秒）
+  """
+
+  def __init__(self, name_filter: Optional[str] = None, min_time: float = 0.5):
+    self.name_filter = name_filter
+    self.min_time = min_time
+    self.results: List[Dict[str, Any]] = []
+
+  def selected(self, name: str) -> bool:
+    return not self.name_filter or self.name_filter in name
+
+  async def bench(self, name: str, group: str, func: Callable, **params):
+    """运行一个用例（同步函数或返回协程的函数均可），记录并打印结果"""
+    if not self.selected(name):
+      return
+    # 返回协程的函数（包括 lambda: coroutine(...)）按异步用例计时
+    first = func()
+    if inspect.isawaitable(first):
+      await first
+      stats = await measure_async(func, min_time=self.min_time)
+    else:
+      stats = measure(func, min_time=self.min_time)
+    self.results.append({"name": name, "group": group, "params": params, "stats": stats})
+    print(f"  {name:<60} median {format_seconds(stats['median']):>10}   p95 {format_seconds(stats['p95']):>10}   {stats['ops']:>12,.0f} ops/s")
+
+  def to_dict(self, meta: Dict[str, Any]) -> Dict[str, Any]:
+    return {"meta": {**environment_info(), **meta}, "benchmarks": self.results}
+
+
+def format_seconds(seconds: float) -> str:
+  for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+    if seconds >= scale:
+      return f"{seconds / scale:.2f} {unit}"
+  return f"{seconds / 1e-9:.0f} ns"
+
+
+def _git_commit() -> Optional[str]:
+  try:
+    return subprocess.run(
+      ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+      cwd=Path(__file__).parent
+    ).stdout.strip()
+  except (OSError, subprocess.CalledProcessError):
+    return None
+
+
+def environment_info() -> Dict[str, Any]:
+  return {
+    "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    "commit": _git_commit(),
+    "python": sys.version.split()[0],
+    "platform": platform.platform(),
+    "machine": platform.machine(),
+  }
+
+
+def write_results(path: str, data: Dict[str, Any]):
+  Path(path).parent.mkdir(parents=True, exist_ok=True)
+  with open(path, "w", encoding="utf-8") as f:
+    json.dump(data, f, ensure_ascii=False, indent=2)
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], max_regression: float) -> List[Dict[str, Any]]:
+  """
+  按用例名称比较中位数
+
+  Returns:
+      每个共同用例的 {name, baseline, current, change, regressed}，change 为相对变化（0.1 表示慢了 10%）
+  """
+  baseline_by_name = {item["name"]: item for item in baseline.get("benchmarks", [])}
+  rows = []
+  for item in current.get("benchmarks", []):
+    base = baseline_by_name.get(item["name"])
+    if base is None:
+      continue
+    before, after = base["stats"]["median"], item["stats"]["median"]
+    change = (after - before) / before if before > 0 else 0.0
+    rows.append({
+      "name": item["name"],
+      "baseline": before,
+      "current": after,
+      "change": change,
+      "regressed": change > max_regression,
+    })
+  return rows
+
+
+def print_comparison(rows: List[Dict[str, Any]]):
+  print(f"\n{'benchmark':<60} {'baseline':>10} {'current':>10} {'change':>9}")
+  for row in rows:
+    flag = "  <-- regression" if row["regressed"] else ""
+    print(
+      f"{row['name']:<60} {format_seconds(row['baseline']):>10} {format_seconds(row['current']):>10} "
+      f"{row['change']:>+8.1%}{flag}"
+    )
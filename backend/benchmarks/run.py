@@ -0,0 +1,120 @@
+# benchmarks/run.py
+# 后端热点路径的微基准测试
+#
+# 在 backend 目录下运行：
+#   python -m benchmarks.run                                  # 完整规模：10 个用户 x 5000 条日记，1 万 / 10 万个位置
+#   python -m benchmarks.run --quick                          # 小规模快速检查
+#   python -m benchmarks.run --output before.json
+#   python -m benchmarks.run --baseline before.json --max-regression 0.15
+#
+# 每次运行使用新建的临时 SQLite 数据库和本地模拟的 AI 提供方（不访问网络，不需要 API Key），
+# 结果写成 JSON；指定 --baseline 时逐项比较中位数，超过允许的退化比例时以非零状态退出。
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import tempfile
+
+
+def configure_environment(database_path: str):
+  """在导入应用模块之前设置配置：临时数据库、进程内缓存、零延迟的本地 AI 提供方"""
+  os.environ.setdefault("SECRET_KEY", "benchmark-secret-key")
+  os.environ.update({
+    "DATABASE_URL": f"sqlite:///{database_path}",
+    "ENVIRONMENT": "benchmark",
+    "CACHE_BACKEND": "memory",
+    "AI_CACHE_BACKEND": "memory",
+    "AI_PROVIDER": "local",
+    "AI_LOCAL_LATENCY_MS": "0",
+    "AI_LOCAL_LATENCY_SIGMA": "0",
+    "AI_LOCAL_ERROR_RATE": "0",
+    "AI_LOCAL_QUOTA_ERROR_RATE": "0",
+  })
+
+
+def quiet_logging():
+  """关闭 SQL 回显和 INFO 日志：基准结果只反映代码路径本身，不包含终端输出的耗时"""
+  from app.database import async_engine, engine
+  engine.echo = False
+  async_engine.echo = False
+  logging.getLogger().setLevel(logging.WARNING)
+  logging.getLogger("sqlalchemy").setLevel(logging.WARNING)
+
+
+async def main_async(args) -> int:
+  from app.database import async_engine, create_db_and_tables
+  from benchmarks.harness import BenchmarkRun, compare, print_comparison, write_results
+  from benchmarks.suite import run_suite
+
+  quiet_logging()
+  create_db_and_tables()
+  quiet_logging()  # create_db_and_tables 的日志之后再次确认
+
+  run = BenchmarkRun(name_filter=args.filter, min_time=args.min_time)
+  try:
+    meta = await run_suite(
+      run,
+      users=args.users,
+      entries=args.entries,
+      location_scales=args.locations,
+      page_size=args.page_size,
+      seed=args.seed,
+    )
+  finally:
+    await async_engine.dispose()
+
+  data = run.to_dict({**meta, "min_time": args.min_time, "filter": args.filter})
+  write_results(args.output, data)
+  print(f"\n结果已写入 {args.output}")
+
+  if args.baseline:
+    with open(args.baseline, encoding="utf-8") as f:
+      baseline = json.load(f)
+    rows = compare(data, baseline, args.max_regression)
+    print_comparison(rows)
+    regressions = [row for row in rows if row["regressed"]]
+    if regressions:
+      print(f"\n{len(regressions)} 个用例的中位数退化超过 {args.max_regression:.0%}")
+      return 1
+  return 0
+
+
+def parse_args(argv=None):
+  parser = argparse.ArgumentParser(description="后端热点路径的微基准测试")
+  parser.add_argument("--users", type=int, default=10, help="写入的用户数")
+  parser.add_argument("--entries", type=int, default=5000, help="每个用户的日记数")
+  parser.add_argument(
+    "--locations", type=lambda value: [int(part) for part in value.split(",")], default=[10000, 100000],
+    help="逐级测试的位置总量，逗号分隔（默认 10000,100000）"
+  )
+  parser.add_argument("--page-size", type=int, default=20, help="分页列表的每页条数")
+  parser.add_argument("--min-time", type=float, default=0.5, help="每个用例的最短计时（秒）")
+  parser.add_argument("--filter", default=None, help="只运行名称中包含该子串的用例")
+  parser.add_argument("--seed", type=int, default=42, help="数据生成的随机数种子")
+  parser.add_argument("--output", default="benchmarks/results/latest.json", help="结果 JSON 的路径")
+  parser.add_argument("--baseline", default=None, help="用于比较的基线结果 JSON")
+  parser.add_argument("--max-regression", type=float, default=0.2, help="允许的中位数退化比例（0.2 表示 20%%）")
+  parser.add_argument("--database", default=None, help="SQLite 数据库文件（默认使用临时文件，必须是新文件）")
+  parser.add_argument("--quick", action="store_true", help="小规模快速检查：2 个用户 x 500 条日记，1000 个位置")
+  args = parser.parse_args(argv)
+  if args.quick:
+    args.users, args.entries, args.locations, args.min_time = 2, 500, [1000], min(args.min_time, 0.05)
+  args.locations = sorted(args.locations)
+  return args
+
+
+def main(argv=None) -> int:
+  args = parse_args(argv)
+  database = args.database or os.path.join(tempfile.mkdtemp(prefix="travel-globe-bench-"), "bench.db")
+  if os.path.exists(database):
+    print(f"数据库文件已存在: {database}，请指定一个新文件", file=sys.stderr)
+    return 2
+  configure_environment(database)
+  print(f"基准数据库: {database}")
+  return asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+  sys.exit(main())
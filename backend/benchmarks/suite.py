@@ -0,0 +1,166 @@
+# benchmarks/suite.py
+# 后端热点路径的基准用例（由 benchmarks/run.py 在配置好环境变量后导入）
+# - stats:         get_user_stats 的计数器主键读取，以及按 entry 表重建计数器
+# - location:      get_or_create_location 在不同位置总量下的命中与新建，网格索引与数据库范围查询
+# - serialization: DiaryListItem.model_validate 处理一页和全部日记（ORM 对象与流式接口的行映射）
+# - auth:          get_current_user 中的 JWT 解码、缓存未命中时的完整校验、缓存命中
+# - ai:            generate_diary_draft 中的正则 JSON 提取，以及经本地模拟提供方的完整调用
+import json
+import random
+from itertools import count, cycle
+from types import SimpleNamespace
+from typing import Dict, List
+
+from jose import jwt
+from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.constants.ai_constants import DIARY_GENERATION_SYSTEM_INSTRUCTION
+from app.database import async_engine, engine
+from app.models import DiaryListItem, Entry
+from app.routers.entry import DIARY_LIST_COLUMNS, get_or_create_location
+from app.routers.user import ALGORITHM, SECRET_KEY, create_access_token, get_current_user, verify_token
+from app.services.ai_providers import LocalProvider
+from app.services.ai_service import generate_diary_draft, extract_json_text
+from app.services.auth_cache import token_cache
+from app.services.location_resolver import location_resolver
+from app.services.location_service import find_nearby_location
+from app.services.stats_service import get_user_stats, rebuild_user_stats
+from benchmarks.harness import BenchmarkRun
+from benchmarks.seed import sample_locations, seed_entries, seed_locations, seed_users
+
+# 每个位置规模下用于命中查询的已有位置数
+LOCATION_SAMPLES = 500
+
+
+async def bench_stats(run: BenchmarkRun, user_id: int, entries: int):
+  with Session(engine) as session:
+    # 有计数器行时直接主键读取，不经过统计缓存（见 stats_service.get_user_stats）
+    await run.bench("get_user_stats[counter_row]", "stats", lambda: get_user_stats(user_id, session), entries=entries)
+
+    def rebuild():
+      rebuild_user_stats(session, user_id)
+      session.rollback()
+
+    await run.bench("rebuild_user_stats", "stats", rebuild, entries=entries)
+
+
+async def bench_locations(run: BenchmarkRun, scales: List[int], rng: random.Random):
+  new_points = count()
+  for scale in scales:
+    seed_locations(engine, scale, rng)
+    with Session(engine) as session:
+      location_resolver.load(session)
+    samples = cycle(sample_locations(engine, LOCATION_SAMPLES, rng))
+    misses = cycle([(rng.uniform(-60, 70), rng.uniform(-180, 180)) for _ in range(LOCATION_SAMPLES)])
+    print(f"  -- {scale:,} locations")
+
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+      async def hit():
+        lat, lng, name = next(samples)
+        await get_or_create_location({"lat": lat, "lng": lng}, name, session)
+
+      async def create():
+        # 每次使用新的坐标和名称，走 "索引与数据库都未命中 -> 新建并提交" 的完整路径
+        index = next(new_points)
+        lat, lng = -89.0 + (index // 1000) * 0.001, -179.0 + (index % 1000) * 0.001
+        await get_or_create_location({"lat": lat, "lng": lng}, f"Bench new place {index}", session)
+
+      await run.bench(f"get_or_create_location[hit,locations={scale}]", "location", hit, locations=scale)
+      await run.bench(f"get_or_create_location[create,locations={scale}]", "location", create, locations=scale)
+
+    with Session(engine) as session:
+      await run.bench(
+        f"location_resolver.find[miss,locations={scale}]", "location",
+        lambda: location_resolver.find(*next(misses)), locations=scale
+      )
+      await run.bench(
+        f"find_nearby_location[db,locations={scale}]", "location",
+        lambda: find_nearby_location(session, *next(misses)), locations=scale
+      )
+
+
+async def bench_serialization(run: BenchmarkRun, user_id: int, page_size: int):
+  with Session(engine) as session:
+    entries = session.exec(select(Entry).where(Entry.user_id == user_id).order_by(Entry.id)).all()
+    rows = [dict(row._mapping) for row in session.exec(
+      select(*DIARY_LIST_COLUMNS).where(Entry.user_id == user_id).order_by(Entry.id)
+    )]
+    page = entries[:page_size]
+    await run.bench(
+      f"DiaryListItem.model_validate[orm,n={len(page)}]", "serialization",
+      lambda: [DiaryListItem.model_validate(entry) for entry in page], items=len(page)
+    )
+    await run.bench(
+      f"DiaryListItem.model_validate[orm,n={len(entries)}]", "serialization",
+      lambda: [DiaryListItem.model_validate(entry) for entry in entries], items=len(entries)
+    )
+    await run.bench(
+      f"DiaryListItem.model_validate[mapping,n={len(rows)}]", "serialization",
+      lambda: [DiaryListItem.model_validate(row) for row in rows], items=len(rows)
+    )
+
+
+async def bench_auth(run: BenchmarkRun, user_id: int, username: str):
+  token = create_access_token(data={"sub": username, "uid": user_id})
+  request = SimpleNamespace(cookies={"access_token": token})
+  await run.bench("jwt.decode", "auth", lambda: jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]))
+
+  async with AsyncSession(async_engine, expire_on_commit=False) as session:
+    async def cache_miss():
+      token_cache.clear()
+      await get_current_user(request, session)
+
+    await run.bench("verify_token", "auth", lambda: verify_token(token, session))
+    await run.bench("get_current_user[cache_miss]", "auth", cache_miss)
+    await run.bench("get_current_user[cache_hit]", "auth", lambda: get_current_user(request, session))
+
+
+def _diary_responses() -> Dict[str, str]:
+  """模型输出样本：本地模拟的草稿、带很长正文的草稿，以及没有 JSON 的长文本"""
+  prompt = "Reference Date (Today's Date): 2025-05-01.\nPlease generate a travel diary JSON based on the following description:\n去了西湖"
+  draft = LocalProvider.canned_text(DIARY_GENERATION_SYSTEM_INSTRUCTION, prompt)
+  long_draft = json.loads(extract_json_text(draft))
+  long_draft["content"] = "✨ 在湖边走了一整天。" * 800
+  return {
+    "draft": "Here is your diary:\n" + draft,
+    "long_draft": "```json\n" + json.dumps(long_draft, ensure_ascii=False) + "\n```",
+    "no_json": "抱歉，我无法根据这段描述生成日记。" * 400,
+  }
+
+
+async def bench_ai(run: BenchmarkRun):
+  for label, text in _diary_responses().items():
+    def extract(text=text):
+      json_str = extract_json_text(text)
+      return json.loads(json_str) if json_str is not None else None
+
+    await run.bench(f"extract_json[{label}]", "ai", extract, chars=len(text))
+
+  prompts = cycle([f"第{index}次去西湖，骑车绕湖一圈" for index in range(100)])
+  await run.bench("generate_diary_draft[cache_hit]", "ai", lambda: generate_diary_draft("去了西湖，骑车绕湖一圈"))
+  await run.bench(
+    "generate_diary_draft[local_provider]", "ai",
+    lambda: generate_diary_draft(next(prompts), bypass_cache=True)
+  )
+
+
+async def run_suite(run: BenchmarkRun, users: int, entries: int, location_scales: List[int], page_size: int, seed: int) -> dict:
+  """写入数据并运行全部用例，返回数据规模（写入结果的 meta）"""
+  rng = random.Random(seed)
+  print(f"写入 {users} 个用户 x {entries} 条日记...")
+  user_list = seed_users(engine, users)
+  seed_entries(engine, [user_id for user_id, _ in user_list], entries, rng)
+  user_id, username = user_list[0]
+
+  print("[stats]")
+  await bench_stats(run, user_id, entries)
+  print("[location]")
+  await bench_locations(run, location_scales, rng)
+  print("[serialization]")
+  await bench_serialization(run, user_id, page_size)
+  print("[auth]")
+  await bench_auth(run, user_id, username)
+  print("[ai]")
+  await bench_ai(run)
+  return {"users": users, "entries_per_user": entries, "location_scales": location_scales, "page_size": page_size, "seed": seed}
@@ -1,27 +1,55 @@
 # backend/tests/conftest.py
 
+import asyncio
+import os
+import tempfile
+
+# 在导入应用之前设置：测试使用临时目录中的数据库和 SQLite 缓存文件，
+# 不读写开发环境的 backend/.cache，也不受上一次测试运行留下的缓存影响
+TEST_DATA_DIR = tempfile.mkdtemp(prefix="travel-globe-test-")
+os.environ["CACHE_SQLITE_PATH"] = os.path.join(TEST_DATA_DIR, "cache.sqlite3")
+
 import pytest
 from fastapi.testclient import TestClient
 from sqlmodel import SQLModel, create_engine, Session
-from sqlalchemy.pool import StaticPool  # <--- [新增] 必须导入这个
-from app.database import get_session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+from app.database import get_async_session, get_session
 from app import app
 from app.models import User
-from app.routers.user import get_password_hash
+from app.services.password_service import password_hasher
+from app.services.cache import clear_all_caches
+from app.services.location_resolver import location_resolver
+from app.services.mood_queue import mood_analysis_queue
 
 # ==================== 核心：测试数据库设置 ====================
 
-# 使用内存数据库
-TEST_DATABASE_URL = "sqlite:///:memory:"
+# 路由通过异步引擎（aiosqlite）访问数据库，测试代码通过同步引擎准备和检查数据，
+# 两者需要看到同一个数据库，因此使用临时文件而不是内存数据库
+TEST_DATABASE_PATH = os.path.join(TEST_DATA_DIR, "test.db")
+TEST_DATABASE_URL = f"sqlite:///{TEST_DATABASE_PATH}"
 
-# 配置 Engine
-# 1. connect_args={"check_same_thread": False}: 允许不同线程访问同一个连接（FastAPI 需要）
-# 2. poolclass=StaticPool: 保持内存数据库在整个测试会话中存在，不会因为连接断开而清空表结构
+# connect_args={"check_same_thread": False}: 允许不同线程访问同一个连接（FastAPI 需要）
 engine = create_engine(
   TEST_DATABASE_URL,
   connect_args={"check_same_thread": False},
-  poolclass=StaticPool,
 )
+# NullPool: 异步连接不跨事件循环复用（TestClient 每个测试启动自己的事件循环）
+async_engine = create_async_engine(
+  f"sqlite+aiosqlite:///{TEST_DATABASE_PATH}",
+  poolclass=NullPool,
+)
+
+@pytest.fixture(autouse=True)
+def reset_caches():
+  """
+  每个测试前清空进程内缓存和位置索引，避免上一个测试的位置ID、统计数据泄漏到下一个测试。
+  """
+  clear_all_caches()
+  location_resolver.clear()
+  yield
+
 
 @pytest.fixture(name="session")
 def session_fixture():
@@ -29,7 +57,6 @@ def session_fixture():
   为每个测试创建一个独立的数据库会话。
   """
   # 在创建 session 之前，确保表已经存在
-  # 这里使用了 StaticPool，所以表结构会保留
   SQLModel.metadata.create_all(engine)
 
   with Session(engine) as session:
@@ -43,18 +70,28 @@ def session_fixture():
 @pytest.fixture(name="client")
 def client_fixture(session: Session):
   """
-  创建一个 TestClient，并用测试会话覆盖真实的 get_session 依赖。
+  创建一个 TestClient，并用测试数据库覆盖真实的 get_session / get_async_session 依赖。
   """
   def get_session_override():
     return session
 
+  async def get_async_session_override():
+    async with AsyncSession(async_engine, expire_on_commit=False) as async_session:
+      yield async_session
+
   app.dependency_overrides[get_session] = get_session_override
+  app.dependency_overrides[get_async_session] = get_async_session_override
+  default_session_factory = mood_analysis_queue.session_factory
+  mood_analysis_queue.session_factory = lambda: AsyncSession(async_engine, expire_on_commit=False)
 
   # 使用 with 语句上下文管理器，确保生命周期正确处理
   with TestClient(app) as client:
+    # 启动时的预热读取的是应用配置的数据库，这里改为从测试数据库载入
+    location_resolver.load(session)
     yield client
 
   app.dependency_overrides.clear()
+  mood_analysis_queue.session_factory = default_session_factory
 
 
 # ==================== 辅助 Fixtures ====================
@@ -66,7 +103,7 @@ def test_user_fixture(session: Session) -> User:
   """
   username = "testuser"
   password = "password123"
-  hashed_password = get_password_hash(password)
+  hashed_password = asyncio.run(password_hasher.hash(password))
 
   user = User(username=username, hashed_password=hashed_password)
   session.add(user)
@@ -1,9 +1,25 @@
 # backend/tests/test_ai.py
 
+import asyncio
+import time
+from types import SimpleNamespace
+
 import pytest
 from fastapi.testclient import TestClient
+from sqlmodel.ext.asyncio.session import AsyncSession
 from unittest.mock import AsyncMock
 
+from app.constants.ai_constants import AI_MODEL_FALLBACK_LIST
+from app.services.ai_service import (
+  _execute_genai_request_with_fallback, ai_result_cache, analyze_mood_text, generate_diary_draft, stream_travel_advice
+)
+from app.services.ai_limits import AIOverloaded, ModelLimiter
+from app.services.ai_providers import LocalProvider, LocalProviderError
+from app.services.cache import Cache, MemoryBackend, clear_all_caches
+from app.services.conversation_service import ConversationManager, estimate_tokens
+from app.services.model_registry import ModelRegistry
+from google.api_core import exceptions as google_exceptions
+
 def test_ai_chat(auth_client: TestClient, mocker):
   """
   测试 AI 聊天接口。
@@ -62,3 +78,495 @@ def test_generate_diary_draft(auth_client: TestClient, mocker):
   # 只要 Mock 生效，就不会去调用真实的 Google API，也就不会报 Event loop closed 错误
   assert res.status_code == 200
   assert res.json() == mock_diary_data
+
+
+def test_mood_analysis_result_cache(mocker):
+  """
+  相同（规范化后）的心情文本只调用一次模型；大小写不同视为不同的文本；bypass_cache 时强制重新调用。
+  """
+  model_name = AI_MODEL_FALLBACK_LIST[0]
+  mock_request = mocker.patch(
+    "app.services.ai_service._execute_genai_request_with_fallback",
+    new_callable=AsyncMock,
+    return_value=(SimpleNamespace(text='{"mood_vector": 0.8, "mood_reason": "开心"}'), model_name)
+  )
+  hits_before = ai_result_cache.stats.hits
+
+  first = asyncio.run(analyze_mood_text("happy  today"))
+  second = asyncio.run(analyze_mood_text("  happy today"))
+  assert first == second == {"mood_vector": 0.8, "mood_reason": "开心"}
+  assert mock_request.await_count == 1
+  assert ai_result_cache.stats.hits == hits_before + 1
+
+  asyncio.run(analyze_mood_text("Happy today"))
+  assert mock_request.await_count == 2
+
+  asyncio.run(analyze_mood_text("happy today", bypass_cache=True))
+  assert mock_request.await_count == 3
+
+
+def test_unparsable_ai_result_is_not_cached(mocker):
+  """
+  无法解析的输出不写入缓存，下次请求会重新调用模型。
+  """
+  mock_request = mocker.patch(
+    "app.services.ai_service._execute_genai_request_with_fallback",
+    new_callable=AsyncMock,
+    return_value=(SimpleNamespace(text="no json here"), AI_MODEL_FALLBACK_LIST[0])
+  )
+  asyncio.run(analyze_mood_text("tired"))
+  asyncio.run(analyze_mood_text("tired"))
+  assert mock_request.await_count == 2
+
+
+def make_registry(cooldown: float = 60.0) -> ModelRegistry:
+  return ModelRegistry(
+    ["model-a", "model-b"],
+    lambda model_name, system_instruction: SimpleNamespace(model_name=model_name),
+    failure_threshold=2,
+    cooldown_seconds=cooldown,
+    quota_cooldown_seconds=cooldown,
+    max_cooldown_seconds=cooldown * 4
+  )
+
+
+def test_quota_exhausted_model_is_skipped(mocker):
+  """
+  配额耗尽的模型熔断后，后续请求直接路由到可用的模型，不再先试一次失败的模型。
+  """
+  registry = make_registry()
+  mocker.patch("app.services.ai_service.model_registry", registry)
+  calls = []
+
+  async def generation_func(model):
+    calls.append(model.model_name)
+    if model.model_name == "model-a":
+      raise google_exceptions.ResourceExhausted("quota")
+    return SimpleNamespace(text="ok")
+
+  asyncio.run(_execute_genai_request_with_fallback(generation_func))
+  asyncio.run(_execute_genai_request_with_fallback(generation_func))
+  assert calls == ["model-a", "model-b", "model-b"]
+
+  status = {model["name"]: model for model in registry.info()["models"]}
+  assert status["model-a"]["state"] == "open"
+  assert status["model-a"]["quota_errors"] == 1
+  assert status["model-b"]["state"] == "closed"
+  assert status["model-b"]["successes"] == 2
+  # 同一个模型 + 系统指令的句柄只创建一次
+  assert registry.info()["cached_handles"] == 2
+
+
+def test_circuit_half_open_recovery():
+  """
+  冷却期结束后放行一次试探请求：成功则恢复，失败则以加倍的冷却时间重新熔断。
+  """
+  registry = make_registry(cooldown=0.05)
+  registry.record_error("model-a", RuntimeError("boom"))
+  assert registry.candidates() == ["model-a", "model-b"]  # 未达到熔断阈值，仍按优先级排序
+  registry.record_error("model-a", RuntimeError("boom"))
+  assert registry.candidates() == ["model-b"]
+
+  time.sleep(0.06)
+  assert registry.candidates() == ["model-a", "model-b"]  # half_open 的模型优先获得试探请求
+  assert registry.try_acquire("model-a")
+  assert not registry.try_acquire("model-a")  # 同一时间只放行一个试探请求
+  assert registry.candidates() == ["model-b"]
+  registry.record_error("model-a", RuntimeError("still down"))
+  assert registry.candidates() == ["model-b"]
+  assert registry.info()["models"][0]["retry_in_seconds"] > 0.05
+
+  time.sleep(0.11)
+  registry.candidates()
+  assert registry.try_acquire("model-a")
+  registry.record_success("model-a", 12.0)
+  assert registry.candidates() == ["model-a", "model-b"]
+
+
+def test_primary_model_regains_traffic_after_transient_failure(mocker):
+  """
+  首选模型失败一次被熔断后，冷却期结束即获得试探请求，恢复后重新承接流量；
+  降级模型响应更快也不会把流量固定在它身上。
+  """
+  registry = make_registry(cooldown=0.05)
+  mocker.patch("app.services.ai_service.model_registry", registry)
+  calls = []
+  primary_down = True
+
+  async def generation_func(model):
+    calls.append(model.model_name)
+    if model.model_name == "model-a" and primary_down:
+      raise google_exceptions.ResourceExhausted("quota")
+    return SimpleNamespace(text="ok")
+
+  asyncio.run(_execute_genai_request_with_fallback(generation_func))
+  asyncio.run(_execute_genai_request_with_fallback(generation_func))
+  assert calls == ["model-a", "model-b", "model-b"]
+  registry.record_success("model-b", 1.0)
+
+  time.sleep(0.06)
+  primary_down = False
+  calls.clear()
+  asyncio.run(_execute_genai_request_with_fallback(generation_func))
+  asyncio.run(_execute_genai_request_with_fallback(generation_func))
+  assert calls == ["model-a", "model-a"]
+  status = {model["name"]: model for model in registry.info()["models"]}
+  assert status["model-a"]["state"] == "closed"
+  assert status["model-a"]["consecutive_failures"] == 0
+
+
+def test_model_status_endpoint(client: TestClient):
+  res = client.get("/api/ai/models/status")
+  assert res.status_code == 200
+  names = [model["name"] for model in res.json()["models"]]
+  assert names == AI_MODEL_FALLBACK_LIST
+
+
+def test_ai_chat_stream(client: TestClient, mocker):
+  """
+  流式聊天接口以 SSE 逐段推送文本，最后发送 done 事件。
+  """
+  async def fake_stream(messages):
+    for delta in ["你好", "，我是", "小蜜蜂"]:
+      yield delta
+
+  mocker.patch("app.routers.ai.stream_travel_advice", fake_stream)
+  res = client.post("/api/ai/chat/stream", json={"messages": [{"role": "user", "content": "你好"}]})
+
+  assert res.status_code == 200
+  assert res.headers["content-type"].startswith("text/event-stream")
+  events = [block for block in res.text.split("\n\n") if block]
+  assert events[0].startswith("event: meta\ndata: {\"conversation_id\": ")
+  assert events[1:4] == [
+    'data: {"delta": "你好"}', 'data: {"delta": "，我是"}', 'data: {"delta": "小蜜蜂"}'
+  ]
+  assert events[4].startswith('event: done\ndata: {"finished": true')
+
+
+def test_chat_stream_releases_db_session_before_streaming(auth_client: TestClient, mocker):
+  """
+  流式聊天在开始推送之前就关闭数据库会话，模型生成期间不占用连接池的连接。
+  """
+  clear_all_caches()  # 令牌缓存未命中，解析用户时需要查库
+  close_spy = mocker.spy(AsyncSession, "close")
+  closes_when_streaming = []
+
+  async def fake_stream(messages):
+    closes_when_streaming.append(close_spy.call_count)
+    yield "你好"
+
+  mocker.patch("app.routers.ai.stream_travel_advice", fake_stream)
+  res = auth_client.post("/api/ai/chat/stream", json={"messages": [{"role": "user", "content": "你好"}]})
+  assert res.status_code == 200
+  assert closes_when_streaming and closes_when_streaming[0] >= 1
+
+
+def test_stream_travel_advice_falls_back_before_first_token(mocker):
+  """
+  首个分块之前的配额错误触发降级，之后逐段产出下一个模型的文本。
+  """
+  class FakeStream:
+    def __init__(self, parts):
+      self.parts = parts
+
+    async def __aiter__(self):
+      for part in self.parts:
+        yield SimpleNamespace(text=part)
+
+  class FakeChat:
+    def __init__(self, model_name):
+      self.model_name = model_name
+
+    async def send_message_async(self, message, safety_settings=None, stream=False):
+      assert stream
+      if self.model_name == "model-a":
+        raise google_exceptions.ResourceExhausted("quota")
+      return FakeStream(["第一段", "", "第二段"])
+
+  registry = ModelRegistry(
+    ["model-a", "model-b"],
+    lambda model_name, system_instruction: SimpleNamespace(
+      model_name=model_name, start_chat=lambda history: FakeChat(model_name)
+    ),
+    failure_threshold=2, cooldown_seconds=60, quota_cooldown_seconds=60, max_cooldown_seconds=60
+  )
+  mocker.patch("app.services.ai_service.model_registry", registry)
+
+  async def collect():
+    return [delta async for delta in stream_travel_advice([{"role": "user", "content": "去哪玩"}])]
+
+  assert asyncio.run(collect()) == ["第一段", "第二段"]
+  assert registry.info()["models"][0]["state"] == "open"
+
+
+def test_model_limiter_bounds_concurrency_and_queue():
+  """
+  并发已满时请求排队，排队也满时立即拒绝；名额释放后由排队的请求接手。
+  """
+  limiter = ModelLimiter(max_concurrency=1, max_waiting=1, queue_timeout=1.0)
+  running = []
+
+  async def call(name):
+    async with limiter:
+      running.append(name)
+      await asyncio.sleep(0.02)
+      return name
+
+  async def burst():
+    return await asyncio.gather(call("a"), call("b"), call("c"), return_exceptions=True)
+
+  results = asyncio.run(burst())
+  assert results[:2] == ["a", "b"]
+  assert isinstance(results[2], AIOverloaded)
+  assert running == ["a", "b"]
+  info = limiter.info()
+  assert info["in_flight"] == 0 and info["waiting"] == 0
+  assert info["acquired"] == 2 and info["rejected"] == 1
+
+
+def test_fallback_prefers_idle_model_over_queueing(mocker):
+  """
+  排在前面的模型并发已满时，先使用有空闲名额的后备模型，而不是在前面的模型上排队。
+  """
+  registry = ModelRegistry(
+    ["model-a", "model-b"],
+    lambda model_name, system_instruction: SimpleNamespace(model_name=model_name),
+    failure_threshold=2, cooldown_seconds=60, quota_cooldown_seconds=60, max_cooldown_seconds=60,
+    limiter_factory=lambda: ModelLimiter(max_concurrency=1, max_waiting=1, queue_timeout=1.0)
+  )
+  mocker.patch("app.services.ai_service.model_registry", registry)
+  busy = registry.limiter("model-a")
+  assert busy.try_acquire() and not busy.try_acquire()
+
+  async def generate(model):
+    assert busy.waiting == 0
+    return model.model_name
+
+  assert asyncio.run(_execute_genai_request_with_fallback(generate)) == "model-b"
+  assert registry.limiter("model-b").in_flight == 0
+  busy.release()
+  assert busy.in_flight == 0
+
+
+def test_stream_holds_model_slot_until_closed(mocker):
+  """
+  流式回复占用模型的并发名额直到流被读完或关闭，而不是在收到首个分块时就释放。
+  """
+  async def fake_stream():
+    for part in ["第一段", "第二段"]:
+      yield SimpleNamespace(text=part)
+
+  class FakeChat:
+    async def send_message_async(self, message, safety_settings=None, stream=False):
+      return fake_stream()
+
+  registry = ModelRegistry(
+    ["model-a"],
+    lambda model_name, system_instruction: SimpleNamespace(model_name=model_name, start_chat=lambda history: FakeChat()),
+    failure_threshold=2, cooldown_seconds=60, quota_cooldown_seconds=60, max_cooldown_seconds=60,
+    limiter_factory=lambda: ModelLimiter(max_concurrency=1, max_waiting=0, queue_timeout=1.0)
+  )
+  mocker.patch("app.services.ai_service.model_registry", registry)
+  limiter = registry.limiter("model-a")
+
+  async def run():
+    stream = stream_travel_advice([{"role": "user", "content": "去哪玩"}])
+    assert await stream.__anext__() == "第一段"
+    in_flight_while_streaming = limiter.in_flight
+    await stream.aclose()
+    return in_flight_while_streaming
+
+  assert asyncio.run(run()) == 1
+  assert limiter.in_flight == 0
+
+
+def test_identical_requests_share_one_call(mocker):
+  """
+  执行中的相同请求（规范化后）合并为一次远程调用。
+  """
+  async def slow_request(**kwargs):
+    await asyncio.sleep(0.05)
+    return SimpleNamespace(text='{"mood_vector": 0.3, "mood_reason": "累"}'), AI_MODEL_FALLBACK_LIST[0]
+
+  mock_request = mocker.patch(
+    "app.services.ai_service._execute_genai_request_with_fallback", side_effect=slow_request
+  )
+
+  async def burst():
+    return await asyncio.gather(*(analyze_mood_text(text) for text in ["tired", "tired ", "  tired"]))
+
+  results = asyncio.run(burst())
+  assert all(result == {"mood_vector": 0.3, "mood_reason": "累"} for result in results)
+  assert mock_request.call_count == 1
+
+
+def test_generate_diary_overloaded(auth_client: TestClient, mocker):
+  mocker.patch(
+    "app.routers.ai.generate_diary_draft",
+    new_callable=AsyncMock,
+    side_effect=AIOverloaded("busy")
+  )
+  res = auth_client.post("/api/ai/generate-diary", json={"prompt": "昨天去了北京"})
+  assert res.status_code == 503
+  assert res.headers["retry-after"] == "2"
+
+
+def test_chat_conversation_is_kept_server_side(client: TestClient, mocker):
+  """
+  第一轮返回 conversation_id；之后只发送新消息，服务端补全之前的对话。
+  """
+  mock_advice = mocker.patch(
+    "app.routers.ai.get_travel_advice",
+    new_callable=AsyncMock,
+    side_effect=["推荐京都", "秋天最好"]
+  )
+  first = client.post("/api/ai/chat", json={"messages": [{"role": "user", "content": "日本去哪"}]}).json()
+  conversation_id = first["conversation_id"]
+
+  second = client.post("/api/ai/chat", json={
+    "conversation_id": conversation_id,
+    "messages": [{"role": "user", "content": "什么季节"}]
+  }).json()
+  assert second["content"] == "秋天最好"
+  assert second["conversation_id"] == conversation_id
+  sent = mock_advice.await_args_list[1].args[0]
+  assert [message["content"] for message in sent] == ["日本去哪", "推荐京都", "什么季节"]
+
+
+def test_chat_rejects_conversation_ids_not_issued_to_caller(client: TestClient, mocker):
+  """
+  会话ID绑定到签发时的匿名会话：伪造的ID和其他人的ID都返回 404。
+  """
+  mocker.patch("app.routers.ai.get_travel_advice", new_callable=AsyncMock, return_value="推荐京都")
+  first = client.post("/api/ai/chat", json={"messages": [{"role": "user", "content": "日本去哪"}]})
+  assert first.cookies.get("ai_session")
+  conversation_id = first.json()["conversation_id"]
+
+  forged = client.post("/api/ai/chat", json={
+    "conversation_id": "guessed-id", "messages": [{"role": "user", "content": "什么季节"}]
+  })
+  assert forged.status_code == 404
+
+  client.cookies.set("ai_session", "someone-else")
+  other = client.post("/api/ai/chat/stream", json={
+    "conversation_id": conversation_id, "messages": [{"role": "user", "content": "什么季节"}]
+  })
+  assert other.status_code == 404
+
+
+def test_concurrent_turns_are_not_lost():
+  """
+  两个请求读到同一个会话状态后先后保存，两轮对话都保留。
+  """
+  manager = ConversationManager(
+    Cache("test_conversations", MemoryBackend(maxsize=10)),
+    AsyncMock(),
+    token_budget=1000,
+    message_max_tokens=100,
+    summary_max_tokens=100,
+    secret="test-secret"
+  )
+  conversation_id = manager.new_id("user:1")
+  first = manager.load(conversation_id, "user:1")
+  second = manager.load(conversation_id, "user:1")
+  manager.record_turn(conversation_id, first, {"role": "user", "content": "问题一"}, "回答一")
+  manager.record_turn(conversation_id, second, {"role": "user", "content": "问题二"}, "回答二")
+  state = manager.load(conversation_id, "user:1")
+  assert [message["content"] for message in state["messages"]] == ["问题一", "回答一", "问题二", "回答二"]
+
+
+def test_conversation_context_stays_within_budget():
+  """
+  对话变长后，较早的轮次被合并进摘要，每次发送的上下文和保存的会话都保持有界。
+  """
+  summarizer = AsyncMock(side_effect=lambda summary, turns, max_tokens: f"{summary}+{len(turns)}")
+  manager = ConversationManager(
+    Cache("test_conversations", MemoryBackend(maxsize=10)),
+    summarizer,
+    token_budget=40,
+    message_max_tokens=15,
+    summary_max_tokens=30,
+    secret="test-secret"
+  )
+  conversation_id = manager.new_id("user:1")
+
+  async def chat(turns):
+    sizes = []
+    for index in range(turns):
+      state = manager.load(conversation_id, "user:1")
+      new_message = {"role": "user", "content": f"第{index}个问题" + "很长" * 20}
+      context = manager.build_messages(state, new_message)
+      sizes.append(sum(estimate_tokens(message["content"]) for message in context[:-1]))
+      manager.record_turn(conversation_id, state, new_message, f"第{index}个回答")
+      await manager.wait_idle()
+    return sizes
+
+  sizes = asyncio.run(chat(30))
+  state = manager.load(conversation_id, "user:1")
+  assert state["summary"].startswith("+")
+  assert summarizer.await_count >= 1
+  # 历史消息受预算限制，再加上长度有上限的摘要
+  assert max(sizes) <= 40 + 30 + estimate_tokens("Summary of our earlier conversation (for context):\n") + 20
+  assert len(state["messages"]) <= 8
+  assert manager.info()["compactions"] == summarizer.await_count
+
+
+def use_local_provider(mocker, **options) -> LocalProvider:
+  provider = LocalProvider(**{"latency_ms": 1.0, "latency_sigma": 0.0, **options})
+  registry = ModelRegistry(
+    AI_MODEL_FALLBACK_LIST, provider.create_model,
+    failure_threshold=2, cooldown_seconds=60, quota_cooldown_seconds=60, max_cooldown_seconds=60
+  )
+  mocker.patch("app.services.ai_service.ai_provider", provider)
+  mocker.patch("app.services.ai_service.model_registry", registry)
+  return provider
+
+
+def test_local_provider_serves_diary_mood_and_chat(mocker):
+  """
+  本地模拟提供方经过完整的降级链路返回可解析的日记和心情结果，聊天支持流式输出。
+  """
+  provider = use_local_provider(mocker, exhausted_models=[AI_MODEL_FALLBACK_LIST[0]])
+
+  draft = asyncio.run(generate_diary_draft("周末去西湖骑车", bypass_cache=True))
+  assert {"title", "dateStart", "dateEnd", "location", "coordinates", "content"} <= set(draft)
+
+  mood = asyncio.run(analyze_mood_text("今天很开心", fallback=False, bypass_cache=True))
+  again = asyncio.run(analyze_mood_text("今天很开心", fallback=False, bypass_cache=True))
+  assert mood == again and 0.0 <= mood["mood_vector"] <= 1.0
+
+  async def collect():
+    return [delta async for delta in stream_travel_advice([{"role": "user", "content": "杭州怎么玩"}])]
+
+  deltas = asyncio.run(collect())
+  assert len(deltas) > 1 and "杭州怎么玩" in "".join(deltas)
+
+  # 配额耗尽的模型被熔断，后续请求直接使用下一个模型
+  assert provider.injected_quota_errors == 1
+  assert provider.calls == 5
+
+
+def test_local_provider_failure_injection_is_reproducible():
+  """
+  相同的种子得到相同的延迟和错误序列，注入的比例接近配置值。
+  """
+  async def run(provider):
+    model = provider.create_model("model-a", None)
+    outcomes = []
+    for index in range(200):
+      try:
+        await model.generate_content_async(f"prompt {index}")
+        outcomes.append("ok")
+      except google_exceptions.ResourceExhausted:
+        outcomes.append("quota")
+      except LocalProviderError:
+        outcomes.append("error")
+    return outcomes
+
+  options = {"latency_ms": 0.01, "latency_sigma": 1.0, "error_rate": 0.2, "quota_error_rate": 0.1, "seed": 7}
+  first = LocalProvider(**options)
+  outcomes = asyncio.run(run(first))
+  assert outcomes == asyncio.run(run(LocalProvider(**options)))
+  assert 20 <= outcomes.count("error") <= 60
+  assert 5 <= outcomes.count("quota") <= 35
+  assert first.info()["injected_errors"] == outcomes.count("error")
@@ -1,8 +1,16 @@
 # backend/tests/test_auth.py
 
+import asyncio
+
 from fastapi.testclient import TestClient
+from jose import jwt
+from passlib.context import CryptContext
 from sqlmodel import Session, select
-from app.models import User
+from app.config import settings
+from app.models import RevokedToken, User
+from app.services.auth_cache import token_cache, token_key
+from app.services.cache import clear_all_caches
+from app.services.password_service import PasswordHasher, PasswordHasherBusy
 
 # 测试用户注册
 def test_register_user(client: TestClient, session: Session):
@@ -116,3 +124,76 @@ def test_logout(auth_client: TestClient):
   res_after_logout = auth_client.get("/api/auth/me")
   assert res_after_logout.status_code == 401
 
+# 测试令牌缓存与撤销
+def test_token_cache_hit(auth_client: TestClient, test_user: User):
+  """
+  令牌携带 uid；首次请求校验后写入令牌缓存，之后的请求直接命中缓存。
+  """
+  token = auth_client.cookies["access_token"]
+  payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+  assert payload["sub"] == test_user.username
+  assert payload["uid"] == test_user.id
+
+  assert auth_client.get("/api/auth/me").status_code == 200
+  hits_before = token_cache.stats.hits
+  res = auth_client.get("/api/entries")
+  assert res.status_code == 200
+  assert token_cache.stats.hits == hits_before + 1
+
+
+def test_logout_revokes_token(auth_client: TestClient, session: Session):
+  """
+  登出后旧令牌即使被重新携带也无法继续使用。
+  撤销记录保存在数据库中：清空进程内缓存（相当于换到另一个 worker）后依然有效。
+  """
+  token = auth_client.cookies["access_token"]
+  assert auth_client.get("/api/auth/me").status_code == 200
+
+  auth_client.post("/api/auth/logout")
+  assert session.get(RevokedToken, token_key(token)) is not None
+
+  clear_all_caches()
+  auth_client.cookies.set("access_token", token)
+  assert auth_client.get("/api/auth/me").status_code == 401
+
+
+# 测试密码哈希工作池
+def test_rehash_on_login(client: TestClient, session: Session):
+  """
+  cost 与当前策略不一致的旧哈希在登录成功后被重新计算并写回。
+  """
+  legacy_hash = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash("oldpassword")
+  user = User(username="legacyuser", hashed_password=legacy_hash)
+  session.add(user)
+  session.commit()
+
+  res = client.post("/api/auth/login", json={"username": "legacyuser", "password": "oldpassword"})
+  assert res.status_code == 200
+
+  session.expire_all()
+  stored = session.get(User, user.id).hashed_password
+  assert stored != legacy_hash
+  assert stored.startswith(f"$2b${settings.BCRYPT_ROUNDS:02d}$")
+
+  stats = client.get("/api/health/password-hasher").json()
+  assert stats["rehashed"] >= 1
+  assert stats["completed"] >= 1
+  assert stats["run_ms"]["max"] > 0
+
+
+def test_password_hasher_rejects_when_queue_full():
+  """
+  所有工作者都忙且排队已满时，新任务直接被拒绝。
+  """
+  hasher = PasswordHasher(workers=1, max_queue=0)
+
+  async def burst():
+    return await asyncio.gather(hasher.hash("a"), hasher.hash("b"), return_exceptions=True)
+
+  try:
+    results = asyncio.run(burst())
+  finally:
+    hasher.shutdown()
+  assert sum(isinstance(result, PasswordHasherBusy) for result in results) == 1
+  assert hasher.info()["rejected"] == 1
+  assert hasher.info()["completed"] == 1
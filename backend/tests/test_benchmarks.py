@@ -0,0 +1,35 @@
+# backend/tests/test_benchmarks.py
+
+import asyncio
+
+from benchmarks.harness import BenchmarkRun, compare, summarize
+
+
+def test_benchmark_run_times_sync_and_async_cases():
+  """
+  同步函数和返回协程的函数都按单次调用计时，过滤条件之外的用例被跳过。
+  """
+  async def sleep_briefly():
+    await asyncio.sleep(0)
+
+  async def run_cases():
+    run = BenchmarkRun(name_filter="case", min_time=0.01)
+    await run.bench("sync_case", "demo", lambda: sum(range(100)), size=100)
+    await run.bench("async_case", "demo", lambda: sleep_briefly())
+    await run.bench("skipped", "demo", lambda: None)
+    return run
+
+  run = asyncio.run(run_cases())
+  assert [item["name"] for item in run.results] == ["sync_case", "async_case"]
+  assert run.results[0]["params"] == {"size": 100}
+  stats = run.results[0]["stats"]
+  assert stats["rounds"] >= 5 and 0 < stats["min"] <= stats["median"] <= stats["max"]
+
+
+def test_compare_flags_regressions_against_baseline():
+  def result(**medians):
+    return {"benchmarks": [{"name": name, "stats": summarize([median], 1)} for name, median in medians.items()]}
+
+  rows = compare(result(a=1.3, b=0.9, new=1.0), result(a=1.0, b=1.0, removed=1.0), max_regression=0.2)
+  assert [(row["name"], row["regressed"]) for row in rows] == [("a", True), ("b", False)]
+  assert round(rows[0]["change"], 2) == 0.3
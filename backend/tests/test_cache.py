@@ -0,0 +1,139 @@
+# backend/tests/test_cache.py
+import fnmatch
+import time
+
+from fastapi.testclient import TestClient
+
+from app.services.cache import Cache, MemoryBackend, RedisBackend, SQLiteBackend
+
+
+class FakeRedis:
+  """兼容 Redis 协议子集的本地替身（get/set/delete/scan_iter）"""
+
+  def __init__(self):
+    self.data = {}
+
+  def get(self, key):
+    value, expires_at = self.data.get(key, (None, None))
+    if expires_at is not None and expires_at <= time.monotonic():
+      self.data.pop(key, None)
+      return None
+    return value
+
+  def set(self, key, value, px=None):
+    self.data[key] = (value, time.monotonic() + px / 1000 if px else None)
+
+  def delete(self, *keys):
+    return sum(1 for key in keys if self.data.pop(key, None) is not None)
+
+  def scan_iter(self, match="*"):
+    return [key for key in list(self.data) if fnmatch.fnmatch(key, match)]
+
+
+def test_memory_cache_lru_eviction():
+  cache = Cache("test_lru", MemoryBackend(maxsize=2))
+  cache.set("a", 1)
+  cache.set("b", 2)
+  assert cache.get("a") == 1  # a 变为最近使用
+  cache.set("c", 3)  # 淘汰最久未使用的 b
+
+  assert cache.get("b") is None
+  assert cache.get("a") == 1
+  assert cache.get("c") == 3
+  assert len(cache) == 2
+
+  info = cache.info()
+  assert info["evictions"] == 1
+  assert info["hits"] == 3
+  assert info["misses"] == 1
+  assert info["sets"] == 3
+
+
+def test_memory_cache_ttl_expiration():
+  cache = Cache("test_ttl", MemoryBackend(maxsize=10), default_ttl=0.05)
+  cache.set("short", "value")
+  cache.set("forever", "value", ttl=60)
+  assert cache.get("short") == "value"
+
+  time.sleep(0.06)
+  assert cache.get("short") is None
+  assert cache.get("forever") == "value"
+  assert cache.stats.expirations == 1
+  assert len(cache) == 1
+
+
+def test_redis_backend_with_stand_in():
+  client = FakeRedis()
+  cache = Cache("test_redis", RedisBackend(client, "stats"), default_ttl=60)
+  cache.set("user_stats_1", {"diary_total": 3})
+  other = Cache("test_redis_other", RedisBackend(client, "location"))
+  other.set("1.000000_2.000000", 7)
+
+  assert cache.get("user_stats_1") == {"diary_total": 3}
+  assert len(cache) == 1
+
+  cache.clear()  # 只清理自己命名空间下的键
+  assert cache.get("user_stats_1") is None
+  assert other.get("1.000000_2.000000") == 7
+  assert cache.stats.hits == 1 and cache.stats.misses == 1
+
+
+def test_cache_info_endpoint(auth_client: TestClient):
+  auth_client.get("/api/entries/stats/summary")
+  auth_client.get("/api/entries/stats/summary")
+
+  res = auth_client.get("/api/entries/stats/cache")
+  assert res.status_code == 200
+  data = res.json()
+  assert data["stats_cache_size"] == 1
+  assert data["user_stats"]["total_entries"] == 0
+  stats_info = data["caches"]["stats"]
+  assert stats_info["backend"] == "MemoryBackend"
+  assert stats_info["hits"] >= 1
+  assert stats_info["misses"] >= 1
+  assert data["location_resolver"]["size"] == 0
+
+
+def test_sqlite_backend_persists_with_lru(tmp_path):
+  path = str(tmp_path / "cache.sqlite3")
+  cache = Cache("test_sqlite", SQLiteBackend(path, "ai", maxsize=2), default_ttl=60)
+  cache.set("a", {"text": "甲"})
+  cache.set("b", {"text": "乙"})
+  time.sleep(0.01)
+  assert cache.get("a") == {"text": "甲"}  # a 变为最近使用
+  cache.set("c", {"text": "丙"})  # 淘汰最久未使用的 b
+  assert cache.stats.evictions == 1
+
+  # 重新打开同一个文件（模拟重启），数据仍然存在
+  reopened = Cache("test_sqlite_reopened", SQLiteBackend(path, "ai", maxsize=2))
+  assert reopened.get("a") == {"text": "甲"}
+  assert reopened.get("b") is None
+  assert reopened.get("c") == {"text": "丙"}
+  assert len(reopened) == 2
+
+  # 不同命名空间互不影响
+  other = Cache("test_sqlite_other", SQLiteBackend(path, "other", maxsize=2), default_ttl=0.05)
+  other.set("a", 1)
+  time.sleep(0.06)
+  assert other.get("a") is None
+  assert other.stats.expirations == 1
+  assert reopened.get("a") == {"text": "甲"}
+
+
+def test_sqlite_backend_set_does_not_count_every_write(tmp_path):
+  """写入时条目数增量维护，只按间隔用 COUNT(*) 校正；覆盖已有的键不触发淘汰"""
+  backend = SQLiteBackend(str(tmp_path / "cache.sqlite3"), "ai", maxsize=50)
+  statements = []
+  backend._conn.set_trace_callback(statements.append)
+  cache = Cache("test_sqlite_count", backend)
+
+  for index in range(200):
+    cache.set(f"k{index}", index)
+  cache.set("k199", "覆盖")
+
+  counts = [statement for statement in statements if "COUNT(*)" in statement]
+  assert len(counts) <= 200 // 5
+  assert cache.stats.evictions == 150
+  assert len(cache) == 50
+  assert cache.get("k0") is None
+  assert cache.get("k199") == "覆盖"
@@ -1,9 +1,20 @@
 # backend/tests/test_diary.py
 
+import csv
+import io
+import json
+import struct
+from datetime import date
+from types import SimpleNamespace
 import pytest
 from fastapi.testclient import TestClient
-from sqlmodel import Session, select
-from app.models import Entry, Photo, Location
+from sqlalchemy import text
+from sqlmodel import Session, select, update
+from app.models import Entry, Photo, Location, UserStats, UserPlaceCount
+from app.services import search_service
+from app.services.cache import clear_all_caches
+from app.services.search_service import keyword_condition, relevance_order
+from app.services.stats_service import rebuild_all_user_stats, rebuild_user_stats, stats_cache
 
 class TestDiaryCRUD:
   # 定义一些测试用的数据
@@ -122,6 +133,433 @@ class TestDiaryCRUD:
     assert data_search["diary_total"] == 1
     assert data_search["guide_total"] == 0
 
+  def test_get_diaries_cursor_pagination(self, auth_client: TestClient):
+    """测试游标分页：按创建时间与开始日期两种排序翻页，结果不重不漏"""
+    for data in (self.diary_data_1, self.diary_data_2, self.wishlist_data):
+      auth_client.post("/api/entries", json=data)
+
+    def collect(params):
+      titles, cursor = [], None
+      while True:
+        query = dict(params, pagination="cursor", page_size=1)
+        if cursor:
+          query["cursor"] = cursor
+        res = auth_client.get("/api/entries", params=query)
+        assert res.status_code == 200, res.text
+        data = res.json()
+        titles.extend(item["title"] for item in data["items"])
+        cursor = data["next_cursor"]
+        assert data["has_more"] == (cursor is not None)
+        if not cursor:
+          return titles, data
+
+    # 1. 默认按创建时间倒序
+    titles, last_page = collect({})
+    assert titles == [self.wishlist_data["title"], self.diary_data_2["title"], self.diary_data_1["title"]]
+    assert last_page["total"] == 3
+
+    # 2. 按开始日期正序，没有日期的日记排在最后
+    titles, _ = collect({"sort_by": "date_start", "sort_order": "asc"})
+    assert titles == [self.diary_data_1["title"], self.diary_data_2["title"], self.wishlist_data["title"]]
+
+    # 3. 筛选时总数来自聚合统计
+    titles, last_page = collect({"entry_type": "visited"})
+    assert len(titles) == 2
+    assert last_page["total"] == 2
+
+    # 4. include_total=false 时不返回总数，其余计数器与不带该参数时一致
+    titles, last_page = collect({"entry_type": "visited", "include_total": "false"})
+    assert len(titles) == 2
+    assert last_page["total"] is None and last_page["total_pages"] is None
+    params = {"pagination": "cursor", "keyword": "京都"}
+    with_total = auth_client.get("/api/entries", params=params).json()
+    without_total = auth_client.get("/api/entries", params=dict(params, include_total="false")).json()
+    assert without_total["total"] is None
+    for key in ("diary_total", "guide_total", "place_total"):
+      assert without_total[key] == with_total[key]
+
+    # 5. 游标与排序方式不一致时返回 400
+    first = auth_client.get("/api/entries", params={"pagination": "cursor", "page_size": 1}).json()
+    res = auth_client.get("/api/entries", params={
+      "pagination": "cursor", "cursor": first["next_cursor"], "sort_by": "date_start"
+    })
+    assert res.status_code == 400
+
+  def test_keyword_search_full_text_index(self, auth_client: TestClient, session: Session):
+    """测试关键词搜索：全文索引命中、标题优先排序，以及更新 / 删除后索引同步"""
+    title_hit = auth_client.post("/api/entries", json=dict(self.diary_data_2, title="Kyoto Autumn Leaves", content="红叶")).json()
+    content_hit = auth_client.post("/api/entries", json=dict(self.diary_data_1, content="Autumn in Tokyo is lovely")).json()
+    auth_client.post("/api/entries", json=self.wishlist_data)
+
+    # 1. 长关键词走 FTS MATCH，不区分大小写，标题命中的排在前面
+    res = auth_client.get("/api/entries", params={"keyword": "AUTUMN"})
+    data = res.json()
+    assert data["total"] == 2
+    assert [item["id"] for item in data["items"]] == [title_hit["id"], content_hit["id"]]
+    assert data["diary_total"] == 2
+    assert data["guide_total"] == 0
+
+    # 2. 更新内容后索引同步
+    auth_client.put(f"/api/entries/{content_hit['id']}", json={"content": "Spring in Tokyo"})
+    res = auth_client.get("/api/entries", params={"keyword": "autumn"})
+    assert [item["id"] for item in res.json()["items"]] == [title_hit["id"]]
+
+    # 3. 删除后不再命中
+    auth_client.delete(f"/api/entries/{title_hit['id']}")
+    res = auth_client.get("/api/entries", params={"keyword": "autumn"})
+    assert res.json()["total"] == 0
+
+    # 4. 短关键词直接在 entry 表上匹配，由列表查询的 user_id 条件限定范围，不扫描所有用户的 FTS 数据
+    assert "entry_fts" not in str(keyword_condition(session, "京都"))
+    assert "entry_fts" in str(keyword_condition(session, "autumn"))
+    res = auth_client.get("/api/entries", params={"keyword": "tokyo"})
+    assert [item["id"] for item in res.json()["items"]] == [content_hit["id"]]
+    res = auth_client.get("/api/entries", params={"keyword": "北海"})
+    assert res.json()["total"] == 1
+
+  def test_relevance_order_without_pg_trgm(self, mocker):
+    """PostgreSQL 没有 pg_trgm 扩展时，关键词排序不使用 similarity()"""
+    pg_session = SimpleNamespace(get_bind=lambda: SimpleNamespace(dialect=SimpleNamespace(name="postgresql")))
+
+    def order_sql():
+      return " ".join(str(term) for term in relevance_order(pg_session, "kyoto"))
+
+    mocker.patch.object(search_service, "pg_trgm_available", False)
+    assert "similarity" not in order_sql()
+    mocker.patch.object(search_service, "pg_trgm_available", True)
+    assert "similarity" in order_sql()
+
+  def test_stats_summary(self, auth_client: TestClient):
+    """测试统计接口：一次聚合得到各项计数，写操作后缓存失效"""
+    auth_client.post("/api/entries", json=self.diary_data_1)
+    auth_client.post("/api/entries", json=dict(self.diary_data_2, location_name=self.diary_data_1["location_name"]))
+    auth_client.post("/api/entries", json=self.wishlist_data)
+
+    res = auth_client.get("/api/entries/stats/summary")
+    assert res.status_code == 200
+    assert res.json() == {"diary_total": 2, "guide_total": 1, "place_total": 1, "total_entries": 3}
+
+    auth_client.post("/api/entries", json=self.diary_data_2)
+    res = auth_client.get("/api/entries/stats/summary")
+    assert res.json() == {"diary_total": 3, "guide_total": 1, "place_total": 2, "total_entries": 4}
+
+  def test_user_stats_counters(self, auth_client: TestClient, session: Session, test_user):
+    """测试 user_stats 计数器随增删改在事务内维护，并可以重建修复偏差"""
+    first = auth_client.post("/api/entries", json=self.diary_data_1).json()
+    auth_client.post("/api/entries", json=dict(self.diary_data_2, location_name=self.diary_data_1["location_name"]))
+    wish = auth_client.post("/api/entries", json=self.wishlist_data).json()
+
+    def counters():
+      session.expire_all()
+      row = session.get(UserStats, test_user.id)
+      places = session.exec(select(UserPlaceCount).where(UserPlaceCount.user_id == test_user.id)).all()
+      return (row.diary_total, row.guide_total, row.place_total, row.total_entries), {
+        p.location_name: p.ref_count for p in places
+      }
+
+    assert counters() == ((2, 1, 1, 3), {"日本, 东京": 2})
+
+    # 心愿单转为已去过，地点变更
+    auth_client.put(f"/api/entries/{wish['id']}", json={
+      "entry_type": "visited",
+      "location_name": self.wishlist_data["location_name"],
+      "coordinates": self.wishlist_data["coordinates"]
+    })
+    assert counters() == ((3, 0, 2, 3), {"日本, 东京": 2, "日本, 北海道": 1})
+
+    auth_client.delete(f"/api/entries/{first['id']}")
+    auth_client.delete(f"/api/entries/{wish['id']}")
+    assert counters() == ((1, 0, 1, 1), {"日本, 东京": 1})
+
+    # 人为制造偏差后重建
+    row = session.get(UserStats, test_user.id)
+    row.diary_total = 42
+    session.add(row)
+    session.commit()
+    assert rebuild_all_user_stats(session, user_id=test_user.id) == 1
+    assert counters() == ((1, 0, 1, 1), {"日本, 东京": 1})
+
+  def test_user_stats_legacy_user(self, auth_client: TestClient, session: Session, test_user):
+    """测试没有计数器行的历史用户：读取时只做聚合不写库，重复重建走 upsert 不会主键冲突"""
+    auth_client.post("/api/entries", json=self.diary_data_1)
+    auth_client.post("/api/entries", json=self.wishlist_data)
+    session.delete(session.get(UserStats, test_user.id))
+    session.commit()
+    clear_all_caches()
+
+    res = auth_client.get("/api/entries/stats/summary")
+    assert res.json() == {"diary_total": 1, "guide_total": 1, "place_total": 1, "total_entries": 2}
+    session.expire_all()
+    assert session.get(UserStats, test_user.id) is None
+
+    rebuild_user_stats(session, test_user.id)
+    rebuild_user_stats(session, test_user.id)
+    session.commit()
+    session.expire_all()
+    row = session.get(UserStats, test_user.id)
+    assert (row.diary_total, row.guide_total, row.place_total, row.data_version) == (1, 1, 1, 2)
+
+  def test_get_all_diaries_stream(self, auth_client: TestClient):
+    """测试 get_all 的 NDJSON 流式返回：统计行 + 每条日记一行 + 总数行"""
+    for data in (self.diary_data_1, self.diary_data_2, self.wishlist_data):
+      auth_client.post("/api/entries", json=data)
+
+    res = auth_client.get("/api/entries", params={"get_all": "true", "stream": "true", "sort_order": "asc"})
+    assert res.status_code == 200
+    assert res.headers["content-type"].startswith("application/x-ndjson")
+
+    lines = [json.loads(line) for line in res.text.splitlines()]
+    assert lines[0]["type"] == "stats"
+    assert (lines[0]["diary_total"], lines[0]["guide_total"], lines[0]["place_total"]) == (2, 1, 2)
+    items = [line["data"] for line in lines[1:-1]]
+    assert all(line["type"] == "item" for line in lines[1:-1])
+    assert [item["title"] for item in items] == [
+      self.diary_data_1["title"], self.diary_data_2["title"], self.wishlist_data["title"]
+    ]
+    assert items[0]["coordinates"] == self.diary_data_1["coordinates"]
+    assert lines[-1] == {"type": "totals", "total": 3}
+
+    # 流式结果与普通 get_all 一致
+    res_all = auth_client.get("/api/entries", params={"get_all": "true", "sort_order": "asc"})
+    assert res_all.json()["items"] == items
+
+  def test_get_globe_points(self, auth_client: TestClient):
+    """测试地球光点接口：二进制与 JSON 两种列式格式"""
+    first = auth_client.post("/api/entries", json=self.diary_data_1).json()
+    wish = auth_client.post("/api/entries", json=self.wishlist_data).json()
+
+    # 1. 二进制格式
+    res = auth_client.get("/api/entries/points")
+    assert res.status_code == 200
+    assert res.headers["content-type"] == "application/octet-stream"
+    body = res.content
+    assert body[:4] == b"TGP1"
+    count, _ = struct.unpack_from("<II", body, 4)
+    assert count == 2
+    offset = 12
+    ids = struct.unpack_from(f"<{count}i", body, offset)
+    lats = struct.unpack_from(f"<{count}f", body, offset + 4 * count)
+    lngs = struct.unpack_from(f"<{count}f", body, offset + 8 * count)
+    dates = struct.unpack_from(f"<{count}i", body, offset + 12 * count)
+    types = body[offset + 16 * count:]
+    assert ids == (first["id"], wish["id"])
+    assert lats[0] == pytest.approx(35.6895, abs=1e-4)
+    assert lngs[1] == pytest.approx(141.3545, abs=1e-4)
+    assert dates[0] == (date(2024, 1, 1) - date(1970, 1, 1)).days
+    assert dates[1] == -2 ** 31
+    assert list(types) == [0, 1]
+
+    # 2. JSON 格式 + 类型筛选
+    data = auth_client.get("/api/entries/points", params={"format": "json", "entry_type": "wishlist"}).json()
+    assert data["count"] == 1
+    assert data["ids"] == [wish["id"]]
+    assert data["types"] == [data["type_codes"]["wishlist"]]
+
+  def test_conditional_get_etag(self, auth_client: TestClient):
+    """测试 ETag 条件请求：数据未变化返回 304，写操作后 ETag 改变"""
+    created = auth_client.post("/api/entries", json=self.diary_data_1).json()
+    urls = ["/api/entries?get_all=true", f"/api/entries/{created['id']}", "/api/entries/stats/summary"]
+
+    etags = {}
+    for url in urls:
+      res = auth_client.get(url)
+      assert res.status_code == 200
+      etags[url] = res.headers["etag"]
+      res = auth_client.get(url, headers={"If-None-Match": etags[url]})
+      assert res.status_code == 304
+      assert res.headers["etag"] == etags[url]
+
+    # 不同的查询参数对应不同的 ETag
+    assert auth_client.get("/api/entries?get_all=true&sort_order=asc").headers["etag"] != etags[urls[0]]
+
+    # 更新日记后，所有资源的 ETag 都失效
+    auth_client.put(f"/api/entries/{created['id']}", json={"title": "新标题"})
+    for url in urls:
+      res = auth_client.get(url, headers={"If-None-Match": etags[url]})
+      assert res.status_code == 200
+      assert res.headers["etag"] != etags[url]
+    assert auth_client.get(urls[1]).json()["title"] == "新标题"
+
+    # 统计缓存是每个 worker 各自的内存，可能留有旧值；有计数器行时不读取缓存，响应与 ETag 的版本一致
+    stale = {"diary_total": 0, "guide_total": 0, "place_total": 0, "total_entries": 0}
+    stats_cache.set(f"user_stats_{created['user_id']}", stale)
+    assert auth_client.get(urls[2]).json()["diary_total"] == 1
+
+  def test_location_dedup_by_coordinates(self, auth_client: TestClient, session: Session):
+    """测试按坐标容差（约11米）复用已有位置，并为旧数据回填 lat / lng 列"""
+    first = auth_client.post("/api/entries", json=self.diary_data_1).json()
+    location = session.get(Location, first["location_id"])
+    assert (location.lat, location.lng) == (35.6895, 139.6917)
+
+    # 1. 容差内的邻近坐标（缓存未命中）复用同一个位置
+    nearby = {**self.diary_data_2, "coordinates": {"lat": 35.68955, "lng": 139.69165}}
+    assert auth_client.post("/api/entries", json=nearby).json()["location_id"] == first["location_id"]
+
+    # 2. 超出容差的坐标创建新位置
+    outside = {**self.diary_data_2, "location_name": "涩谷", "coordinates": {"lat": 35.6897, "lng": 139.6917}}
+    assert auth_client.post("/api/entries", json=outside).json()["location_id"] != first["location_id"]
+
+    # 3. 旧数据没有 lat / lng 时，启动迁移会从 coordinates 回填
+    from app.services.location_service import ensure_location_columns
+    session.exec(update(Location).values(lat=None, lng=None))
+    session.commit()
+    ensure_location_columns(session.get_bind())
+    session.expire_all()
+    location = session.get(Location, first["location_id"])
+    assert (location.lat, location.lng) == (35.6895, 139.6917)
+
+  def test_location_resolver(self, auth_client: TestClient, session: Session, mocker):
+    """测试内存位置索引：命中不查库、未命中查库后再新建，索引只反映已提交的新增、修改和删除"""
+    from app.services import location_resolver as resolver_module
+    from app.services.location_resolver import location_resolver
+
+    assert location_resolver.loaded
+    nearby_query = mocker.spy(resolver_module, "find_nearby_location")
+
+    first = auth_client.post("/api/entries", json=self.diary_data_1).json()
+    assert len(location_resolver) == 1
+    assert nearby_query.call_count == 1
+
+    nearby = {**self.diary_data_2, "coordinates": {"lat": 35.68955, "lng": 139.69165}}
+    assert auth_client.post("/api/entries", json=nearby).json()["location_id"] == first["location_id"]
+    info = location_resolver.info()
+    assert info["hits"] == 1
+    assert info["memory_bytes"] > 0
+    assert nearby_query.call_count == 1
+
+    # 其他 worker 在载入之后新建的位置不在本地索引中：未命中时查库复用，不重复创建
+    other = Location(name="其他进程", coordinates={"lat": 40.0, "lng": 40.0})
+    session.add(other)
+    session.commit()
+    location_resolver.remove(other.id)
+    reused = auth_client.post("/api/entries", json={**self.diary_data_2, "coordinates": {"lat": 40.0, "lng": 40.0}})
+    assert reused.json()["location_id"] == other.id
+    assert location_resolver.find(40.0, 40.0) == other.id
+    session.delete(other)
+    session.delete(session.get(Entry, reused.json()["id"]))
+    session.commit()
+    removed_before = location_resolver.info()["removed"]
+
+    # 回滚的新增（包括 SAVEPOINT 内的）不会进入索引；提交后才加入
+    session.add(Location(name="回滚", coordinates={"lat": 10.0, "lng": 10.0}))
+    session.flush()
+    session.rollback()
+    with session.begin_nested() as savepoint:
+      session.add(Location(name="SAVEPOINT 回滚", coordinates={"lat": 20.0, "lng": 20.0}))
+      session.flush()
+      savepoint.rollback()
+    kept = Location(name="提交", coordinates={"lat": 30.0, "lng": 30.0})
+    session.add(kept)
+    assert location_resolver.find(30.0, 30.0) is None
+    session.commit()
+    assert location_resolver.find(10.0, 10.0) is None
+    assert location_resolver.find(20.0, 20.0) is None
+    assert location_resolver.find(30.0, 30.0) == kept.id
+
+    # 删除提交后从索引中移除
+    session.delete(kept)
+    session.commit()
+    assert location_resolver.find(30.0, 30.0) is None
+    assert location_resolver.info()["removed"] == removed_before + 1
+
+    # 未载入时，未命中同样回落到数据库查询并补充进索引
+    location_resolver.clear()
+    assert auth_client.post("/api/entries", json=self.diary_data_1).json()["location_id"] == first["location_id"]
+    assert location_resolver.find(35.6895, 139.6917) == first["location_id"]
+
+    # 重新载入与增量维护的结果一致
+    location_resolver.load(session)
+    assert len(location_resolver) == 1
+    assert location_resolver.find(35.6895, 139.6917) == first["location_id"]
+
+  def test_bulk_create_entries(self, auth_client: TestClient, session: Session):
+    """测试批量导入：逐条报错、位置去重、照片批量写入、统计更新"""
+    existing = auth_client.post("/api/entries", json=self.diary_data_1).json()
+    auth_client.get("/api/entries/stats/summary")  # 预热统计缓存
+
+    payloads = [
+      {**self.diary_data_1, "title": "东京再访", "coordinates": {"lat": 35.68952, "lng": 139.69172}},
+      {"title": "缺少必填字段"},
+      self.diary_data_2,
+      {**self.diary_data_2, "title": "京都附近", "coordinates": {"lat": 35.01162, "lng": 135.76808}},
+      {**self.wishlist_data, "photos": [{"public_id": "bad", "url": "http://example.com/bad.jpg"}]},
+      self.wishlist_data,
+    ]
+    res = auth_client.post("/api/entries/bulk", json=payloads)
+    assert res.status_code == 200
+    data = res.json()
+    assert data["created"] == 4
+    assert data["failed"] == 2
+    assert [error["index"] for error in data["errors"]] == [1, 4]
+    assert "width" in data["errors"][1]["error"]
+
+    entries = [session.get(Entry, entry_id) for entry_id in data["ids"]]
+    assert [entry.title for entry in entries] == ["东京再访", "京都红叶狩", "京都附近", "想去北海道滑雪"]
+    # 已有位置复用，批次内相近的新坐标共用一个新位置
+    assert entries[0].location_id == existing["location_id"]
+    assert entries[1].location_id == entries[2].location_id != existing["location_id"]
+    assert [photo.public_id for photo in entries[0].photos] == ["tokyo_1"]
+
+    # 统计缓存已失效，计数器包含导入的数据
+    stats = auth_client.get("/api/entries/stats/summary").json()
+    assert stats == {"diary_total": 4, "guide_total": 1, "place_total": 2, "total_entries": 5}
+
+    # 导入的日记可以被关键词搜索到（全文索引同步）
+    search = auth_client.get("/api/entries", params={"keyword": "京都附近"}).json()
+    assert [item["id"] for item in search["items"]] == [data["ids"][2]]
+
+  def test_bulk_create_reports_database_errors(self, auth_client: TestClient, session: Session):
+    """测试批量导入：某条日记写库失败时只回滚这一条，错误记入 errors，其余条目照常导入"""
+    session.exec(text(
+      "CREATE TRIGGER reject_entry BEFORE INSERT ON entry WHEN NEW.title = 'db-reject' "
+      "BEGIN SELECT RAISE(ABORT, 'entry rejected'); END"
+    ))
+    session.commit()
+
+    payloads = [self.diary_data_1, {**self.diary_data_2, "title": "db-reject"}, {"title": "缺少必填字段"}, self.wishlist_data]
+    data = auth_client.post("/api/entries/bulk", json=payloads).json()
+    assert data["created"] == 2
+    assert [error["index"] for error in data["errors"]] == [1, 2]
+    assert "entry rejected" in data["errors"][0]["error"]
+
+    titles = [entry.title for entry in session.exec(select(Entry).order_by(Entry.id))]
+    assert titles == [self.diary_data_1["title"], self.wishlist_data["title"]]
+    stats = auth_client.get("/api/entries/stats/summary").json()
+    assert stats["total_entries"] == 2
+
+  def test_export_diaries(self, auth_client: TestClient):
+    """测试流式导出：GeoJSON（gzip）、JSONL、CSV"""
+    first = auth_client.post("/api/entries", json=self.diary_data_1).json()
+    wish = auth_client.post("/api/entries", json=self.wishlist_data).json()
+
+    # 1. GeoJSON，客户端支持 gzip 时边生成边压缩（TestClient 会自动解压）
+    res = auth_client.get("/api/entries/export")
+    assert res.status_code == 200
+    assert res.headers["content-encoding"] == "gzip"
+    assert res.headers["content-type"] == "application/geo+json"
+    collection = res.json()
+    assert collection["type"] == "FeatureCollection"
+    features = collection["features"]
+    assert [feature["id"] for feature in features] == [first["id"], wish["id"]]
+    assert features[0]["geometry"] == {"type": "Point", "coordinates": [139.6917, 35.6895]}
+    assert features[0]["properties"]["photos"][0]["public_id"] == "tokyo_1"
+    assert features[0]["properties"]["date_start"] == "2024-01-01"
+
+    # 2. JSONL，不压缩
+    res = auth_client.get("/api/entries/export", params={"format": "jsonl", "compress": False})
+    assert "content-encoding" not in res.headers
+    lines = [json.loads(line) for line in res.text.splitlines()]
+    assert [line["title"] for line in lines] == ["东京初体验", "想去北海道滑雪"]
+    assert lines[1]["photos"] == []
+
+    # 3. CSV
+    res = auth_client.get("/api/entries/export", params={"format": "csv"})
+    assert res.headers["content-disposition"] == 'attachment; filename="travel-globe-export.csv"'
+    rows = list(csv.DictReader(io.StringIO(res.content.decode("utf-8-sig"))))
+    assert len(rows) == 2
+    assert (rows[0]["title"], rows[0]["lat"], rows[0]["lng"]) == ("东京初体验", "35.6895", "139.6917")
+    assert json.loads(rows[0]["photos"])[0]["url"] == "http://example.com/tokyo1.jpg"
+
   def test_update_diary(self, auth_client: TestClient, session: Session):
     """测试更新日记，包括内容和照片"""
     # 先创建
@@ -153,6 +591,41 @@ class TestDiaryCRUD:
     assert len(entry_in_db.photos) == 1
     assert entry_in_db.photos[0].public_id == "new_photo"
 
+  def test_update_diary_photo_diff(self, auth_client: TestClient, session: Session):
+    """测试照片按 public_id 差异同步：未变的照片保留原 id，只写入变化的部分"""
+    photo = {"url": "http://example.com/p.jpg", "width": 800, "height": 600, "format": "jpg"}
+    photos = [{**photo, "public_id": f"p{i}"} for i in range(3)]
+    created = auth_client.post("/api/entries", json={**self.diary_data_1, "photos": photos}).json()
+    entry_id = created["id"]
+    original_ids = {p["public_id"]: p["id"] for p in created["photos"]}
+
+    # 1. 只改标题、照片原样重发：照片不发生任何写入
+    res = auth_client.put(f"/api/entries/{entry_id}", json={"title": "只改标题", "photos": photos})
+    assert res.status_code == 200
+    data = res.json()
+    assert data["photo_sync"] == {"added": 0, "updated": 0, "removed": 0, "unchanged": 3}
+    assert [p["id"] for p in data["photos"]] == [original_ids[f"p{i}"] for i in range(3)]
+
+    # 2. 删除 p0、修改 p2 的宽度并移到最前、新增 p3（p1 位置不变）
+    new_photos = [{**photos[2], "width": 1024}, photos[1], {**photo, "public_id": "p3"}]
+    data = auth_client.put(f"/api/entries/{entry_id}", json={"photos": new_photos}).json()
+    assert data["photo_sync"] == {"added": 1, "updated": 1, "removed": 1, "unchanged": 1}
+    assert [p["public_id"] for p in data["photos"]] == ["p2", "p1", "p3"]
+    assert data["photos"][0]["id"] == original_ids["p2"]
+    assert data["photos"][0]["width"] == 1024
+    assert data["photos"][1]["id"] == original_ids["p1"]
+
+    # 3. 不传 photos 时不同步照片
+    data = auth_client.put(f"/api/entries/{entry_id}", json={"title": "再改标题"}).json()
+    assert data["photo_sync"] is None
+    assert len(data["photos"]) == 3
+
+    # 4. 新照片缺少必填字段时返回 400，且不做任何修改
+    res = auth_client.put(f"/api/entries/{entry_id}", json={"photos": [{"public_id": "bad", "url": "http://x"}]})
+    assert res.status_code == 400
+    session.expire_all()
+    assert len(session.get(Entry, entry_id).photos) == 3
+
   def test_delete_diary(self, auth_client: TestClient, session: Session):
     """测试删除日记"""
     # 先创建
@@ -1,8 +1,62 @@
 # backend/tests/test_health.py
 from fastapi.testclient import TestClient
 
+from app.services.metrics import Histogram, http_requests_total
+
 def test_health_check(client: TestClient):
   # 你的根路径是 "/"
   res = client.get("/")
   assert res.status_code == 200
   assert "Hello, Travel Tracker Backend!" in res.json()["message"]
+
+
+def test_metrics_endpoint(client: TestClient):
+  """
+  /metrics 以 Prometheus 文本格式输出按路由模板统计的请求数和延迟，以及连接池与缓存指标。
+  """
+  before = http_requests_total.value("GET", "/api/health", "200")
+  client.get("/api/health")
+  client.get("/api/health")
+  client.get("/no-such-page")
+
+  res = client.get("/metrics")
+  assert res.status_code == 200
+  assert res.headers["content-type"].startswith("text/plain; version=0.0.4")
+  assert http_requests_total.value("GET", "/api/health", "200") == before + 2
+  lines = res.text.splitlines()
+  assert f'http_requests_total{{method="GET",route="/api/health",status="200"}} {int(before) + 2}' in lines
+  assert any(line.startswith('http_requests_total{method="GET",route="<unmatched>",status="404"}') for line in lines)
+  assert any(line.startswith('http_request_duration_seconds_bucket{method="GET",route="/api/health",le="+Inf"}') for line in lines)
+  assert any(line.startswith('http_response_size_bytes_count{method="GET",route="/api/health"}') for line in lines)
+  for name in ("db_pool_checkout_wait_seconds", "db_pool_checked_out", "http_requests_in_flight"):
+    assert f"# TYPE {name} " in res.text
+  assert 'cache_hit_ratio{cache="stats"}' in res.text
+  assert 'cache_hits_total{cache="location_index"}' in res.text
+
+
+def test_internal_status_endpoints_require_login(auth_client: TestClient):
+  """
+  密码哈希工作池和心情分析队列的内部状态需要登录后才能查看。
+  """
+  urls = ["/api/health/password-hasher", "/api/health/mood-queue"]
+  for url in urls:
+    assert auth_client.get(url).status_code == 200
+  assert "workers" in auth_client.get(urls[1]).json()
+
+  auth_client.cookies.clear()
+  for url in urls:
+    assert auth_client.get(url).status_code == 401
+
+
+def test_histogram_buckets_are_cumulative():
+  histogram = Histogram("demo_seconds", "Demo.", ("route",), buckets=(0.1, 1.0))
+  for value in (0.05, 0.5, 0.7, 3.0):
+    histogram.observe(value, "/a")
+
+  assert histogram.render().splitlines()[2:] == [
+    'demo_seconds_bucket{route="/a",le="0.1"} 1',
+    'demo_seconds_bucket{route="/a",le="1"} 3',
+    'demo_seconds_bucket{route="/a",le="+Inf"} 4',
+    'demo_seconds_sum{route="/a"} 4.25',
+    'demo_seconds_count{route="/a"} 4',
+  ]
@@ -0,0 +1,120 @@
+# backend/tests/test_mood.py
+
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+from fastapi.testclient import TestClient
+from sqlmodel import Session
+from unittest.mock import AsyncMock
+
+from app.models import Mood, User
+from app.services.mood_queue import MoodAnalysisQueue, mood_analysis_queue
+
+
+def wait_for_analysis(client: TestClient, timeout: float = 5.0) -> list:
+  """轮询心情列表，直到没有 pending / processing 的记录"""
+  deadline = time.monotonic() + timeout
+  while True:
+    moods = client.get("/api/moods").json()
+    if all(mood["analysis_status"] not in ("pending", "processing") for mood in moods) or time.monotonic() > deadline:
+      return moods
+    time.sleep(0.05)
+
+
+def test_create_mood_is_analyzed_in_background(auth_client: TestClient, mocker):
+  """
+  创建心情立即返回 pending 状态，后台队列分析完成后通过列表接口可以看到结果。
+  """
+  mock_analyze = mocker.patch(
+    "app.services.mood_queue.analyze_mood_text",
+    new_callable=AsyncMock,
+    return_value={"mood_vector": 0.9, "mood_reason": "阳光很好"}
+  )
+
+  res = auth_client.post("/api/moods", json={"content": "今天去海边散步"})
+  assert res.status_code == 201
+  created = res.json()
+  assert created["analysis_status"] == "pending"
+  assert created["mood_vector"] == 0.5
+
+  moods = wait_for_analysis(auth_client)
+  assert len(moods) == 1
+  assert moods[0]["id"] == created["id"]
+  assert moods[0]["analysis_status"] == "done"
+  assert moods[0]["mood_vector"] == 0.9
+  assert moods[0]["mood_reason"] == "阳光很好"
+  mock_analyze.assert_awaited_once_with("今天去海边散步", fallback=False)
+
+
+def test_mood_analysis_retries_then_fails(auth_client: TestClient, mocker):
+  """
+  分析失败时按退避重试；超过最大次数后标记为 failed 并写入默认结果。
+  """
+  mocker.patch.object(mood_analysis_queue, "retry_base_seconds", 0.01)
+  mocker.patch.object(mood_analysis_queue, "max_attempts", 2)
+  flaky = mocker.patch(
+    "app.services.mood_queue.analyze_mood_text",
+    new_callable=AsyncMock,
+    side_effect=[RuntimeError("quota"), {"mood_vector": 0.2, "mood_reason": "下雨了"}]
+  )
+  auth_client.post("/api/moods", json={"content": "行程被取消"})
+  moods = wait_for_analysis(auth_client)
+  assert moods[0]["analysis_status"] == "done"
+  assert moods[0]["mood_vector"] == 0.2
+  assert flaky.await_count == 2
+
+  mocker.patch(
+    "app.services.mood_queue.analyze_mood_text",
+    new_callable=AsyncMock,
+    side_effect=RuntimeError("unavailable")
+  )
+  auth_client.post("/api/moods", json={"content": "航班延误"})
+  moods = wait_for_analysis(auth_client)
+  failed = [mood for mood in moods if mood["content"] == "航班延误"][0]
+  assert failed["analysis_status"] == "failed"
+  assert failed["mood_vector"] == 0.5
+
+
+def test_mood_claims_are_atomic_and_stale_claims_recovered(
+  auth_client: TestClient, session: Session, test_user: User
+):
+  """
+  同一条心情只能被认领一次；启动时只重新入队 pending 和认领已超时的 processing 心情。
+  """
+  now = datetime.now()
+  moods = {
+    "pending": Mood(content="排队中", user_id=test_user.id),
+    "stale": Mood(
+      content="进程退出", user_id=test_user.id,
+      analysis_status="processing", analysis_claimed_at=now - timedelta(hours=1)
+    ),
+    "fresh": Mood(
+      content="正在分析", user_id=test_user.id,
+      analysis_status="processing", analysis_claimed_at=now
+    ),
+    "done": Mood(content="已完成", user_id=test_user.id, analysis_status="done"),
+  }
+  session.add_all(moods.values())
+  session.commit()
+  ids = {name: mood.id for name, mood in moods.items()}
+
+  queue = MoodAnalysisQueue(workers=0, max_attempts=3, retry_base_seconds=0.01, claim_timeout_seconds=60)
+  queue.session_factory = mood_analysis_queue.session_factory
+
+  async def run():
+    await queue.start()
+    queued = []
+    while not queue._queue.empty():
+      queued.append(queue._queue.get_nowait())
+    first = await queue._claim(ids["pending"])
+    second = await queue._claim(ids["pending"])
+    fresh = await queue._claim(ids["fresh"])
+    await queue.stop()
+    return queued, first, second, fresh
+
+  queued, first, second, fresh = asyncio.run(run())
+  assert queued == [ids["pending"], ids["stale"]]
+  assert first is not None and first.analysis_status == "processing"
+  assert second is None
+  assert fresh is None